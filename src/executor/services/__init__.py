@@ -13,7 +13,8 @@ from services import SP
 if TYPE_CHECKING:
     from executor.services.credentials_service import CredentialsService
     from executor.services.environment_service import BatchEnvironmentService
-    from executor.services.policy_service import PoliciesService
+    from executor.services.policy_service import (PoliciesLoadCache,
+                                                  PoliciesService)
 
 _LOG = get_logger(__name__)
 
@@ -59,5 +60,11 @@ class BatchServiceProvider(metaclass=SingletonMeta):
         return PoliciesService(ruleset_service=SP.ruleset_service,
                                environment_service=self.environment_service)
 
+    @cached_property
+    def policies_load_cache(self) -> 'PoliciesLoadCache':
+        from executor.services.policy_service import PoliciesLoadCache
+        _LOG.debug('Creating PoliciesLoadCache')
+        return PoliciesLoadCache()
+
 
 BSP = BatchServiceProvider()  # stands for Batch service provider
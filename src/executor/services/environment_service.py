@@ -3,7 +3,7 @@ from typing import cast
 
 from executor.helpers.constants import (ENVS_TO_HIDE,
                                         HIDDEN_ENV_PLACEHOLDER)
-from helpers.constants import (BatchJobEnv, BatchJobType, ENV_TRUE)
+from helpers.constants import (BatchJobEnv, BatchJobType, Cloud, ENV_TRUE)
 from services.environment_service import EnvironmentService
 
 
@@ -110,6 +110,58 @@ class BatchEnvironmentService(EnvironmentService):
         """
         return BatchJobEnv.ALLOW_MANAGEMENT_CREDS.get('').lower() in ENV_TRUE
 
+    def regions_pool_size(self) -> int:
+        """
+        Number of regions that are scanned simultaneously. Each region is
+        scanned in a separate process, so this is the number of worker
+        processes. Default is 1 which means that regions are scanned one
+        after another
+        """
+        from_env = BatchJobEnv.REGIONS_POOL_SIZE.get('')
+        if from_env.isdigit() and int(from_env) > 0:
+            return int(from_env)
+        return int(BatchJobEnv.REGIONS_POOL_SIZE.default)
+
+    def policies_concurrency(self, cloud: Cloud) -> int:
+        """
+        Number of policies of one region that are executed simultaneously
+        in threads. Configured per cloud in order to stay under provider's
+        throttling limits. Default is 1 which means that policies are
+        executed one after another
+        """
+        match cloud:
+            case Cloud.AWS:
+                env = BatchJobEnv.AWS_POLICIES_CONCURRENCY
+            case Cloud.AZURE:
+                env = BatchJobEnv.AZURE_POLICIES_CONCURRENCY
+            case Cloud.GOOGLE:
+                env = BatchJobEnv.GOOGLE_POLICIES_CONCURRENCY
+            case _:
+                env = BatchJobEnv.K8S_POLICIES_CONCURRENCY
+        from_env = env.get('')
+        if from_env.isdigit() and int(from_env) > 0:
+            return int(from_env)
+        return int(env.default)
+
+    def is_policies_load_cache_enabled(self) -> bool:
+        """
+        Whether to keep names of policies that failed validation on local
+        disk so that subsequent region processes and jobs skip them.
+        Disabled by default
+        """
+        return BatchJobEnv.POLICIES_LOAD_CACHE.get().lower() in ENV_TRUE
+
+    def resources_per_shard(self) -> int:
+        """
+        Approximate number of resources in one shard of tenant findings.
+        The number of shards grows when a tenant exceeds it. 0 means that
+        the default layout is always used
+        """
+        from_env = BatchJobEnv.RESOURCES_PER_SHARD.get('')
+        if from_env.isdigit():
+            return int(from_env)
+        return int(BatchJobEnv.RESOURCES_PER_SHARD.default)
+
     def __repr__(self):
         return ', '.join([
             f'{k}={v if k not in ENVS_TO_HIDE else HIDDEN_ENV_PLACEHOLDER}'
@@ -1,4 +1,5 @@
 import hashlib
+import os
 import tempfile
 from concurrent.futures import ThreadPoolExecutor
 from itertools import chain
@@ -143,3 +144,53 @@ class PoliciesService:
             policies = self.iter_keeping(policies, keep)
         policies = self.without_duplicates(policies)
         return list(policies)
+
+
+class PoliciesLoadCache:
+    """
+    Keeps names of policies that failed validation on local disk, so that
+    subsequent region processes and jobs on the same container drop them
+    before loading instead of building, initializing and validating them
+    again. Only PolicyValidationError is kept because it depends only on
+    policies content and Cloud Custodian version. Other errors can be
+    transient or depend on credentials. Valid policies are still loaded
+    and validated each time because validate() of some filters and
+    actions prepares their runtime state
+    """
+    __slots__ = ('_root',)
+
+    def __init__(self, root: Path | None = None):
+        self._root = root or Path(tempfile.gettempdir(), 'policies-load')
+
+    @staticmethod
+    def build_key(policies: list[PolicyDict], cloud: Cloud,
+                  version: str) -> str:
+        h = hashlib.sha256(msgspec.json.encode(policies))
+        h.update(cloud.value.encode())
+        h.update(version.encode())
+        return h.hexdigest()
+
+    def get(self, key: str) -> set[str] | None:
+        """
+        Returns names of invalid policies or None if nothing is cached
+        """
+        path = self._root / f'{key}.json'
+        try:
+            with open(path, 'rb') as file:
+                return set(msgspec.json.decode(file.read(), type=list[str]))
+        except FileNotFoundError:
+            return
+        except (msgspec.DecodeError, OSError):
+            _LOG.warning(f'Cannot read policies load cache {path}')
+            return
+
+    def set(self, key: str, invalid: Iterable[str]) -> None:
+        """
+        Region processes can write the same key simultaneously, so data is
+        written to a temp file and then atomically moved
+        """
+        self._root.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self._root)
+        with os.fdopen(fd, 'wb') as file:
+            file.write(msgspec.json.encode(sorted(set(invalid))))
+        os.replace(tmp, self._root / f'{key}.json')
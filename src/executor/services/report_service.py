@@ -232,6 +232,11 @@ class JobResult:
         dirs = filter(Path.is_dir, self._work_dir.iterdir())
         for region in dirs:
             for rule in filter(Path.is_dir, region.iterdir()):
+                if not (rule / 'metadata.json').exists():
+                    # process was terminated before the policy has finished
+                    _LOG.warning(f'Rule {rule.name}:{region.name} has no '
+                                 f'metadata. Skipping')
+                    continue
                 metadata = self._load_metadata(rule)
                 if with_resources:
                     resources = self._load_resources(rule)
@@ -335,7 +340,7 @@ class JobResult:
         for region, rule, metadata, resources in self.build_default_iterator():
             if resources is None: continue
             self._extend_resources(resources, metadata.resource_type)
-            yield ShardPart(
+            yield ShardPart.with_digests(
                 policy=rule,
                 location=region,
                 resources=resources
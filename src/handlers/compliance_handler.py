@@ -115,7 +115,7 @@ class ComplianceReportHandler(AbstractHandler):
                     response.content = url
             case ReportFormat.XLSX:
                 buffer = io.BytesIO()
-                with Workbook(buffer) as wb:
+                with Workbook(buffer, {'constant_memory': True}) as wb:
                     ComplianceReportXlsxWriter(coverages).write(
                         wb=wb,
                         wsh=wb.add_worksheet('Compliance')
@@ -154,7 +154,7 @@ class ComplianceReportHandler(AbstractHandler):
                     response.content = url
             case ReportFormat.XLSX:
                 buffer = io.BytesIO()
-                with Workbook(buffer) as wb:
+                with Workbook(buffer, {'constant_memory': True}) as wb:
                     ComplianceReportXlsxWriter(coverages).write(
                         wb=wb,
                         wsh=wb.add_worksheet('Compliance')
@@ -95,7 +95,7 @@ class ErrorsReportHandler(AbstractHandler):
                     content = list(data)
             case ReportFormat.XLSX:
                 buffer = io.BytesIO()
-                with Workbook(buffer) as wb:
+                with Workbook(buffer, {'constant_memory': True}) as wb:
                     ResourceReportXlsxWriter(data).write(
                         wb=wb,
                         wsh=wb.add_worksheet('Errors')
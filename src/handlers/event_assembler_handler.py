@@ -1,9 +1,8 @@
-import heapq
 from http import HTTPStatus
 from itertools import chain
 import operator
 import time
-from typing import Generator
+from typing import Generator, Iterable, Iterator
 
 from modular_sdk.models.tenant import Tenant
 from modular_sdk.services.tenant_service import TenantService
@@ -29,10 +28,9 @@ from services.event_processor_service import (
     AccountRegionRuleMap,
     BaseEventProcessor,
     CloudTenantRegionRulesMap,
-    EventBridgeEventProcessor,
     EventProcessorService,
-    MaestroEventProcessor,
     RegionRuleMap,
+    SeenRecords,
 )
 from services.event_service import Event, EventService
 from services.license_service import License, LicenseService
@@ -45,6 +43,28 @@ DEFAULT_UNRESOLVED_RESPONSE = 'Request has run into an unresolvable issue.'
 _LOG = get_logger(__name__)
 
 
+class EventsWindow(Iterable[Event]):
+    """
+    Iterates over the given events once keeping only timestamps of the
+    first and the last of them
+    """
+    __slots__ = ('_it', 'start', 'end', 'count')
+
+    def __init__(self, it: Iterable[Event]):
+        self._it = it
+        self.start: float | None = None
+        self.end: float | None = None
+        self.count = 0
+
+    def __iter__(self) -> Iterator[Event]:
+        for event in self._it:
+            if self.start is None:
+                self.start = event.timestamp
+            self.end = event.timestamp
+            self.count += 1
+            yield event
+
+
 class EventAssemblerHandler:
     _code: int
     _content: str | None
@@ -159,25 +179,25 @@ class EventAssemblerHandler:
         if config and EVENT_CURSOR_TIMESTAMP_ATTR in config:
             event_cursor = float(config[EVENT_CURSOR_TIMESTAMP_ATTR])
             _LOG.info(f'Cursor was obtained: {event_cursor}')
-        # Establishes Events: List[$oldest, ... $nearest]
-        events = self._obtain_events(since=event_cursor)
+        # Events: $oldest, ... $nearest. They are not kept in memory, each
+        # one is processed and dropped
+        window = EventsWindow(self._obtain_events(since=event_cursor))
+        vendor_maps = self.vendor_rule_map(window)
 
-        if not events:
+        if not window.count:
             _LOG.info('No events have been collected.')
 
             self._code = HTTPStatus.NOT_FOUND
             return self.response
+        _LOG.info(f'{window.count} events have been processed')
 
-        start_event = events[0]
-        end_event = events[-1]
         config = self._settings_service.create_event_assembler_configuration(
-            cursor=end_event.timestamp
+            cursor=window.end
         )
         self._settings_service.save(setting=config)
         _LOG.info('Cursor value of the event assembler has bee updated '
-                  f'to - {end_event.timestamp}')
+                  f'to - {window.end}')
 
-        vendor_maps = self.vendor_rule_map(events)
         tenant_batch_result: list[tuple[Tenant, BatchResults]] = []
         for vendor, mapping in vendor_maps.items():
             if not mapping:
@@ -249,8 +269,8 @@ class EventAssemblerHandler:
         common_envs[BatchJobEnv.BATCH_RESULTS_IDS.value] = ','.join(
             item.id for item in allowed_batch_results)
         for br in allowed_batch_results:
-            br.registration_start = str(start_event.timestamp)
-            br.registration_end = str(end_event.timestamp)
+            br.registration_start = str(window.start)
+            br.registration_end = str(window.end)
         self._batch_results_service.batch_save(allowed_batch_results)
         job_id = self._submit_batch_job(common_envs)
         self._code = 202
@@ -320,51 +340,47 @@ class EventAssemblerHandler:
                 )
                 yield tenant, batch_result
 
-    def _obtain_events(self, since: float | None = None) -> list[Event]:
+    def _obtain_events(self, since: float | None = None
+                       ) -> Iterator[Event]:
         """
-        Makes N queries. N is a number of partitions (from envs). After that
-        merges these N already sorted lists
+        Queries all the partitions (their number is from envs) concurrently
+        and lazily merges them by timestamp
         :param since:
         :return:
         """
-        iters = []
-        for partition in range(
-                self._environment_service.number_of_partitions_for_events()):
-            _LOG.debug(
-                f'Making query for {partition} partition since: {since}')
-            iters.append(
-                self._event_service.get_events(partition, since=since)
-            )
-        # actually, there is no need to merge all the lists, we just need to
-        # first and last timestamp. But this "merge" must be fast
-        return list(heapq.merge(*iters, key=lambda e: e.timestamp))
+        return self._event_service.get_all_events(since=since)
 
-    def vendor_rule_map(self, events: list[Event]) -> dict[str, dict]:
+    def vendor_rule_map(self, events: Iterable[Event]) -> dict[str, dict]:
         """
         For each vendor derives rules mapping in its format. The formats of
-        each vendor differ
+        each vendor differ. Events are consumed one by one, so only the
+        maps and digests of unique records within the dedup window are kept
+        in memory
         """
-        vendor_processor = {
-            MAESTRO_VENDOR: self._event_processor_service.get_processor(
-                MAESTRO_VENDOR),
-            AWS_VENDOR: self._event_processor_service.get_processor(AWS_VENDOR)
+        vendor_processor: dict[str, BaseEventProcessor] = {}
+        result = {MAESTRO_VENDOR: {}, AWS_VENDOR: {}}
+        window = self._environment_service.event_assembler_dedup_window()
+        size = self._environment_service.event_assembler_dedup_max_size()
+        emitted = {
+            MAESTRO_VENDOR: SeenRecords(window, size),
+            AWS_VENDOR: SeenRecords(window, size),
         }
         for event in events:
-            if event.vendor not in vendor_processor:
+            if event.vendor not in result:
                 _LOG.warning(f'Not known vendor: {event.vendor}. Skipping')
                 continue
-            processor: BaseEventProcessor = vendor_processor[event.vendor]
-            processor.events.extend(event.events)
-        _LOG.info('All the vendor-processors are initialized with events')
-        result = {}
-
-        maestro_proc: MaestroEventProcessor = vendor_processor[MAESTRO_VENDOR]
-        it = maestro_proc.without_duplicates(maestro_proc.prepared_events())
-        result[MAESTRO_VENDOR] = maestro_proc.cloud_tenant_region_rules_map(it)
-
-        aws_proc: EventBridgeEventProcessor = vendor_processor[AWS_VENDOR]
-        it = aws_proc.without_duplicates(aws_proc.prepared_events())
-        result[AWS_VENDOR] = aws_proc.account_region_rule_map(it)
+            emitted[event.vendor].now = event.timestamp
+            processor = vendor_processor.get(event.vendor)
+            if processor is None:  # created only if there are its events
+                processor = self._event_processor_service.get_processor(
+                    event.vendor
+                )
+                vendor_processor[event.vendor] = processor
+            it = processor.without_duplicates(
+                processor.prepared_events(event.events),
+                emitted[event.vendor]
+            )
+            processor.update_rules_map(result[event.vendor], it)
         return result
 
     def _obtain_tenant(self, name: str) -> Tenant | None:
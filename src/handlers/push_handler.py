@@ -26,6 +26,7 @@ from services.defect_dojo_service import (
     DefectDojoParentMeta,
     DefectDojoService,
 )
+from services.environment_service import EnvironmentService
 from services.integration_service import IntegrationService
 from services.license_service import LicenseService
 from services.metadata import Metadata
@@ -58,6 +59,7 @@ class SiemPushHandler(AbstractHandler):
         defect_dojo_service: DefectDojoService,
         maestro_credentials_service: MaestroCredentialsService,
         license_service: LicenseService,
+        environment_service: EnvironmentService,
     ):
         self._ambiguous_job_service = ambiguous_job_service
         self._rs = report_service
@@ -67,6 +69,7 @@ class SiemPushHandler(AbstractHandler):
         self._dds = defect_dojo_service
         self._mcs = maestro_credentials_service
         self._ls = license_service
+        self._env = environment_service
 
     @classmethod
     def build(cls) -> 'AbstractHandler':
@@ -79,6 +82,7 @@ class SiemPushHandler(AbstractHandler):
             defect_dojo_service=SP.defect_dojo_service,
             maestro_credentials_service=SP.modular_client.maestro_credentials_service(),
             license_service=SP.license_service,
+            environment_service=SP.environment_service,
         )
 
     @property
@@ -123,16 +127,28 @@ class SiemPushHandler(AbstractHandler):
             metadata,
             attachment=configuration.attachment,
         )
-        resp = client.import_scan(
+        responses = client.import_scan_chunks(
             scan_type=configuration.scan_type,
             scan_date=utc_datetime(job.stopped_at),
             product_type_name=configuration.product_type,
             product_name=configuration.product,
             engagement_name=configuration.engagement,
             test_title=configuration.test,
-            data=convertor.convert(collection),
+            chunks=convertor.split(
+                collection, self._env.dojo_import_tests()
+            ),
+            concurrency=self._env.dojo_import_concurrency(),
             tags=self._integration_service.job_tags_dojo(job),
         )
+        # the first failed chunk defines the result
+        resp = next(
+            (
+                r
+                for r in responses
+                if getattr(r, 'status_code', None) != HTTPStatus.CREATED
+            ),
+            responses[0] if responses else None,
+        )
         match getattr(resp, 'status_code', None):  # handles None
             case HTTPStatus.CREATED:
                 return HTTPStatus.OK, 'Pushed'
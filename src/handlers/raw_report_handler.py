@@ -4,7 +4,6 @@ from modular_sdk.models.tenant import Tenant
 from modular_sdk.services.tenant_service import TenantService
 
 from handlers import AbstractHandler, Mapping
-from helpers import flip_dict
 from helpers.constants import CustodianEndpoint, HTTPMethod
 from helpers.lambda_response import build_response
 from helpers.log_helper import get_logger
@@ -56,11 +55,10 @@ class RawReportHandler(AbstractHandler):
         }
         if event.obfuscated:
             _LOG.info('Going to obfuscate raw report')
-            dictionary_out = {}
-            obfuscation.obfuscate_collection(collection, dictionary_out)
-            flip_dict(dictionary_out)
+            obfuscator = obfuscation.Obfuscator()
+            obfuscation.obfuscate_collection(collection, obfuscator)
             resp['dictionary_url'] = self._rs.one_time_url_json(
-                dictionary_out, 'obfuscation_dictionary.json'
+                obfuscator.dictionary, 'obfuscation_dictionary.json'
             )
         # msgspec can dump parts directly
         resp['url'] = self._rs.one_time_url_json(
@@ -11,8 +11,9 @@ from xlsxwriter import Workbook
 from xlsxwriter.worksheet import Worksheet
 
 from handlers import AbstractHandler, Mapping
-from helpers import filter_dict, flip_dict, hashable
+from helpers import filter_dict, hashable
 from helpers.constants import (
+    GLOBAL_REGION,
     JOB_ID_ATTR,
     REPORT_FIELDS,
     TYPE_ATTR,
@@ -25,7 +26,7 @@ from helpers.constants import (
 )
 from helpers.lambda_response import build_response
 from helpers.log_helper import get_logger
-from helpers.reports import severity_cmp
+from helpers.reports import adjust_resource_type, severity_cmp
 from helpers.time_helper import utc_iso
 from services import SP, modular_helpers, obfuscation
 from services.ambiguous_job_service import AmbiguousJob, AmbiguousJobService
@@ -35,7 +36,7 @@ from services.platform_service import Platform, PlatformService
 from services.report_service import ReportResponse, ReportService
 from services.reports import ShardsCollectionDataSource
 from services.sharding import ShardsCollection
-from services.xlsx_writer import CellContent, Table, XlsxRowsWriter
+from services.xlsx_writer import CellContent, Row, XlsxRowsWriter
 from validators.swagger_request_models import (
     PlatformK8sResourcesReportGetModel,
     ResourceReportJobGetModel,
@@ -59,7 +60,7 @@ class MatchedResourcesIterator(Iterator[Payload]):
         exact_match: bool = True,
         search_by_all: bool = False,
         search_by: Optional[dict] = None,
-        dictionary_out: dict | None = None,
+        obfuscator: obfuscation.Obfuscator | None = None,
     ):
         self._collection = collection
         self._resource_type = resource_type
@@ -68,7 +69,7 @@ class MatchedResourcesIterator(Iterator[Payload]):
         self._exact_match = exact_match
         self._search_by_all = search_by_all
         self._search_by = search_by or {}
-        self._dictionary_out = dictionary_out
+        self._obfuscator = obfuscator
 
         self._it = None
 
@@ -97,6 +98,25 @@ class MatchedResourcesIterator(Iterator[Payload]):
         self._it = self.create_resources_generator()
         return self
 
+    def fetch(self) -> None:
+        """
+        Fetches only those parts of the collection that can match the
+        resource type and region. Collection meta must be set beforehand
+        because policies of the resource type are resolved from it
+        """
+        policies = None
+        if self._resource_type:
+            rt = adjust_resource_type(self._resource_type)
+            policies = {
+                rule for rule, data in self._collection.meta.items()
+                if data.get('resource')
+                and adjust_resource_type(data['resource']) == rt
+            }
+        locations = None
+        if self._region:
+            locations = {GLOBAL_REGION, self._region}
+        self._collection.fetch_parts(policies, locations)
+
     def does_match(self, provided: Any, real: Any) -> bool:
         if isinstance(real, (list, dict)):
             return False
@@ -132,16 +152,16 @@ class MatchedResourcesIterator(Iterator[Payload]):
         while True:
             rule, region, dto, ts = next(self._it)
             if not self._search_by:
-                if isinstance(self._dictionary_out, dict):
-                    obfuscation.obfuscate_finding(dto, self._dictionary_out)
+                if self._obfuscator:
+                    obfuscation.obfuscate_finding(dto, self._obfuscator)
                 return rule, region, dto, {}, ts
             if self._search_by_all:
                 match = self.match_by_all(dto)
             else:
                 match = self.match(dto)
             if match:
-                if isinstance(self._dictionary_out, dict):
-                    obfuscation.obfuscate_finding(dto, self._dictionary_out)
+                if self._obfuscator:
+                    obfuscation.obfuscate_finding(dto, self._obfuscator)
                 return rule, region, dto, match, ts
 
 
@@ -244,6 +264,8 @@ class ResourceReportXlsxWriter:
         'Article',
         'Remediation',
     )
+    # rows are written one by one and flushed to a temp file
+    workbook_options = {'strings_to_numbers': True, 'constant_memory': True}
 
     def __init__(
         self,
@@ -282,7 +304,37 @@ class ResourceReportXlsxWriter:
             data[2] = max(data[2], ts)
         return res
 
+    def _empty_cols(self, aggregated: list[tuple[tuple, list]]) -> set[int]:
+        """
+        Cheap pre-pass instead of buffering all the rows: optional columns
+        depend only on rules, so they are empty if all the violated rules
+        have no such data
+        """
+        if not aggregated:
+            # header only, the same as XlsxRowsWriter.empty_cols does
+            return set(range(len(self.head)))
+        rules = set(chain.from_iterable(data[0] for _, data in aggregated))
+        meta = self._it.collection.meta
+        optional = {
+            # services are joined skipping empty ones
+            1: lambda r: self._meta.rule(r).service or None,
+            6: lambda r: meta[r]['description'],
+            8: lambda r: self._meta.rule(r).article,
+            9: lambda r: self._meta.rule(r).remediation,
+        }
+        empty = {
+            i for i, get in optional.items()
+            if all(get(rule) is None for rule in rules)
+        }
+        if not self._keep_region:
+            empty.add(3)
+        return empty
+
     def write(self, wsh: Worksheet, wb: Workbook):
+        """
+        Rows are generated and written one by one, so the workbook can be
+        opened in constant_memory mode
+        """
         bold = wb.add_format({'bold': True})
         red = wb.add_format({'bg_color': '#da9694'})
         yellow = wb.add_format({'bg_color': '#ffff00'})
@@ -299,11 +351,6 @@ class ResourceReportXlsxWriter:
                 return green
             return gray
 
-        table = Table()
-        table.new_row()
-        for h in self.head:
-            table.add_cells(CellContent(h, bold))
-
         # a bit devilish code :(
         # imagine you have a list of lists or ints. The thing below sorts the
         # main lists when the key equal to the maximum value of inner lists.
@@ -314,74 +361,71 @@ class ResourceReportXlsxWriter:
         # - values of inner lists not the actual values to sort by. They
         # are not severities. Actual severities must be retrieved from a map
         key = cmp_to_key(severity_cmp)
-        aggregated = dict(
-            sorted(
-                self._aggregated().items(),
-                key=lambda p: key(
-                    self._meta.rule(
-                        max(
-                            p[1][0],
-                            key=lambda x: key(
-                                self._meta.rule(x).severity.value
-                            ),
-                        )
-                    ).severity.value
-                ),
-                reverse=True,
-            )
+        aggregated = sorted(
+            self._aggregated().items(),
+            key=lambda p: key(
+                self._meta.rule(
+                    max(
+                        p[1][0],
+                        key=lambda x: key(
+                            self._meta.rule(x).severity.value
+                        ),
+                    )
+                ).severity.value
+            ),
+            reverse=True,
         )
-        i = 0
-        for unique, data in aggregated.items():
-            _, region, resource = unique
-            rules, dto, ts = data
-            rules = sorted(
-                rules,
-                key=lambda x: key(self._meta.rule(x).severity.value),
-                reverse=True,
-            )
-            table.new_row()
-            table.add_cells(CellContent(i))
-            services = set(
-                filter(None, (self._meta.rule(rule).service for rule in rules))
-            )
-            if services:
-                table.add_cells(CellContent(', '.join(services)))
-            else:
-                table.add_cells()
-            table.add_cells(CellContent(dto))
-            if self._keep_region:
-                table.add_cells(CellContent(region))
-            else:
-                table.add_cells(CellContent())
-            table.add_cells(CellContent(utc_iso(datetime.fromtimestamp(ts))))
-            table.add_cells(*[CellContent(rule) for rule in rules])
-            table.add_cells(
-                *[
-                    CellContent(self._it.collection.meta[rule]['description'])
-                    for rule in rules
-                ]
-            )
-            table.add_cells(
-                *[
-                    CellContent(
-                        self._meta.rule(rule).severity.value,
-                        sf(self._meta.rule(rule).severity.value),
+
+        def rows() -> Iterator[Row]:
+            yield [(CellContent(h, bold),) for h in self.head]
+            for i, (unique, data) in enumerate(aggregated):
+                _, region, resource = unique
+                rules, dto, ts = data
+                rules = sorted(
+                    rules,
+                    key=lambda x: key(self._meta.rule(x).severity.value),
+                    reverse=True,
+                )
+                services = set(
+                    filter(
+                        None, (self._meta.rule(rule).service for rule in rules)
                     )
-                    for rule in rules
-                ]
-            )
-            table.add_cells(
-                *[CellContent(self._meta.rule(rule).article) for rule in rules]
-            )
-            table.add_cells(
-                *[
-                    CellContent(self._meta.rule(rule).remediation)
-                    for rule in rules
+                )
+                yield [
+                    (CellContent(i),),
+                    (CellContent(', '.join(services)),) if services else (),
+                    (CellContent(dto),),
+                    (CellContent(region if self._keep_region else None),),
+                    (CellContent(utc_iso(datetime.fromtimestamp(ts))),),
+                    tuple(CellContent(rule) for rule in rules),
+                    tuple(
+                        CellContent(
+                            self._it.collection.meta[rule]['description']
+                        )
+                        for rule in rules
+                    ),
+                    tuple(
+                        CellContent(
+                            self._meta.rule(rule).severity.value,
+                            sf(self._meta.rule(rule).severity.value),
+                        )
+                        for rule in rules
+                    ),
+                    tuple(
+                        CellContent(self._meta.rule(rule).article)
+                        for rule in rules
+                    ),
+                    tuple(
+                        CellContent(self._meta.rule(rule).remediation)
+                        for rule in rules
+                    ),
                 ]
-            )
-            i += 1
-        writer = XlsxRowsWriter()
-        writer.write(wsh, table)
+                # the merged resource is not needed after its row is written
+                data[1] = None
+
+        XlsxRowsWriter().write_rows(
+            wsh, rows(), empty=self._empty_cols(aggregated)
+        )
 
 
 class ResourceReportHandler(AbstractHandler):
@@ -449,21 +493,21 @@ class ResourceReportHandler(AbstractHandler):
             )
         metadata = self._ls.get_customer_metadata(event.customer_id)
         collection = self._report_service.platform_latest_collection(platform)
-        _LOG.debug('Fetching collection')
-        collection.fetch_all()
         _LOG.debug('Fetching meta')
         collection.fetch_meta()
 
         dictionary_url = None
-        dictionary = {}  # todo maybe refactor somehow
+        obfuscator = obfuscation.Obfuscator() if event.obfuscated else None
         matched = MatchedResourcesIterator(
             collection=collection,
             resource_type=event.resource_type,
             exact_match=event.exact_match,
             search_by_all=event.search_by_all,
             search_by=event.extras,
-            dictionary_out=dictionary if event.obfuscated else None,
+            obfuscator=obfuscator,
         )
+        _LOG.debug('Fetching parts that can match')
+        matched.fetch()
         content = {}
         match event.format:
             case ReportFormat.JSON:
@@ -474,9 +518,8 @@ class ResourceReportHandler(AbstractHandler):
                     metadata=metadata,
                 ).build()
                 if event.obfuscated:
-                    flip_dict(dictionary)
                     dictionary_url = self._report_service.one_time_url_json(
-                        dictionary, 'dictionary.json'
+                        obfuscator.dictionary, 'dictionary.json'
                     )
                 if event.href:
                     url = self._report_service.one_time_url_json(
@@ -487,7 +530,9 @@ class ResourceReportHandler(AbstractHandler):
                     ).dict()
             case ReportFormat.XLSX:
                 buffer = tempfile.TemporaryFile()
-                with Workbook(buffer, {'strings_to_numbers': True}) as wb:
+                with Workbook(
+                    buffer, ResourceReportXlsxWriter.workbook_options
+                ) as wb:
                     ResourceReportXlsxWriter(
                         matched,
                         full=event.full,
@@ -495,9 +540,8 @@ class ResourceReportHandler(AbstractHandler):
                         metadata=metadata,
                     ).write(wb=wb, wsh=wb.add_worksheet('resources'))
                 if event.obfuscated:
-                    flip_dict(dictionary)
                     dictionary_url = self._report_service.one_time_url_json(
-                        dictionary, 'dictionary.json'
+                        obfuscator.dictionary, 'dictionary.json'
                     )
                 buffer.seek(0)
                 url = self._report_service.one_time_url(
@@ -516,20 +560,12 @@ class ResourceReportHandler(AbstractHandler):
         )
 
         collection = self._report_service.tenant_latest_collection(tenant_item)
-        if event.region:
-            _LOG.debug(
-                'Region is provided. Fetching only shard with ' 'this region'
-            )
-            collection.fetch(region=event.region)
-        else:
-            _LOG.debug('Region is not provided. Fetching all shards')
-            collection.fetch_all()
         _LOG.debug('Fetching meta')
         collection.fetch_meta()
         metadata = self._ls.get_customer_metadata(event.customer_id)
 
         dictionary_url = None
-        dictionary = {}  # todo maybe refactor somehow
+        obfuscator = obfuscation.Obfuscator() if event.obfuscated else None
         matched = MatchedResourcesIterator(
             collection=collection,
             resource_type=event.resource_type,
@@ -537,8 +573,10 @@ class ResourceReportHandler(AbstractHandler):
             exact_match=event.exact_match,
             search_by_all=event.search_by_all,
             search_by=event.extras,
-            dictionary_out=dictionary if event.obfuscated else None,
+            obfuscator=obfuscator,
         )
+        _LOG.debug('Fetching parts that can match')
+        matched.fetch()
         content = {}
         match event.format:
             case ReportFormat.JSON:
@@ -549,9 +587,8 @@ class ResourceReportHandler(AbstractHandler):
                     metadata=metadata,
                 ).build()
                 if event.obfuscated:
-                    flip_dict(dictionary)
                     dictionary_url = self._report_service.one_time_url_json(
-                        dictionary, 'dictionary.json'
+                        obfuscator.dictionary, 'dictionary.json'
                     )
                 if event.href:
                     url = self._report_service.one_time_url_json(
@@ -562,14 +599,15 @@ class ResourceReportHandler(AbstractHandler):
                     ).dict()
             case ReportFormat.XLSX:
                 buffer = tempfile.TemporaryFile()
-                with Workbook(buffer, {'strings_to_numbers': True}) as wb:
+                with Workbook(
+                    buffer, ResourceReportXlsxWriter.workbook_options
+                ) as wb:
                     ResourceReportXlsxWriter(matched, metadata).write(
                         wb=wb, wsh=wb.add_worksheet(tenant_name)
                     )
                 if event.obfuscated:
-                    flip_dict(dictionary)
                     dictionary_url = self._report_service.one_time_url_json(
-                        dictionary, 'dictionary.json'
+                        obfuscator.dictionary, 'dictionary.json'
                     )
                 buffer.seek(0)
                 url = self._report_service.one_time_url(
@@ -608,15 +646,6 @@ class ResourceReportHandler(AbstractHandler):
                 collection = self._report_service.ed_job_collection(
                     tenant_item, source.job
                 )
-            if event.region:
-                _LOG.debug(
-                    'Region is provided. Fetching only shard with '
-                    'this region'
-                )
-                collection.fetch(region=event.region)
-            else:
-                _LOG.debug('Region is not provided. Fetching all shards')
-                collection.fetch_all()
             collection.meta = self._report_service.fetch_meta(tenant_item)
             matched = MatchedResourcesIterator(
                 collection=collection,
@@ -626,6 +655,7 @@ class ResourceReportHandler(AbstractHandler):
                 search_by_all=event.search_by_all,
                 search_by=event.extras,
             )
+            matched.fetch()
             response = ResourceReportBuilder(
                 matched_findings_iterator=matched,
                 entity=tenant_item,
@@ -665,19 +695,11 @@ class ResourceReportHandler(AbstractHandler):
             collection = self._report_service.ed_job_collection(
                 tenant, job.job
             )
-        if event.region:
-            _LOG.debug(
-                'Region is provided. Fetching only shard with ' 'this region'
-            )
-            collection.fetch(region=event.region)
-        else:
-            _LOG.debug('Region is not provided. Fetching all shards')
-            collection.fetch_all()
         collection.meta = self._report_service.fetch_meta(tenant)
         metadata = self._ls.get_customer_metadata(event.customer_id)
 
         dictionary_url = None
-        dictionary = {}
+        obfuscator = obfuscation.Obfuscator() if event.obfuscated else None
         matched = MatchedResourcesIterator(
             collection=collection,
             resource_type=event.resource_type,
@@ -685,8 +707,10 @@ class ResourceReportHandler(AbstractHandler):
             exact_match=event.exact_match,
             search_by_all=event.search_by_all,
             search_by=event.extras,
-            dictionary_out=dictionary if event.obfuscated else None,
+            obfuscator=obfuscator,
         )
+        _LOG.debug('Fetching parts that can match')
+        matched.fetch()
         response = ResourceReportBuilder(
             matched_findings_iterator=matched,
             entity=tenant,
@@ -694,9 +718,8 @@ class ResourceReportHandler(AbstractHandler):
             metadata=metadata,
         ).build()
         if event.obfuscated:
-            flip_dict(dictionary)
             dictionary_url = self._report_service.one_time_url_json(
-                dictionary, 'dictionary.json'
+                obfuscator.dictionary, 'dictionary.json'
             )
         if event.href:
             url = self._report_service.one_time_url_json(
@@ -149,7 +149,8 @@ class JobsRulesHandler(AbstractHandler):
                     content = list(data)
             case ReportFormat.XLSX:
                 buffer = io.BytesIO()
-                with Workbook(buffer, {'strings_to_numbers': True}) as wb:
+                with Workbook(buffer, {'strings_to_numbers': True,
+                                       'constant_memory': True}) as wb:
                     RulesReportXlsxWriter(data).write(
                         wb=wb,
                         wsh=wb.add_worksheet('Rules')
@@ -174,7 +175,7 @@ class JobsRulesHandler(AbstractHandler):
             start=event.start_iso,
             end=event.end_iso,
         )
-        average = self._report_service.average_statistics(*map(
-            self._report_service.job_statistics, jobs
-        ))
+        average = self._report_service.average_statistics_columns(
+            self._report_service.jobs_statistics(jobs)
+        )
         return build_response(content=average)
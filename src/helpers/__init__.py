@@ -5,6 +5,7 @@ from enum import Enum as _Enum
 import json
 from dateutil.parser import isoparse
 from functools import reduce
+import hashlib
 import io
 from itertools import chain, islice
 import math
@@ -144,6 +145,34 @@ def hashable(item: dict | list | tuple | set | str | float | int | None):
         return item
 
 
+_FINGERPRINT_ENCODER = msgspec.json.Encoder(order='sorted')
+
+
+def fingerprint(item: Any) -> int:
+    """
+    Stable 64-bit fingerprint of a json-like item. Unlike hash(hashable(...))
+    it does not rebuild the item, does not depend on dict keys order and
+    is the same across processes, so it can be persisted
+    >>> fingerprint({'a': 1, 'b': [1, 2]}) == fingerprint({'b': [1, 2], 'a': 1})
+    True
+    >>> fingerprint({'a': [1, 2]}) == fingerprint({'a': [2, 1]})
+    False
+
+    It's built from json, so unlike hash() it is sensitive to types of
+    numbers: 1, 1.0 and True give different fingerprints. Resources
+    always come through the same json decoder, so their numbers keep
+    types between scans
+    >>> len({fingerprint(1), fingerprint(1.0), fingerprint(True)})
+    3
+    """
+    return int.from_bytes(
+        hashlib.blake2b(
+            _FINGERPRINT_ENCODER.encode(item), digest_size=8
+        ).digest(),
+        'big',
+    )
+
+
 _SENTINEL = object()
 
 
@@ -451,6 +451,14 @@ class CAASEnv(EnvEnum):
         'CAAS_NUMBER_OF_PARTITIONS_FOR_EVENTS',
         '10',
     )
+    EVENT_ASSEMBLER_DEDUP_WINDOW_SECONDS = (
+        'CAAS_EVENT_ASSEMBLER_DEDUP_WINDOW_SECONDS',
+        '3600',
+    )
+    EVENT_ASSEMBLER_DEDUP_MAX_SIZE = (
+        'CAAS_EVENT_ASSEMBLER_DEDUP_MAX_SIZE',
+        '1000000',
+    )
 
     # jobs
     JOBS_TIME_TO_LIVE_DAYS = 'CAAS_JOBS_TIME_TO_LIVE_DAYS'
@@ -464,6 +472,24 @@ class CAASEnv(EnvEnum):
     # cache
     INNER_CACHE_TTL_SECONDS = 'CAAS_INNER_CACHE_TTL_SECONDS', '300'
 
+    # reports
+    SHARDS_IO_CONCURRENCY = 'CAAS_SHARDS_IO_CONCURRENCY', '8'
+    SHARDS_INDEXED = 'CAAS_SHARDS_INDEXED', 'false'
+    SHARDS_CACHE_MEMORY_MB = 'CAAS_SHARDS_CACHE_MEMORY_MB'
+    SHARDS_CACHE_DISK_MB = 'CAAS_SHARDS_CACHE_DISK_MB'
+    SHARDS_CACHE_DIR = 'CAAS_SHARDS_CACHE_DIR'
+
+    # metrics
+    METRICS_CUSTOMERS_CONCURRENCY = 'CAAS_METRICS_CUSTOMERS_CONCURRENCY', '1'
+    METRICS_TENANTS_CONCURRENCY = 'CAAS_METRICS_TENANTS_CONCURRENCY', '4'
+    METRICS_INCREMENTAL = 'CAAS_METRICS_INCREMENTAL', 'true'
+    SNAPSHOTS_INCREMENTAL = 'CAAS_SNAPSHOTS_INCREMENTAL', 'true'
+    SNAPSHOTS_COPY_CONCURRENCY = 'CAAS_SNAPSHOTS_COPY_CONCURRENCY', '16'
+
+    # defect dojo
+    DOJO_IMPORT_TESTS = 'CAAS_DOJO_IMPORT_TESTS', '4'
+    DOJO_IMPORT_CONCURRENCY = 'CAAS_DOJO_IMPORT_CONCURRENCY', '2'
+
     # on-prem access
     MINIO_ENDPOINT = 'CAAS_MINIO_ENDPOINT'
     MINIO_ACCESS_KEY_ID = 'CAAS_MINIO_ACCESS_KEY_ID'
@@ -513,6 +539,15 @@ class BatchJobEnv(EnvEnum):
     PLATFORM_ID = 'PLATFORM_ID'
     ALLOW_MANAGEMENT_CREDS = 'ALLOW_MANAGEMENT_CREDENTIALS'
 
+    # executor tuning
+    REGIONS_POOL_SIZE = 'EXECUTOR_REGIONS_POOL_SIZE', '1'
+    AWS_POLICIES_CONCURRENCY = 'EXECUTOR_AWS_POLICIES_CONCURRENCY', '1'
+    AZURE_POLICIES_CONCURRENCY = 'EXECUTOR_AZURE_POLICIES_CONCURRENCY', '1'
+    GOOGLE_POLICIES_CONCURRENCY = 'EXECUTOR_GOOGLE_POLICIES_CONCURRENCY', '1'
+    K8S_POLICIES_CONCURRENCY = 'EXECUTOR_K8S_POLICIES_CONCURRENCY', '1'
+    POLICIES_LOAD_CACHE = 'EXECUTOR_POLICIES_LOAD_CACHE', 'false'
+    RESOURCES_PER_SHARD = 'EXECUTOR_RESOURCES_PER_SHARD', '20000'
+
 
 class Permission(str, Enum):
     is_disabled: bool
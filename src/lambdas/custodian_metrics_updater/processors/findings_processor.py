@@ -1,6 +1,9 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from pathlib import PurePosixPath
 
-from helpers import get_logger
+from helpers import get_logger, urljoin
+from helpers.time_helper import utc_datetime
 from services import SP
 from services.clients.s3 import S3Client
 from services.environment_service import EnvironmentService
@@ -10,6 +13,19 @@ _LOG = get_logger(__name__)
 
 
 class FindingsUpdater:
+    """
+    Makes snapshots of the latest findings. Incremental snapshots contain
+    only objects that have changed since the previous snapshot and a
+    manifest that references all the objects of the snapshot:
+    {
+        "objects": {
+            "0.json.gz": {"key": "raw/.../snapshots/2023-10-10-10/0.json.gz",
+                          "etag": "\"...\""},
+            "meta.json.gz": {...}
+        }
+    }
+    Etag is the one of the latest object at the moment of snapshot.
+    """
     def __init__(self, s3_client: S3Client,
                  environment_service: EnvironmentService):
         self._s3_client = s3_client
@@ -22,6 +38,100 @@ class FindingsUpdater:
             environment_service=SP.environment_service
         )
 
+    def _previous_objects(self, bucket: str, snapshots: str, destination: str
+                          ) -> dict[str, dict]:
+        """
+        Returns objects of the last snapshot that is older than destination
+        :param snapshots: snapshots folder
+        :param destination: folder of a new snapshot
+        :return: names mapped to keys and etags
+        """
+        previous = None
+        for prefix in self._s3_client.common_prefixes(
+            bucket=bucket,
+            delimiter='/',
+            prefix=snapshots
+        ):
+            if prefix >= destination:
+                break
+            previous = prefix
+        if not previous:
+            return {}
+        manifest = self._s3_client.gz_get_json(
+            bucket=bucket,
+            key=urljoin(previous, ReportsBucketKeysBuilder.manifest)
+        )
+        if manifest:
+            return manifest.get('objects') or {}
+        # full copy made before. Copying single part objects keeps etags
+        return {
+            PurePosixPath(obj.key).name: {'key': obj.key, 'etag': obj.e_tag}
+            for obj in self._s3_client.list_objects(
+                bucket=bucket,
+                prefix=previous
+            )
+        }
+
+    def _copy(self, bucket: str, pairs: list[tuple[str, str]]):
+        if not pairs:
+            return
+        workers = min(
+            self._environment_service.snapshots_copy_concurrency(),
+            len(pairs)
+        )
+        with ThreadPoolExecutor(workers) as ex:
+            futures = [
+                ex.submit(
+                    self._s3_client.copy,
+                    bucket=bucket,
+                    key=key,
+                    destination_bucket=bucket,
+                    destination_key=destination
+                )
+                for key, destination in pairs
+            ]
+            for future in futures:
+                future.result()  # raises the first error
+
+    def make_snapshot(self, bucket: str, latest: str, now: datetime):
+        """
+        :param bucket:
+        :param latest: latest folder, /bla/bla/latest/
+        :param now: date of the snapshot
+        """
+        # destination: /bla/bla/snapshots/2023-10-10-10/1.json.gz
+        snapshots = ReportsBucketKeysBuilder.urljoin(
+            str(PurePosixPath(latest).parent),
+            ReportsBucketKeysBuilder.snapshots
+        )
+        destination = ReportsBucketKeysBuilder.urljoin(
+            snapshots, ReportsBucketKeysBuilder.datetime(now)
+        )
+        incremental = self._environment_service.snapshots_incremental()
+        previous = {}
+        if incremental:
+            previous = self._previous_objects(bucket, snapshots, destination)
+
+        objects, to_copy = {}, []
+        for obj in self._s3_client.list_objects(bucket=bucket, prefix=latest):
+            name = PurePosixPath(obj.key).name
+            item = previous.get(name)
+            if item and item['etag'] == obj.e_tag:
+                objects[name] = item
+                continue
+            objects[name] = {'key': destination + name, 'etag': obj.e_tag}
+            to_copy.append((obj.key, destination + name))
+        _LOG.debug(f'Copying {len(to_copy)} of {len(objects)} objects '
+                   f'from {latest} to {destination}')
+        self._copy(bucket, to_copy)
+        if incremental:
+            # written the last, when all the objects are in place
+            self._s3_client.gz_put_json(
+                bucket=bucket,
+                key=urljoin(destination, ReportsBucketKeysBuilder.manifest),
+                obj={'objects': objects}
+            )
+
     def __call__(self, *args, **kwargs):
         """
         When this processor is executed we make a snapshot of existing
@@ -30,6 +140,7 @@ class FindingsUpdater:
         :return:
         """
         bucket = self._environment_service.default_reports_bucket_name()
+        now = utc_datetime()
         prefixes = self._s3_client.common_prefixes(
             bucket=bucket,
             delimiter=ReportsBucketKeysBuilder.latest,
@@ -37,27 +148,8 @@ class FindingsUpdater:
         )
         for prefix in prefixes:
             _LOG.debug(f'Processing key: {prefix}')
-            objects = self._s3_client.list_objects(
-                bucket=bucket,
-                prefix=prefix,
-            )
-            for obj in objects:
-                # prefix: /bla/bla/latest
-                # key: /bla/bla/latest/1.json.gz
-                # destination: /bla/bla/snapshots/2023/10/10/10/1.json.gz
-                key = obj.key
-                path = PurePosixPath(key)
-                destination = ReportsBucketKeysBuilder.urljoin(
-                    str(path.parent.parent),
-                    ReportsBucketKeysBuilder.snapshots,
-                    ReportsBucketKeysBuilder.datetime()
-                )
-                destination += path.name
-                _LOG.debug(f'Copying {key} to {destination}')
-                self._s3_client.copy(
-                    bucket=bucket,
-                    key=key,
-                    destination_bucket=bucket,
-                    destination_key=destination
-                )
+            try:
+                self.make_snapshot(bucket, prefix, now)
+            except Exception:
+                _LOG.exception(f'Cannot make snapshot of {prefix}')
         return {}
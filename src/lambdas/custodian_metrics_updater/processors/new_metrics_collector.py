@@ -1,5 +1,6 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Generator, Iterator
+from typing import Generator, Iterable, Iterator
 
 from modular_sdk.models.customer import Customer
 from modular_sdk.models.tenant import Tenant
@@ -12,13 +13,14 @@ from models.metrics import ReportMetrics
 from models.ruleset import Ruleset
 from services import SP, modular_helpers
 from services.ambiguous_job_service import AmbiguousJobService
+from services.environment_service import EnvironmentService
 from services.license_service import License, LicenseService
 from services.metadata import Metadata
 from services.report_service import ReportService
 from services.reports import (
     JobMetricsDataSource,
+    MetricsCheckpointService,
     ReportMetricsService,
-    ShardsCollectionDataSource,
     ShardsCollectionProvider,
 )
 from services.ruleset_service import RulesetName, RulesetService
@@ -146,6 +148,8 @@ class MetricsCollector:
         report_metrics_service: ReportMetricsService,
         license_service: LicenseService,
         ruleset_service: RulesetService,
+        environment_service: EnvironmentService,
+        metrics_checkpoint_service: MetricsCheckpointService,
     ):
         self._mc = modular_client
         self._ajs = ambiguous_job_service
@@ -153,6 +157,8 @@ class MetricsCollector:
         self._rms = report_metrics_service
         self._ls = license_service
         self._rss = ruleset_service
+        self._env = environment_service
+        self._mcs = metrics_checkpoint_service
 
         self._tenants_cache = {}
 
@@ -165,6 +171,8 @@ class MetricsCollector:
             report_metrics_service=SP.report_metrics_service,
             license_service=SP.license_service,
             ruleset_service=SP.ruleset_service,
+            environment_service=SP.environment_service,
+            metrics_checkpoint_service=SP.metrics_checkpoint_service,
         )
 
     @staticmethod
@@ -216,6 +224,19 @@ class MetricsCollector:
         self._tenants_cache[name] = item
         return item
 
+    def _prefetch(self, sc_provider: ShardsCollectionProvider,
+                  tenant_names: Iterable[str], date: datetime) -> None:
+        """
+        Fetches shards collections of the given tenants concurrently before
+        they are processed one by one
+        """
+        tenants = filter(None, map(self._get_tenant, tenant_names))
+        sc_provider.prefetch(
+            tenants=tenants,
+            date=date,
+            concurrency=self._env.metrics_tenants_concurrency()
+        )
+
     def save_data_to_s3(self, it: ReportsGen) -> ReportsGen:
         for item in it:
             if item.type in self.LARGE_REPORTS:
@@ -265,7 +286,11 @@ class MetricsCollector:
         if not job_source:
             _LOG.warning('No jobs for customer found')
 
-        sc_provider = ShardsCollectionProvider(self._rs)
+        sc_provider = ShardsCollectionProvider(
+            self._rs,
+            metadata=ctx.metadata,
+            checkpoints=self._mcs if self._env.metrics_incremental() else None,
+        )
 
         _LOG.info('Generating operational overview for all tenants')
         ctx.add_reports(
@@ -351,33 +376,39 @@ class MetricsCollector:
         start = report_type.start(ctx.now)
         end = report_type.end(ctx.now)
         js = job_source.subset(start=start, end=end)
+        self._prefetch(sc_provider, js.scanned_tenants, end)
         # TODO: maybe collect for all tenants
         for tenant_name in js.scanned_tenants:
             tenant = self._get_tenant(tenant_name)
             if not tenant:
                 _LOG.warning(f'Tenant with name {tenant_name} not found!')
                 continue
-            col = sc_provider.get_for_tenant(tenant, end)
-            if col is None:
+            sdc = sc_provider.get_source_for_tenant(tenant, end)
+            if sdc is None:
                 _LOG.warning(
                     f'Cannot get shards collection for '
                     f'{tenant.name} for {end}'
                 )
                 continue
             tjs = js.subset(tenant=tenant.name)
-            sdc = ShardsCollectionDataSource(col, ctx.metadata)
-            data = {
-                'total_scans': len(tjs),
-                'failed_scans': tjs.n_failed,
-                'succeeded_scans': tjs.n_succeeded,
-                'activated_regions': sorted(
-                    modular_helpers.get_tenant_regions(tenant)
-                ),
-                'last_scan_date': tjs.last_scan_date,
-                'id': tenant.project,
-                'resources_violated': sdc.n_unique,
-                'regions_severity': sdc.region_severities(unique=True),
-            }
+            try:
+                data = {
+                    'total_scans': len(tjs),
+                    'failed_scans': tjs.n_failed,
+                    'succeeded_scans': tjs.n_succeeded,
+                    'activated_regions': sorted(
+                        modular_helpers.get_tenant_regions(tenant)
+                    ),
+                    'last_scan_date': tjs.last_scan_date,
+                    'id': tenant.project,
+                    'resources_violated': sdc.n_unique,
+                    'regions_severity': sdc.region_severities(unique=True),
+                }
+            except Exception:
+                _LOG.exception(
+                    f'Cannot collect {report_type} for {tenant.name}'
+                )
+                continue
             item = self._rms.create(
                 key=self._rms.key_for_tenant(report_type, tenant),
                 data=data,
@@ -400,23 +431,29 @@ class MetricsCollector:
         start = report_type.start(ctx.now)
         end = report_type.end(ctx.now)
         js = job_source.subset(start=start, end=end)
+        self._prefetch(sc_provider, js.scanned_tenants, end)
         for tenant_name in js.scanned_tenants:
             tenant = self._get_tenant(tenant_name)
             if not tenant:
                 _LOG.warning(f'Tenant with name {tenant_name} not found!')
                 continue
-            col = sc_provider.get_for_tenant(tenant, end)
-            if col is None:
+            sdc = sc_provider.get_source_for_tenant(tenant, end)
+            if sdc is None:
                 _LOG.warning(
                     f'Cannot get shards collection for '
                     f'{tenant.name} for {end}'
                 )
                 continue
+            try:
+                resources = sdc.resources()
+            except Exception:
+                _LOG.exception(
+                    f'Cannot collect {report_type} for {tenant.name}'
+                )
+                continue
             data = {
                 'id': tenant.project,
-                'data': ShardsCollectionDataSource(
-                    col, ctx.metadata
-                ).resources(),
+                'data': resources,
                 'last_scan_date': js.subset(tenant=tenant.name).last_scan_date,
                 'activated_regions': sorted(
                     modular_helpers.get_tenant_regions(tenant)
@@ -444,6 +481,17 @@ class MetricsCollector:
                 _LOG.warning(f'Tenant with name {tenant_name} not found!')
                 continue
             tjs = js.subset(tenant=tenant.name, job_state=JobState.SUCCEEDED)
+            try:
+                statistics = list(
+                    self._rs.average_statistics_columns(
+                        self._rs.jobs_statistics(tjs, compact=True)
+                    )
+                )
+            except Exception:
+                _LOG.exception(
+                    f'Cannot collect {report_type} for {tenant.name}'
+                )
+                continue
 
             data = {
                 'succeeded_scans': len(tjs),
@@ -452,11 +500,7 @@ class MetricsCollector:
                 ),
                 'last_scan_date': tjs.last_scan_date,
                 'id': tenant.project,
-                'data': list(
-                    self._rs.average_statistics(
-                        *map(self._rs.job_statistics, tjs)
-                    )
-                ),
+                'data': statistics,
             }
             yield self._rms.create(
                 key=self._rms.key_for_tenant(report_type, tenant),
@@ -475,21 +519,29 @@ class MetricsCollector:
         start = report_type.start(ctx.now)
         end = report_type.end(ctx.now)
         js = job_source.subset(start=start, end=end)
+        self._prefetch(sc_provider, js.scanned_tenants, end)
         for tenant_name in js.scanned_tenants:
             tenant = self._get_tenant(tenant_name)
             if not tenant:
                 _LOG.warning(f'Tenant with name {tenant_name} not found!')
                 continue
-            col = sc_provider.get_for_tenant(tenant, end)
-            if col is None:
+            sdc = sc_provider.get_source_for_tenant(tenant, end)
+            if sdc is None:
                 _LOG.warning(
                     f'Cannot get shards collection for '
                     f'{tenant.name} for {end}'
                 )
                 continue
+            try:
+                finops = sdc.finops()
+            except Exception:
+                _LOG.exception(
+                    f'Cannot collect {report_type} for {tenant.name}'
+                )
+                continue
             data = {
                 'id': tenant.project,
-                'data': ShardsCollectionDataSource(col, ctx.metadata).finops(),
+                'data': finops,
                 'last_scan_date': js.subset(tenant=tenant.name).last_scan_date,
                 'activated_regions': sorted(
                     modular_helpers.get_tenant_regions(tenant)
@@ -523,6 +575,7 @@ class MetricsCollector:
                 _LOG.warning(f'Tenant with name {tenant_name} not found!')
                 continue
             cloud_tenant.setdefault(tenant.cloud, []).append(tenant)
+        self._prefetch(sc_provider, js.scanned_tenants, end)
         _LOG.info('Collecting licenses data')
         # TODO: in case these metrics are collected as of some past date the
         #  license information will not correspond to date
@@ -534,17 +587,25 @@ class MetricsCollector:
             total = 0
             used_tenants = []
             for tenant in tenants:
-                col = sc_provider.get_for_tenant(tenant, end)
-                if col is None:
+                sdc = sc_provider.get_source_for_tenant(tenant, end)
+                if sdc is None:
                     _LOG.warning(
                         f'Cannot get shards collection for '
                         f'{tenant.name} for {end}'
                     )
                     continue
-                sdc = ShardsCollectionDataSource(col, ctx.metadata)
-                self._update_dict_values(rt_data, sdc.resource_types())
-                self._update_dict_values(sev_data, sdc.severities())
-                total += sdc.n_unique
+                try:
+                    resource_types = sdc.resource_types()
+                    severities = sdc.severities()
+                    n_unique = sdc.n_unique
+                except Exception:
+                    _LOG.exception(
+                        f'Cannot collect {report_type} for {tenant.name}'
+                    )
+                    continue
+                self._update_dict_values(rt_data, resource_types)
+                self._update_dict_values(sev_data, severities)
+                total += n_unique
                 used_tenants.append(tenant.name)
 
             tjs = js.subset(tenant=used_tenants)
@@ -653,15 +714,36 @@ class MetricsCollector:
             },
         }
 
+    def _collect_for_customer(self, customer: Customer, now: datetime
+                              ) -> bool:
+        """
+        Collects metrics for one customer. Failure is logged and does not
+        affect other customers
+        """
+        _LOG.info(f'Collecting metrics for customer: {customer.name}')
+        try:
+            metadata = self._ls.get_customer_metadata(customer.name)
+            with MetricsContext(customer, metadata, now) as ctx:
+                self.collect_metrics_for_customer(ctx)
+        except Exception:
+            _LOG.exception(
+                f'Failed to collect metrics for customer: {customer.name}'
+            )
+            return False
+        return True
+
     def __call__(self):
         _LOG.info('Starting metrics collector')
         now = utc_datetime()  # TODO: allow to get from somewhere
 
-        for customer in self._mc.customer_service().i_get_customer(
+        customers = self._mc.customer_service().i_get_customer(
             is_active=True
-        ):
-            _LOG.info(f'Collecting metrics for customer: {customer.name}')
-            metadata = self._ls.get_customer_metadata(customer.name)
-            with MetricsContext(customer, metadata, now) as ctx:
-                self.collect_metrics_for_customer(ctx)
+        )
+        concurrency = self._env.metrics_customers_concurrency()
+        with ThreadPoolExecutor(concurrency) as ex:
+            results = list(ex.map(
+                lambda c: self._collect_for_customer(c, now), customers
+            ))
+        if failed := results.count(False):
+            _LOG.error(f'Metrics were not collected for {failed} customer(s)')
         return {}
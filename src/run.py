@@ -16,25 +16,31 @@ Exit codes:
 """
 import os
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 import io
+import logging
 from itertools import chain
 import operator
 from pathlib import Path
 import sys
 import tempfile
 import multiprocessing
+import threading
 import time
 import traceback
-from typing import Generator, cast
+from typing import Generator, Iterable, cast
 
 import msgspec.json
 from botocore.exceptions import ClientError
+from c7n import cache as c7n_cache
 from c7n.config import Config
 from c7n.exceptions import PolicyValidationError
+from c7n.output import LogFile, log_outputs
 from c7n.policy import Policy, PolicyCollection
-from c7n.provider import clouds
+from c7n.provider import clouds, get_resource_class
 from c7n.resources import load_resources
+from c7n.version import version as c7n_version
 from google.auth.exceptions import GoogleAuthError
 from googleapiclient.errors import HttpError
 from modular_sdk.commons.constants import ENV_KUBECONFIG, ParentType
@@ -54,7 +60,7 @@ from executor.helpers.constants import (
 from executor.helpers.profiling import BytesEmitter, xray_recorder as _XRAY
 from executor.services import BSP
 from services.clients.lm_client import LMException
-from executor.services.policy_service import PolicyDict
+from executor.services.policy_service import PoliciesLoadCache, PolicyDict
 from executor.services.report_service import JobResult
 from helpers.constants import (
     BatchJobEnv,
@@ -91,7 +97,11 @@ from services.reports_bucket import (
     TenantReportsBucketKeysBuilder,
 )
 from services.clients.chronicle import ChronicleV2Client
-from services.sharding import ShardsCollection, ShardsCollectionFactory, ShardsS3IO, ShardPart
+from services.sharding import (
+    ShardsCollection,
+    ShardsCollectionFactory,
+    fix_s3_regions,
+)
 
 _LOG = get_logger(__name__)
 
@@ -120,21 +130,53 @@ def get_time_left() -> float:
 
 
 TIME_THRESHOLD: float = get_time_left()
+# region processes stop executing policies at TIME_THRESHOLD by themselves,
+# they are given this time to report what they have done
+REGIONS_GRACE_PERIOD = 60
+
+
+# threads of Runner that execute policies
+POLICY_THREAD_PREFIX = 'policy'
+POLICY_LOG_OUTPUT = 'policy-file'
+
+
+@log_outputs.register(POLICY_LOG_OUTPUT)
+class PolicyLogFile(LogFile):
+    """
+    The same custodian-run.log in the policy's output dir. Each policy adds
+    its handler to the common "custodian" logger, so policies executed
+    in threads would write to each other's files. Records from other
+    threads of Runner are filtered out. Custodian's own inner threads are
+    not filtered
+    """
+
+    def get_handler(self):
+        handler = super().get_handler()
+        ident = threading.get_ident()
+
+        def _filter(record: logging.LogRecord) -> bool:
+            return (record.thread == ident
+                    or not record.threadName.startswith(POLICY_THREAD_PREFIX))
+
+        handler.addFilter(_filter)
+        return handler
 
 
 class PoliciesLoader:
-    __slots__ = ('_cloud', '_output_dir', '_regions', '_cache', 
-                 '_cache_period', '_load_global')
+    __slots__ = ('_cloud', '_output_dir', '_regions', '_cache',
+                 '_cache_period', '_load_global', '_load_cache')
 
     def __init__(self, cloud: Cloud, output_dir: Path,
                  regions: set[str] | None = None, cache: str = CACHE_FILE,
-                 cache_period: int = 30):
+                 cache_period: int = 30,
+                 load_cache: PoliciesLoadCache | None = None):
         """
         :param cloud:
         :param output_dir:
         :param regions:
         :param cache:
         :param cache_period:
+        :param load_cache: keeps validation results between processes
         """
         self._cloud = cloud
         self._output_dir = output_dir
@@ -145,6 +187,7 @@ class PoliciesLoader:
         self._cache = cache
         self._cache_period = cache_period
         self._load_global = not self._regions or GLOBAL_REGION in self._regions
+        self._load_cache = load_cache
 
     def set_global_output(self, policy: Policy) -> None:
         policy.options.output_dir = str(
@@ -168,13 +211,41 @@ class PoliciesLoader:
         """
         if policy.provider_name != 'aws':
             return True
+        return PoliciesLoader._is_global_aws(
+            policy.data, policy.resource_manager.resource_type
+        )
 
-        if comment := policy.data.get('comment'):
+    @staticmethod
+    def _is_global_aws(policy: PolicyDict, rt) -> bool:
+        if comment := policy.get('comment'):
             return RuleIndex(comment).is_global
-        rt = policy.resource_manager.resource_type
         # s3 has one endpoint for all regions
         return rt.global_resource or rt.service == 's3'
 
+    @staticmethod
+    def region_keys(cloud: Cloud, policies: list[PolicyDict], region: str
+                    ) -> Generator[tuple[str, str], None, None]:
+        """
+        Yields (region, policy) pairs that are executed by a process that
+        scans the given region without loading the policies. Policies with
+        unknown resource types are not loaded by the process either
+        """
+        if cloud != Cloud.AWS:
+            for policy in policies:
+                yield GLOBAL_REGION, policy['name']
+            return
+        load_resources(PoliciesLoader._get_resource_types(policies))
+        for policy in policies:
+            try:
+                rt = get_resource_class(policy['resource']).resource_type
+            except (KeyError, AssertionError):
+                continue
+            if PoliciesLoader._is_global_aws(policy, rt):
+                if region == GLOBAL_REGION:
+                    yield GLOBAL_REGION, policy['name']
+            elif region != GLOBAL_REGION:
+                yield region, policy['name']
+
     @staticmethod
     def get_policy_region(policy: Policy) -> str:
         if PoliciesLoader.is_global(policy):
@@ -199,6 +270,7 @@ class PoliciesLoader:
             regions=regions,
             cache=self._cache,
             cache_period=self._cache_period,
+            log_group=POLICY_LOG_OUTPUT,
             command='c7n.commands.run',
             config=None,
             configs=[],
@@ -279,6 +351,25 @@ class PoliciesLoader:
         _LOG.debug(f'Global policies: {n_global}')
         _LOG.debug(f'Not global policies: {n_not_global}')
 
+    @staticmethod
+    def group_by_resource_type(policies: Iterable[Policy]
+                               ) -> dict[tuple[str, str], list[Policy]]:
+        """
+        Groups policies by resource type and region they are executed in.
+        Policies of one group list the same resources from cloud API. Cloud
+        Custodian caches listed resources (see CACHE_FILE) by account, region,
+        resource type and query. So, if one policy of a group is executed
+        before others the rest are evaluated against the cached resources
+        without calling the API again
+        :param policies:
+        :return: {(resource_type, region): [policy, ...]}
+        """
+        groups = {}
+        for policy in policies:
+            key = (policy.resource_type, policy.options.region)
+            groups.setdefault(key, []).append(policy)
+        return groups
+
     def _load(self, policies: list[PolicyDict],
               options: Config | None = None) -> list[Policy]:
         """
@@ -296,7 +387,17 @@ class PoliciesLoader:
         if not options:
             options = self._base_config()
         options.region = ''
+        key, invalid = None, None
+        if self._load_cache:
+            key = self._load_cache.build_key(policies, self._cloud,
+                                             c7n_version)
+            invalid = self._load_cache.get(key)
+        if invalid is not None:
+            _LOG.info('Policies were validated before. Skipping '
+                      f'{len(invalid)} invalid')
+            policies = [p for p in policies if p['name'] not in invalid]
         load_resources(self._get_resource_types(policies))
+        failed = set()  # only validation errors, they do not change
         # here we should probably validate schema, but it's too time-consuming
         provider_policies = {}
         for policy in policies:
@@ -305,6 +406,7 @@ class PoliciesLoader:
             except PolicyValidationError:
                 _LOG.warning(f'Cannot load policy {policy["name"]} '
                              f'dict to object. Skipping', exc_info=True)
+                failed.add(policy['name'])
                 continue
             provider_policies.setdefault(pol.provider_name, []).append(pol)
 
@@ -322,17 +424,22 @@ class PoliciesLoader:
         result = []
         for p in collection:
             p.expand_variables(p.get_variables())
+            # validate() must be called anyway: some filters and actions
+            # build their runtime state there
             try:
                 p.validate()
-            except PolicyValidationError as e:
+            except PolicyValidationError:
                 _LOG.warning(f'Policy {p.name} validation failed',
                              exc_info=True)
+                failed.add(p.name)
                 continue
             except (ValueError, Exception):
                 _LOG.warning('Unexpected error occurred validating policy',
                              exc_info=True)
                 continue
             result.append(p)
+        if key and invalid is None:
+            self._load_cache.set(key, failed)
         return result
 
     def load_from_policies(self, policies: list[PolicyDict]) -> list[Policy]:
@@ -395,10 +502,14 @@ class PoliciesLoader:
 class Runner(ABC):
     cloud: Cloud | None = None
 
-    def __init__(self, policies: list[Policy], failed: dict | None = None):
+    def __init__(self, policies: list[Policy], failed: dict | None = None,
+                 concurrency: int = 1):
         self._policies = policies
 
         self._failed = failed or {}
+        self._concurrency = max(concurrency, 1)
+        # guards the state below when policies are executed in threads
+        self._lock = threading.RLock()
 
         self._is_ongoing = False
         self._error_type: PolicyErrorType = PolicyErrorType.SKIPPED  # default
@@ -407,12 +518,14 @@ class Runner(ABC):
 
     @classmethod
     def factory(cls, cloud: Cloud, policies: list[Policy],
-                failed: dict | None = None) -> 'Runner':
+                failed: dict | None = None, concurrency: int = 1
+                ) -> 'Runner':
         """
         Builds a necessary runner instance based on cloud.
         :param cloud:
         :param policies:
         :param failed:
+        :param concurrency: number of policies executed simultaneously
         :return:
         """
         # TODO refactor, make runner not abstract and move policy
@@ -420,34 +533,109 @@ class Runner(ABC):
         _class = next(
             filter(lambda sub: sub.cloud == cloud, cls.__subclasses__())
         )
-        return _class(policies, failed)
+        return _class(policies, failed, concurrency)
 
     @property
     def failed(self) -> dict:
         return self._failed
 
-    @_XRAY.capture('Run policies consistently')
     def start(self):
+        if self._concurrency > 1:
+            self._start_threaded()
+        else:
+            self._start_consistently()
+
+    @_XRAY.capture('Run policies consistently')
+    def _start_consistently(self):
+        """
+        Policies are executed grouped by resource type as in threaded mode,
+        so that one listing of resources is reused by the whole group
+        """
+        groups = PoliciesLoader.group_by_resource_type(self._policies)
+        self._policies.clear()
         self._is_ongoing = True
-        while self._policies:
-            self._handle_errors(policy=self._policies.pop(0))
+        for group in groups.values():
+            self._handle_group(group)
         self._is_ongoing = False
 
-    def _call_policy(self, policy: Policy):
-        if TIME_THRESHOLD <= utc_datetime().timestamp():
-            if self._is_ongoing:
-                _LOG.warning('Job time threshold has been exceeded. '
-                             'All the consequent rules will be skipped.')
+    @_XRAY.capture('Run policies concurrently')
+    def _start_threaded(self):
+        """
+        Policies spend almost all their time waiting for cloud API, so
+        they can be executed in threads. Once one of them stops the runner
+        (invalid credentials) the rest are skipped as in consistent mode
+        """
+        groups = PoliciesLoader.group_by_resource_type(self._policies)
+        self._init_caches(self._policies)
+        self._policies.clear()
+        _LOG.info(f'Running {len(groups)} groups of policies '
+                  f'in {self._concurrency} threads')
+        self._is_ongoing = True
+        with ThreadPoolExecutor(max_workers=self._concurrency,
+                                thread_name_prefix=POLICY_THREAD_PREFIX
+                                ) as executor:
+            futures = [
+                executor.submit(self._handle_group, group)
+                for group in groups.values()
+            ]
+            for future in as_completed(futures):
+                if exc := future.exception():  # must not happen
+                    _LOG.error(f'Unhandled error in policy thread: {exc}')
+        self._is_ongoing = False
+
+    @staticmethod
+    def _init_caches(policies: Iterable[Policy]):
+        """
+        Creates Cloud Custodian cache files before threads are started.
+        Custodian removes a cache file that is not an SQLite database yet,
+        so threads that create the same file concurrently remove it from
+        under each other (disk I/O error)
+        """
+        seen = set()
+        for policy in policies:
+            if policy.options.cache in seen:
+                continue
+            seen.add(policy.options.cache)
+            with c7n_cache.factory(policy.options):
+                pass
+
+    def _handle_group(self, policies: list[Policy]):
+        """
+        Policies of one resource type are executed one by one (within a
+        thread) so that only the first one lists resources from cloud API
+        and the rest hit Cloud Custodian cache. Concurrent policies of the
+        same type would both miss the cache
+        """
+        for policy in policies:
+            self._handle_errors(policy=policy)
+
+    def _stop(self, error_type: PolicyErrorType, message: str | None = None):
+        """
+        All the subsequent policies will be skipped with the given error
+        """
+        with self._lock:
             self._is_ongoing = False
-            self._error_type = PolicyErrorType.SKIPPED
-            self._message = ('Job time exceeded the maximum '
-                             'possible execution time')
-        if not self._is_ongoing:
+            self._error_type = error_type
+            self._message = message
+
+    def _call_policy(self, policy: Policy):
+        with self._lock:
+            if TIME_THRESHOLD <= utc_datetime().timestamp():
+                if self._is_ongoing:
+                    _LOG.warning('Job time threshold has been exceeded. '
+                                 'All the consequent rules will be skipped.')
+                self._is_ongoing = False
+                self._error_type = PolicyErrorType.SKIPPED
+                self._message = ('Job time exceeded the maximum '
+                                 'possible execution time')
+            is_ongoing = self._is_ongoing
+            error_type, message = self._error_type, self._message
+        if not is_ongoing:
             self._add_failed(
                 region=PoliciesLoader.get_policy_region(policy),
                 policy=policy.name,
-                error_type=self._error_type,
-                message=self._message,
+                error_type=error_type,
+                message=message,
                 exception=self._exception
             )
             return
@@ -470,8 +658,9 @@ class Runner(ABC):
                     error_type: PolicyErrorType, 
                     exception: Exception | None = None,
                     message: str | None = None):
-        self.add_failed(self._failed, region, policy, error_type, exception,
-                        message)
+        with self._lock:
+            self.add_failed(self._failed, region, policy, error_type,
+                            exception, message)
 
     @abstractmethod
     def _handle_errors(self, policy: Policy):
@@ -506,9 +695,7 @@ class AWSRunner(Runner):
                     error_type=PolicyErrorType.CREDENTIALS,
                     message=error_reason
                 )
-                self._is_ongoing = False
-                self._error_type = PolicyErrorType.CREDENTIALS
-                self._message = error_reason
+                self._stop(PolicyErrorType.CREDENTIALS, error_reason)
             else:
                 _LOG.warning(f'Policy \'{name}\' has failed. '
                              f'Client error occurred. '
@@ -547,9 +734,7 @@ class AZURERunner(Runner):
                     error_type=PolicyErrorType.CREDENTIALS,
                     message=error_reason
                 )
-                self._is_ongoing = False
-                self._error_type = PolicyErrorType.CREDENTIALS
-                self._message = error_reason
+                self._stop(PolicyErrorType.CREDENTIALS, error_reason)
             else:
                 _LOG.warning(f'Policy \'{name}\' has failed. '
                              f'Client error occurred. '
@@ -586,9 +771,7 @@ class GCPRunner(Runner):
                 error_type=PolicyErrorType.CREDENTIALS,
                 message=error_reason
             )
-            self._is_ongoing = False
-            self._error_type = PolicyErrorType.CREDENTIALS
-            self._message = error_reason
+            self._stop(PolicyErrorType.CREDENTIALS, error_reason)
         except HttpError as error:
             if error.status_code == 403:
                 self._add_failed(
@@ -710,14 +893,18 @@ def upload_to_siem(tenant: Tenant, collection: ShardsCollection,
             api_key=SP.defect_dojo_service.get_api_key(dojo)
         )
         try:
-            client.import_scan(
+            client.import_scan_chunks(
                 scan_type=configuration.scan_type,
                 scan_date=utc_datetime(),
                 product_type_name=configuration.product_type,
                 product_name=configuration.product,
                 engagement_name=configuration.engagement,
                 test_title=configuration.test,
-                data=convertor.convert(collection),
+                chunks=convertor.split(
+                    collection,
+                    SP.environment_service.dojo_import_tests()
+                ),
+                concurrency=SP.environment_service.dojo_import_concurrency(),
                 tags=SP.integration_service.job_tags_dojo(job)
             )
         except Exception:
@@ -986,19 +1173,34 @@ def batch_results_job(batch_results: BatchResults):
         regions=BSP.environment_service.target_regions()
     )
     with EnvironmentContext(credentials, reset_all=False):
-        runner = Runner.factory(cloud, loader.load_from_regions_to_rules(
-            policies,
-            batch_results.regions_to_rules()
-        ))
+        runner = Runner.factory(
+            cloud=cloud,
+            policies=loader.load_from_regions_to_rules(
+                policies,
+                batch_results.regions_to_rules()
+            ),
+            concurrency=BSP.env.policies_concurrency(cloud)
+        )
         runner.start()
 
     result = JobResult(work_dir, cloud)
     keys_builder = TenantReportsBucketKeysBuilder(tenant)
-    collection = ShardsCollectionFactory.from_cloud(cloud)
+    collection = ShardsCollectionFactory.from_cloud(cloud, spill=True)
     collection.put_parts(result.iter_shard_parts())
     meta = result.rules_meta()
     collection.meta = meta
 
+    latest = ShardsCollectionFactory.from_cloud(cloud, spill=True)
+    latest.io = ShardsCollectionFactory.s3_io(
+        bucket=SP.environment_service.default_reports_bucket_name(),
+        key=keys_builder.latest_key(),
+        client=SP.s3,
+        concurrency=SP.environment_service.shards_io_concurrency(),
+        indexed=SP.environment_service.shards_indexed()
+    )
+    _LOG.debug('Resolving shards layout')
+    align_layout(latest, collection, cloud, scale=False)
+
     _LOG.info('Going to upload to SIEM')
     upload_to_siem(
         tenant=tenant,
@@ -1006,23 +1208,19 @@ def batch_results_job(batch_results: BatchResults):
         job=AmbiguousJob(batch_results),
     )
 
-    collection.io = ShardsS3IO(
+    collection.io = ShardsCollectionFactory.s3_io(
         bucket=SP.environment_service.default_reports_bucket_name(),
         key=keys_builder.ed_job_result(batch_results),
-        client=SP.s3
+        client=SP.s3,
+        concurrency=SP.environment_service.shards_io_concurrency(),
+        indexed=SP.environment_service.shards_indexed()
     )
     _LOG.debug('Writing job report')
     collection.write_all()  # writes job report
+    collection.write_meta()
 
-    latest = ShardsCollectionFactory.from_cloud(cloud)
-    latest.io = ShardsS3IO(
-        bucket=SP.environment_service.default_reports_bucket_name(),
-        key=keys_builder.latest_key(),
-        client=SP.s3
-    )
     _LOG.debug('Pulling latest state')
     latest.fetch_by_indexes(collection.shards.keys())
-    latest.fetch_meta()
     _LOG.info('Self-healing regions')  # todo remove after a couple of releases
     fix_s3_regions(latest)
 
@@ -1031,22 +1229,26 @@ def batch_results_job(batch_results: BatchResults):
     _LOG.debug('Writing latest state')
     latest.update(collection)
     latest.update_meta(meta)
+    fix_s3_regions(latest)  # parts of the job itself
     latest.write_all()
     latest.write_meta()
 
     _LOG.debug('Writing difference')
-    difference.io = ShardsS3IO(
+    difference.io = ShardsCollectionFactory.s3_io(
         bucket=SP.environment_service.default_reports_bucket_name(),
         key=keys_builder.ed_job_difference(batch_results),
-        client=SP.s3
+        client=SP.s3,
+        concurrency=SP.environment_service.shards_io_concurrency(),
+        indexed=SP.environment_service.shards_indexed()
     )
     difference.write_all()
 
     _LOG.info('Writing statistics')
+    statistics = result.statistics(tenant, runner.failed)
     SP.s3.gz_put_json(
         bucket=SP.environment_service.get_statistics_bucket_name(),
         key=StatisticsBucketKeysBuilder.job_statistics(batch_results),
-        obj=result.statistics(tenant, runner.failed)
+        obj=statistics
     )
     temp_dir.cleanup()
 
@@ -1182,68 +1384,134 @@ def single_account_standard_job() -> int:
 
 
 def process_job(filename: str, work_dir: Path, cloud: Cloud,
-                q: multiprocessing.Queue,
-                region: str):
+                region: str) -> dict:
     """
     Cloud Custodian keeps consuming RAM for some reason. After 9th-10th region
     scanned the used memory can be more than 1GI, and it does get free. Not
     sure about correctness and legality of this workaround, but it
-    seems to help. We execute scan for each region in a separate process
-    consequently. When one process finished its memory is freed
-    (any way the results is flushed to files).
+    seems to help. We execute scan for each region in a separate process.
+    When one process finished its memory is freed (any way the results is
+    flushed to files). See `scan_regions`, worker processes are not reused
+    between regions.
+    Returns the map of failed policies
     """
     _LOG.debug(f'Running scan process for region {region}')
     with open(filename, 'rb') as file:
         data = msgspec.json.decode(file.read())
+    load_cache = None
+    if BSP.env.is_policies_load_cache_enabled():
+        load_cache = BSP.policies_load_cache
     loader = PoliciesLoader(
         cloud=cloud,
         output_dir=work_dir,
         regions={region},
+        # processes of different regions must not create one sqlite file
+        # simultaneously, and they don't share cached resources anyway
+        cache=str(work_dir / f'{CACHE_FILE}.{region}'),
         cache_period=120,
+        load_cache=load_cache
     )
     try:
         _LOG.debug('Loading policies')
         policies = loader.load_from_policies(data)
         _LOG.info(f'{len(policies)} were loaded')
-        runner = Runner.factory(cloud, policies)
+        runner = Runner.factory(
+            cloud=cloud,
+            policies=policies,
+            concurrency=BSP.env.policies_concurrency(cloud)
+        )
         _LOG.info('Starting runner')
         runner.start()
         _LOG.info('Runner has finished')
-        q.put(runner.failed)
+        return runner.failed
     except Exception:  # not considered
         # TODO this exception can occur if, say, credentials are invalid.
         #  In such a case PolicyErrorType.CREDENTIALS won't be assigned to
         #  those policies that should've been executed here. Must be fixed
         _LOG.exception('Unexpected error occurred trying to scan')
-        q.put({})
+        return {}
 
 
-def fix_s3_regions(latest: 'ShardsCollection'):
+def scan_regions(filename: str, work_dir: Path, cloud: Cloud,
+                 regions: list[str]) -> dict:
     """
-    Self-healing s3 regions. They are kept as global. This patch rewrites each
-    global s3 part as multiple region-specific parts. The function should be
-    just removed in a couple of releases
+    Scans the given regions in a pool of processes. Each worker process
+    handles exactly one region and is replaced afterwards
+    (see `process_job`). Failed maps are merged as soon as workers finish.
+    Processes skip their policies after TIME_THRESHOLD themselves, so
+    they are waited for a bit longer. Policies of regions that still have
+    not reported are considered skipped and their processes are terminated
+    :param filename: file with policies
+    :param work_dir:
+    :param cloud:
+    :param regions:
+    :return: merged failed map
     """
-    meta = latest.meta
-    for part in tuple(latest.iter_parts()):
-        if part.location != GLOBAL_REGION:
-            continue
-        resource = meta.get(part.policy, {}).get('resource')
-        if not resource or resource not in ('s3', 'aws.s3'):
-            continue
-        # s3 with global
-        latest.drop_part(part.policy, part.location)
-        _region_buckets = {}
-        for res in part.resources:
-            r = res.get('Location', {}).get('LocationConstraint') or AWS_DEFAULT_REGION
-            _region_buckets.setdefault(r, []).append(res)
-        for r, buckets in _region_buckets.items():
-            latest.put_part(ShardPart(
-                policy=part.policy,
-                location=r,
-                timestamp=part.timestamp,
-                resources=buckets
-            ))
+    failed = {}
+    size = min(BSP.env.regions_pool_size(), len(regions)) or 1
+    _LOG.info(f'Scanning {len(regions)} region(s) with pool of {size}')
+    missing = {}  # regions without failed map
+    with multiprocessing.Pool(processes=size, maxtasksperchild=1) as pool:
+        results = {}
+        for region in regions:
+            _LOG.info(f'Submitting Cloud Custodian process for {region}')
+            results[region] = pool.apply_async(
+                process_job,
+                args=(filename, work_dir, cloud, region),
+                callback=failed.update
+            )
+        pool.close()
+        deadline = TIME_THRESHOLD + REGIONS_GRACE_PERIOD
+        for region, result in results.items():
+            result.wait(max(deadline - utc_datetime().timestamp(), 0))
+            if not result.ready():
+                _LOG.warning(f'Region {region} has not finished in time')
+                missing[region] = (
+                    PolicyErrorType.SKIPPED,
+                    'Job time exceeded the maximum possible execution time'
+                )
+            elif not result.successful():
+                _LOG.error(f'Process for region {region} has failed')
+                missing[region] = (PolicyErrorType.INTERNAL,
+                                   'Region scan process has failed')
+        # leaving the context terminates workers that are still running
+    if missing:
+        with open(filename, 'rb') as file:
+            policies = msgspec.json.decode(file.read())
+        for region, (error_type, message) in missing.items():
+            for key in PoliciesLoader.region_keys(cloud, policies, region):
+                if key not in failed:
+                    Runner.add_failed(failed, *key, error_type=error_type,
+                                      message=message)
+    return failed
+
+
+def align_layout(latest: ShardsCollection, collection: ShardsCollection,
+                 cloud: Cloud, scale: bool = True):
+    """
+    Resolves the layout of the latest state and makes the job collection
+    use the same one, so that their shards can be matched by indexes.
+    The latest state is re-sharded beforehand if it or the job has more
+    resources than its layout is meant for. The size of the latest state is
+    taken from its stored layout, so it's not fetched for that. Layouts only
+    grow here
+    :param latest: latest state with io
+    :param collection: job collection
+    :param cloud:
+    :param scale: whether the latest state can be re-sharded
+    """
+    latest.fetch_meta()
+    if scale:
+        distributor = ShardsCollectionFactory.scaled_distributor(
+            cloud=cloud,
+            resources=max(
+                latest.resources_number(), collection.resources_number()
+            ),
+            per_shard=BSP.env.resources_per_shard()
+        )
+        if distributor.shards_number > latest.distributor.shards_number:
+            latest.reshard(distributor)
+    collection.relayout(latest.distributor)
 
 
 @_XRAY.capture('Standard job')
@@ -1285,20 +1553,13 @@ def standard_job(job: Job, tenant: Tenant, work_dir: Path):
     )
     with tempfile.NamedTemporaryFile(delete=False) as file:
         file.write(msgspec.json.encode(policies))
-    failed = {}
     with EnvironmentContext(credentials, reset_all=False):
-        q = multiprocessing.Queue()
-        for region in [GLOBAL_REGION, ] + sorted(BSP.env.target_regions()):
-            p = multiprocessing.Process(
-                target=process_job,
-                args=(file.name, work_dir, cloud, q, region)
-            )
-            p.start()
-            _LOG.info(f'Starting Cloud Custodian process for {region} with pid {p.pid}')
-            _LOG.info(f'Waiting for item from queue')
-            failed.update(q.get())
-            p.join()
-            p.close()
+        failed = scan_regions(
+            filename=file.name,
+            work_dir=work_dir,
+            cloud=cloud,
+            regions=[GLOBAL_REGION, ] + sorted(BSP.env.target_regions())
+        )
 
     result = JobResult(work_dir, cloud)
     if platform:
@@ -1306,48 +1567,56 @@ def standard_job(job: Job, tenant: Tenant, work_dir: Path):
     else:
         keys_builder = TenantReportsBucketKeysBuilder(tenant)
 
-    collection = ShardsCollectionFactory.from_cloud(cloud)
+    collection = ShardsCollectionFactory.from_cloud(cloud, spill=True)
     collection.put_parts(result.iter_shard_parts())
     meta = result.rules_meta()
     collection.meta = meta
 
+    latest = ShardsCollectionFactory.from_cloud(cloud, spill=True)
+    latest.io = ShardsCollectionFactory.s3_io(
+        bucket=SP.environment_service.default_reports_bucket_name(),
+        key=keys_builder.latest_key(),
+        client=SP.s3,
+        concurrency=SP.environment_service.shards_io_concurrency(),
+        indexed=SP.environment_service.shards_indexed()
+    )
+    _LOG.debug('Resolving shards layout')
+    align_layout(latest, collection, cloud)
+
     _LOG.info('Going to upload to SIEM')
     upload_to_siem(tenant=tenant, collection=collection,
                    job=AmbiguousJob(job), platform=platform)
 
-    collection.io = ShardsS3IO(
+    collection.io = ShardsCollectionFactory.s3_io(
         bucket=SP.environment_service.default_reports_bucket_name(),
         key=keys_builder.job_result(job),
-        client=SP.s3
+        client=SP.s3,
+        concurrency=SP.environment_service.shards_io_concurrency(),
+        indexed=SP.environment_service.shards_indexed()
     )
 
     _LOG.debug('Writing job report')
     collection.write_all()  # writes job report
-
-    latest = ShardsCollectionFactory.from_cloud(cloud)
-    latest.io = ShardsS3IO(
-        bucket=SP.environment_service.default_reports_bucket_name(),
-        key=keys_builder.latest_key(),
-        client=SP.s3
-    )
+    collection.write_meta()
 
     _LOG.debug('Pulling latest state')
     latest.fetch_by_indexes(collection.shards.keys())
-    latest.fetch_meta()
     _LOG.info('Self-healing regions')  # todo remove after a couple of releases
     fix_s3_regions(latest)
 
     _LOG.debug('Writing latest state')
     latest.update(collection)
     latest.update_meta(meta)
+    fix_s3_regions(latest)  # parts of the job itself
     latest.write_all()
     latest.write_meta()
 
     _LOG.info('Writing statistics')
+    statistics = result.statistics(tenant, failed)
     SP.s3.gz_put_json(
         bucket=SP.environment_service.get_statistics_bucket_name(),
         key=StatisticsBucketKeysBuilder.job_statistics(job),
-        obj=result.statistics(tenant, failed)
+        obj=statistics
     )
     _LOG.info(f'Job \'{job.id}\' has ended')
 
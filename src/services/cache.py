@@ -1,9 +1,20 @@
-from typing import Callable, Any
+import contextlib
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, BinaryIO, Callable, Any, cast
 
-from cachetools import TLRUCache, TTLCache, cachedmethod  # noqa
+from cachetools import LRUCache, TLRUCache, TTLCache, cachedmethod  # noqa
 
 from helpers.constants import CAASEnv
 
+if TYPE_CHECKING:
+    from services.clients.s3 import S3Client
+
 
 def _expiration(key: Any, value: Any, now: float) -> float:
     """
@@ -20,3 +31,161 @@ def _expiration(key: Any, value: Any, now: float) -> float:
 def factory(maxsize=50, ttu: Callable[[Any, Any, float], float] = _expiration
             ) -> TLRUCache:
     return TLRUCache(maxsize=maxsize, ttu=ttu)
+
+
+_SPOOL_SIZE = 1 << 20
+
+
+def _entry_size(entry: tuple[str, bytes]) -> int:
+    return len(entry[1])
+
+
+def _remaining(body: BinaryIO) -> int:
+    """
+    Number of bytes from the current position to the end. Position is kept
+    """
+    start = body.tell()
+    size = body.seek(0, os.SEEK_END) - start
+    body.seek(start)
+    return size
+
+
+class S3ObjectsCache:
+    """
+    Two-level cache of S3 objects: in-memory LRU and a directory on local
+    disk. Both levels are bounded by size. Entries are kept by bucket and
+    key along with ETag of the object. Each read is validated with a
+    conditional request, so only changed objects are downloaded. The
+    directory can be shared between processes: files are replaced
+    atomically and the least recently used ones are evicted
+    """
+
+    def __init__(self, memory_size: int, disk_size: int = 0,
+                 directory: str | None = None):
+        """
+        :param memory_size: max bytes kept in memory
+        :param disk_size: max bytes kept on disk. 0 disables the disk level
+        :param directory: where to keep files
+        """
+        self._memory = LRUCache(maxsize=memory_size, getsizeof=_entry_size)
+        self._lock = threading.Lock()
+        self._disk_size = disk_size
+        self._dir = None
+        if disk_size:
+            self._dir = Path(directory or tempfile.gettempdir(),
+                             'sre-s3-cache')
+            self._dir.mkdir(parents=True, exist_ok=True)
+        # downloaded bodies that cannot be kept in memory are spooled to
+        # a temp file
+        self._spool_size = memory_size or _SPOOL_SIZE
+
+    def _path(self, bucket: str, key: str) -> Path:
+        name = hashlib.sha256(f'{bucket}/{key}'.encode()).hexdigest()
+        return cast(Path, self._dir) / name
+
+    def _from_memory(self, bucket: str, key: str
+                     ) -> tuple[str, bytes] | None:
+        with self._lock:
+            return self._memory.get((bucket, key))
+
+    def _to_memory(self, bucket: str, key: str, etag: str, body: BinaryIO):
+        if _remaining(body) > self._memory.maxsize:
+            return
+        start = body.tell()
+        data = body.read()
+        body.seek(start)
+        with self._lock:
+            self._memory[(bucket, key)] = (etag, data)
+
+    def _from_disk(self, bucket: str, key: str) -> tuple[str, BinaryIO] | None:
+        """
+        Returns ETag and the opened file positioned at the body. The file
+        stays readable even if another process replaces it
+        """
+        if not self._dir:
+            return
+        path = self._path(bucket, key)
+        try:
+            fp = open(path, 'rb')
+        except FileNotFoundError:
+            return
+        etag = fp.readline().rstrip(b'\n').decode()
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(path)  # marks as recently used
+        return etag, fp
+
+    def _to_disk(self, bucket: str, key: str, etag: str, body: BinaryIO):
+        if not self._dir:
+            return
+        if _remaining(body) > self._disk_size:
+            return
+        path = self._path(bucket, key)
+        start = body.tell()
+        fd, tmp = tempfile.mkstemp(dir=self._dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(etag.encode() + b'\n')
+            shutil.copyfileobj(body, fp)
+        body.seek(start)
+        os.replace(tmp, path)
+        self._evict()
+
+    def _evict(self):
+        files = []
+        total = 0
+        for entry in os.scandir(cast(Path, self._dir)):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime_ns, stat.st_size, entry.path))
+            total += stat.st_size
+        files.sort()
+        for _, size, path in files:
+            if total <= self._disk_size:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            total -= size
+
+    def _drop(self, bucket: str, key: str):
+        with self._lock:
+            self._memory.pop((bucket, key), None)
+        if self._dir:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._path(bucket, key))
+
+    def get(self, client: 'S3Client', bucket: str, key: str
+            ) -> BinaryIO | None:
+        """
+        Returns the object's body as a file-like object. It's downloaded
+        only if the object has changed since it was cached. None is
+        returned if the key does not exist
+        """
+        entry = self._from_memory(bucket, key)
+        from_memory = entry is not None
+        if from_memory:
+            entry = entry[0], io.BytesIO(entry[1])
+        else:
+            entry = self._from_disk(bucket, key)
+        res = client.get_object_if_none_match(
+            bucket=bucket,
+            key=key,
+            etag=entry[0] if entry else None,
+            buffer=tempfile.SpooledTemporaryFile(max_size=self._spool_size)
+        )
+        if res is None:
+            if entry:
+                entry[1].close()
+                self._drop(bucket, key)
+            return
+        body, etag = res
+        if body is None:  # not modified
+            body = cast(tuple, entry)[1]
+            if from_memory:
+                return body
+        else:
+            if entry:
+                entry[1].close()
+            self._to_disk(bucket, key, etag, body)
+        self._to_memory(bucket, key, etag, body)
+        return body
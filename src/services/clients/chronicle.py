@@ -1,14 +1,17 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, \
+    wait
 from enum import Enum
-import math
+from http import HTTPStatus
 from pathlib import Path
-from typing import Generator
+import random
+import time
+from typing import Generator, Iterable
 from urllib.parse import urljoin
 
 from google.auth.transport import requests
 from google.oauth2 import service_account
 import msgspec
 
-from helpers import batches
 from helpers.constants import HTTPMethod
 from helpers.log_helper import get_logger
 
@@ -40,8 +43,11 @@ class ChronicleV2Client:
     """
     _scopes = ['https://www.googleapis.com/auth/malachite-ingestion']
     _payload_size_limit = 2 << 19  # 1mb
+    _max_retries = 4
+    _backoff = 1.  # seconds, doubled after each retry
 
-    __slots__ = '_baseurl', '_session', '_customer_id', '_encoder'
+    __slots__ = '_baseurl', '_session', '_customer_id', '_encoder', \
+        '_concurrency'
 
     @staticmethod
     def _init_session(credentials: Path, scopes: list[str]
@@ -53,32 +59,128 @@ class ChronicleV2Client:
         return requests.AuthorizedSession(credentials)
 
     def __init__(self, url: str, credentials: Path,
-                 customer_id: str | None = None):
+                 customer_id: str | None = None, concurrency: int = 4):
         """
         :param url: http://127.0.0.1:8080
         :param credentials: path to file with Google credentials
         :param customer_id: Chronicle instance customer_id.
         Will be used by default
+        :param concurrency: max number of requests made at once
         """
         self._baseurl = url
         self._session = self._init_session(credentials, self._scopes)
         self._customer_id = customer_id
         self._encoder = msgspec.json.Encoder()
+        self._concurrency = max(concurrency, 1)
 
-    def _batches(self, entities: list[dict]
-                 ) -> Generator[list[dict], None, None]:
+    def _payloads(self, items: Iterable[dict | bytes], prefix: bytes
+                  ) -> Generator[bytes, None, int]:
         """
-        Chronicle accepts only payloads less or eq that 1mb. This method
-        calculates the total length of payload for given list of entities
-        splits them to batches less than 1mb. We do this assuming that each
-        entity has more or less the same size
-        :param entities:
-        :return:
+        Chronicle accepts only payloads less or eq that 1mb. Packs encoded
+        items into payloads {...,"key":[item,item]} that fit the limit
+        exactly. Items that alone exceed the limit are skipped
+        :param items: dicts or already encoded json objects
+        :param prefix: beginning of the payload up to the opening bracket
+        :return: number of skipped items
         """
-        # TODO maybe rewrite because this logic is not ideal
-        total = len(self._encoder.encode(entities))  # total bytes
-        number = math.ceil(total / self._payload_size_limit) + 2  # number of requests
-        yield from batches(entities, max(1, len(entities) // number))
+        suffix = b']}'
+        limit = self._payload_size_limit - len(prefix) - len(suffix)
+        batch, size, skipped = [], 0, 0
+        for item in items:
+            if not isinstance(item, bytes):
+                item = self._encoder.encode(item)
+            if len(item) > limit:
+                _LOG.warning(f'Item of size {len(item)} exceeds the payload '
+                             f'limit and cannot be sent. Skipping')
+                skipped += 1
+                continue
+            # items are separated by commas
+            if batch and size + 1 + len(item) > limit:
+                yield prefix + b','.join(batch) + suffix
+                batch, size = [], 0
+            size += len(item) + bool(batch)
+            batch.append(item)
+        if batch:
+            yield prefix + b','.join(batch) + suffix
+        return skipped
+
+    def _prefix(self, key: str, **kwargs) -> bytes:
+        """
+        {"customer_id":"...",...,"key":[
+        """
+        return (self._encoder.encode(kwargs)[:-1] +
+                f',"{key}":['.encode())
+
+    @staticmethod
+    def _should_retry(resp) -> bool:
+        return resp is None or resp.status_code in (
+            HTTPStatus.TOO_MANY_REQUESTS,
+            HTTPStatus.INTERNAL_SERVER_ERROR,
+            HTTPStatus.BAD_GATEWAY,
+            HTTPStatus.SERVICE_UNAVAILABLE,
+            HTTPStatus.GATEWAY_TIMEOUT,
+        )
+
+    def _post(self, path: ChronicleEndpoint, data: bytes) -> bool:
+        """
+        Posts the payload retrying with exponential backoff on throttling
+        and server errors
+        """
+        for attempt in range(self._max_retries + 1):
+            resp = self._request(
+                path=path,
+                method=HTTPMethod.POST,
+                data=data,
+                headers={'Content-Type': 'application/json'}
+            )
+            if resp is not None and resp.ok:
+                return True
+            if attempt == self._max_retries or not self._should_retry(resp):
+                break
+            delay = self._backoff * (2 ** attempt)
+            retry_after = None if resp is None else resp.headers.get(
+                'Retry-After'
+            )
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            delay += random.uniform(0, delay / 2)  # jitter
+            _LOG.warning(f'Request failed, retrying in {delay:.2f}s')
+            time.sleep(delay)
+        _LOG.warning(f'Error occurred making request to {path.value}: '
+                     f'{self._load_json(resp) if resp is not None else None}')
+        return False
+
+    def _upload(self, path: ChronicleEndpoint,
+                payloads: Generator[bytes, None, int]) -> bool:
+        """
+        Posts payloads concurrently. Only a few payloads are kept in memory
+        at once: the next one is built when one of the requests is finished.
+        Upload is not successful if some items were skipped
+        """
+        success, i, skipped = True, 0, 0
+        pending: set[Future] = set()
+        with ThreadPoolExecutor(self._concurrency) as ex:
+            while True:
+                try:
+                    data = next(payloads)
+                except StopIteration as e:
+                    skipped = e.value or 0
+                    break
+                i += 1
+                _LOG.debug(f'Making the request №{i} with payload size '
+                           f'{len(data)}')
+                pending.add(ex.submit(self._post, path, data))
+                if len(pending) >= self._concurrency:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    success &= all(f.result() for f in done)
+            done, _ = wait(pending)
+            success &= all(f.result() for f in done)
+        _LOG.info(f'{i} requests were made to {path.value}')
+        if skipped:
+            _LOG.warning(f'{skipped} items were not sent to {path.value} '
+                         f'because they exceed the payload limit')
+            return False
+        return success
 
     @staticmethod
     def _load_json(resp) -> dict | list | None:
@@ -87,53 +189,39 @@ class ChronicleV2Client:
         except Exception:
             return
 
-    def create_udm_events(self, events: list[dict],
+    def create_udm_events(self, events: Iterable[dict | bytes],
                           customer_id: str | None = None) -> bool:
+        """
+        :param events: events or encoded events, can be a generator
+        :param customer_id:
+        """
         cid = customer_id or self._customer_id
         assert cid, 'customer_id must be provided if there is no default'
-        success = True
-        for i, batch in enumerate(self._batches(events), start=1):
-            data = self._encoder.encode({
-                'customer_id': cid,
-                'events': batch
-            })
-            _LOG.debug(f'Making the request №{i} with payload size {len(data)}')
-            resp = self._request(
-                path=ChronicleEndpoint.UDM_EVENTS_CREATE,
-                method=HTTPMethod.POST,
-                data=data,
-                headers={'Content-Type': 'application/json'}
+        return self._upload(
+            path=ChronicleEndpoint.UDM_EVENTS_CREATE,
+            payloads=self._payloads(
+                events, self._prefix('events', customer_id=cid)
             )
-            if resp is None or not resp.ok:
-                _LOG.warning(f'Error occurred creating events: '
-                             f'{self._load_json(resp.json())}')
-                success = False
-        return success
+        )
 
-    def create_udm_entities(self, entities: list[dict], log_type: str,
+    def create_udm_entities(self, entities: Iterable[dict | bytes],
+                            log_type: str,
                             customer_id: str | None = None) -> bool:
+        """
+        :param entities: entities or encoded entities, can be a generator
+        :param log_type:
+        :param customer_id:
+        """
         _LOG.info('Uploading udm entities to chronicle')
         cid = customer_id or self._customer_id
         assert cid, 'customer_id must be provided if there is no default'
-        success = True
-        for i, batch in enumerate(self._batches(entities), start=1):
-            data = self._encoder.encode({
-                'customer_id': cid,
-                'entities': batch,
-                'log_type': log_type
-            })
-            _LOG.debug(f'Making the request №{i} with payload size {len(data)}')
-            resp = self._request(
-                path=ChronicleEndpoint.ENTITIES_CREATE,
-                method=HTTPMethod.POST,
-                data=data,
-                headers={'Content-Type': 'application/json'}
+        return self._upload(
+            path=ChronicleEndpoint.ENTITIES_CREATE,
+            payloads=self._payloads(
+                entities,
+                self._prefix('entities', customer_id=cid, log_type=log_type)
             )
-            if resp is None or not resp.ok:
-                _LOG.warning(f'Error occurred creating entities: '
-                             f'{self._load_json(resp.json())}')
-                success = False
-        return success
+        )
 
     def iter_log_types(self) -> Generator[LogType, None, None]:
         resp = self._request(
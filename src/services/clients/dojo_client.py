@@ -1,4 +1,8 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, \
+    wait
 from datetime import datetime
+from http import HTTPStatus
+from typing import Iterable
 
 import requests
 import msgspec
@@ -43,9 +47,15 @@ class DojoV2Client:
     def import_scan(self, scan_type: str, scan_date: datetime,
                     product_type_name: str,
                     product_name: str, engagement_name: str, test_title: str,
-                    data: dict, auto_create_context: bool = True,
+                    data: dict | list | bytes,
+                    auto_create_context: bool = True,
                     tags: list[str] | None = None, reimport: bool = True,
                     ) -> requests.Response | None:
+        """
+        :param data: report or already encoded report
+        """
+        if not isinstance(data, bytes):
+            data = msgspec.json.encode(data)
         return self._request(
             path='/reimport-scan/' if reimport else '/import-scan/',
             method=HTTPMethod.POST,
@@ -60,10 +70,84 @@ class DojoV2Client:
                 'scan_date': scan_date.date().isoformat()
             },
             files={
-                'file': ('report.json', msgspec.json.encode(data))
+                'file': ('report.json', data)
             }
         )
 
+    @staticmethod
+    def chunk_test_title(test_title: str, i: int) -> str:
+        """
+        The first chunk is imported to the test itself so that reports
+        that are not split are pushed as before. Others go to numbered
+        tests: "Test (2)"
+        """
+        return test_title if i == 1 else f'{test_title} ({i})'
+
+    def import_scan_chunks(self, scan_type: str, scan_date: datetime,
+                           product_type_name: str, product_name: str,
+                           engagement_name: str, test_title: str,
+                           chunks: Iterable[bytes], concurrency: int = 1,
+                           auto_create_context: bool = True,
+                           tags: list[str] | None = None,
+                           reimport: bool = True
+                           ) -> list[requests.Response | None]:
+        """
+        Imports each chunk of a report to its own test of the engagement.
+        Separate tests are required because reimport to one test closes the
+        findings that are absent in the imported chunk, so chunks must
+        always contain the same findings (see
+        ShardCollectionDojoConvertor.split). The first chunk is imported
+        alone because it may auto-create the product and engagement. The
+        rest are consumed lazily: the next one is built when one of the
+        requests is finished
+        :param chunks: encoded reports, can be a generator
+        :param concurrency: max number of imports made at once
+        :return: responses in order of chunks
+        """
+        concurrency = max(concurrency, 1)
+        futures: list[Future] = []
+        pending: set[Future] = set()
+        ok, size = 0, 0
+        with ThreadPoolExecutor(concurrency) as ex:
+            for i, data in enumerate(chunks, start=1):
+                _LOG.debug(f'Importing chunk №{i} of size {len(data)}')
+                size += len(data)
+                future = ex.submit(
+                    self.import_scan,
+                    scan_type=scan_type,
+                    scan_date=scan_date,
+                    product_type_name=product_type_name,
+                    product_name=product_name,
+                    engagement_name=engagement_name,
+                    test_title=self.chunk_test_title(test_title, i),
+                    data=data,
+                    auto_create_context=auto_create_context,
+                    tags=tags,
+                    reimport=reimport
+                )
+                futures.append(future)
+                if i == 1:
+                    done = {future}
+                    wait(done)
+                else:
+                    pending.add(future)
+                    if len(pending) < concurrency:
+                        continue
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                ok += sum(map(self._is_created, done))
+                _LOG.info(f'Dojo import progress: {ok} of {i} chunks '
+                          f'imported, {size} bytes submitted')
+            done, _ = wait(pending)
+            ok += sum(map(self._is_created, done))
+        _LOG.info(f'Dojo import finished: {ok} of {len(futures)} chunks '
+                  f'imported, {size} bytes in total')
+        return [f.result() for f in futures]
+
+    @staticmethod
+    def _is_created(future: Future) -> bool:
+        return getattr(future.result(), 'status_code', None) == \
+            HTTPStatus.CREATED
+
     def _request(self, path: str, method: HTTPMethod,
                  params: dict | None = None, data: dict | None = None,
                  files: dict | None = None, timeout: int | None = None
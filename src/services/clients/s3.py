@@ -63,7 +63,13 @@ class S3Url:
 class S3ClientWrapperFactory(Boto3ClientWrapperFactory['S3Client']):
     @classmethod
     def _base_config(cls) -> Config:
-        return Config(retries={'max_attempts': 10, 'mode': 'standard'})
+        # shards are uploaded and downloaded by multiple threads using one
+        # client, so the pool must not be smaller than their number
+        pool = CAASEnv.SHARDS_IO_CONCURRENCY.get('')
+        return Config(
+            retries={'max_attempts': 10, 'mode': 'standard'},
+            max_pool_connections=max(10, int(pool) if pool.isdigit() else 0)
+        )
 
     @classmethod
     def _minio_config(cls) -> Config:
@@ -164,6 +170,7 @@ class S3Client(Boto3ClientWrapper):
         body: bytes | BinaryIO,
         content_type: str | None = None,
         content_encoding: str | None = None,
+        metadata: dict[str, str] | None = None,
     ):
         """
         Uploads the provided stream of bytes or raw bytes.
@@ -172,6 +179,7 @@ class S3Client(Boto3ClientWrapper):
         :param body:
         :param content_type:
         :param content_encoding:
+        :param metadata: user-defined object metadata
         :return:
         """
         ct, ce = self._resolve_content_type(
@@ -182,6 +190,8 @@ class S3Client(Boto3ClientWrapper):
             params.update(ContentType=ct)
         if ce:
             params.update(ContentEncoding=ce)
+        if metadata:
+            params.update(Metadata=metadata)
         if isinstance(body, bytes):
             body = io.BytesIO(body)
         return self.resource.Bucket(bucket).upload_fileobj(
@@ -253,6 +263,94 @@ class S3Client(Boto3ClientWrapper):
         buffer.seek(0)
         return buffer
 
+    def get_object_range(
+        self, bucket: str, key: str, start: int | None = None,
+        end: int | None = None, suffix: int | None = None,
+        etag: str | None = None
+    ) -> tuple[bytes, dict[str, str], int, str] | None:
+        """
+        Downloads a range of bytes of the object. Either start and end
+        (both inclusive) or suffix (number of last bytes) must be provided.
+        In case the key does not exist, None is returned
+        :param bucket:
+        :param key:
+        :param start:
+        :param end:
+        :param suffix:
+        :param etag: if given, the range is returned only if the object
+        still has this ETag. ClientError with PreconditionFailed code is
+        raised otherwise
+        :return: (content, user-defined metadata, full size of the object,
+        ETag)
+        """
+        if suffix is not None:
+            range_ = f'bytes=-{suffix}'
+        else:
+            range_ = f'bytes={start}-{end}'
+        params = {'Bucket': bucket, 'Key': key, 'Range': range_}
+        if etag:
+            params['IfMatch'] = etag
+        try:
+            response = self.client.get_object(**params)
+        except ClientError as e:
+            code = e.response['Error']['Code']
+            if code in ('NoSuchKey', '404'):
+                return
+            if code in ('PreconditionFailed', '412'):
+                raise e  # expected when the object is overwritten
+            _LOG.exception(
+                f'Unexpected error occurred in '
+                f'get_object_range: s3://{bucket}/{key}'
+            )
+            raise e
+        # Content-Range is absent if the whole object is returned
+        size = response.get('ContentRange', '').rpartition('/')[-1]
+        content = response['Body'].read()
+        return (
+            content,
+            response.get('Metadata') or {},
+            int(size) if size.isdigit() else len(content),
+            response.get('ETag', '')
+        )
+
+    def get_object_if_none_match(
+        self, bucket: str, key: str, etag: str | None = None,
+        buffer: BinaryIO | None = None
+    ) -> tuple[BinaryIO | None, str] | None:
+        """
+        Downloads the object in case its ETag differs from the given one.
+        The body is streamed to memory by default. You can provide some temp
+        file in case the size of body is expected to be large.
+        In case the key does not exist, None is returned
+        :param bucket:
+        :param key:
+        :param etag:
+        :param buffer:
+        :return: (buffer, ETag). Buffer is None if the object has not
+        changed
+        """
+        params = {'Bucket': bucket, 'Key': key}
+        if etag:
+            params['IfNoneMatch'] = etag
+        try:
+            response = self.client.get_object(**params)
+        except ClientError as e:
+            code = e.response['Error']['Code']
+            if code in ('NoSuchKey', '404'):
+                return
+            if code in ('304', 'NotModified'):
+                return None, cast(str, etag)
+            _LOG.exception(
+                f'Unexpected error occurred in '
+                f'get_object_if_none_match: s3://{bucket}/{key}'
+            )
+            raise e
+        if not buffer:
+            buffer = io.BytesIO()
+        shutil.copyfileobj(response['Body'], buffer)
+        buffer.seek(0)
+        return buffer, response['ETag']
+
     def gz_get_object(
         self,
         bucket: str,
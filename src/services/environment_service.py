@@ -152,6 +152,28 @@ class EnvironmentService:
         """
         return int(CAASEnv.EVENT_ASSEMBLER_PULL_EVENTS_PAGE_SIZE.get())
 
+    def event_assembler_dedup_window(self) -> int:
+        """
+        Lambdas:
+        - caas-event-handler
+        Seconds within which duplicated records are skipped
+        """
+        from_env = CAASEnv.EVENT_ASSEMBLER_DEDUP_WINDOW_SECONDS.get('')
+        if from_env.isdigit() and int(from_env) > 0:
+            return int(from_env)
+        return int(CAASEnv.EVENT_ASSEMBLER_DEDUP_WINDOW_SECONDS.default)
+
+    def event_assembler_dedup_max_size(self) -> int:
+        """
+        Lambdas:
+        - caas-event-handler
+        Max number of records digests that are kept to skip duplicates
+        """
+        from_env = CAASEnv.EVENT_ASSEMBLER_DEDUP_MAX_SIZE.get('')
+        if from_env.isdigit() and int(from_env) > 0:
+            return int(from_env)
+        return int(CAASEnv.EVENT_ASSEMBLER_DEDUP_MAX_SIZE.default)
+
     def number_of_native_events_in_event_item(self) -> int:
         """
         Lambdas:
@@ -197,3 +219,129 @@ class EnvironmentService:
         host = CAASEnv.MINIO_PRESIGNED_URL_HOST.get()
         if host:
             return host.strip().strip('/')
+
+    def shards_io_concurrency(self) -> int:
+        """
+        Number of shards that are uploaded or downloaded to S3 at once.
+        Used by lambdas and executor
+        """
+        from_env = CAASEnv.SHARDS_IO_CONCURRENCY.get('')
+        if from_env.isdigit() and int(from_env) > 0:
+            return int(from_env)
+        return int(CAASEnv.SHARDS_IO_CONCURRENCY.default)
+
+    def shards_indexed(self) -> bool:
+        """
+        Whether shards are written with the index of their parts, so that
+        only needed parts are downloaded. Such shards can be read only by
+        this and newer versions, so enable it when all the lambdas and
+        executors are updated. Used by lambdas and executor
+        """
+        return CAASEnv.SHARDS_INDEXED.get().lower() in ENV_TRUE
+
+    def shards_cache_memory_size(self) -> int:
+        """
+        Max bytes of shards kept in memory of one process. Enabled on-prem
+        by default and disabled in lambdas where memory is limited
+        """
+        from_env = CAASEnv.SHARDS_CACHE_MEMORY_MB.get('')
+        if from_env.isdigit():
+            return int(from_env) << 20
+        if self.is_docker():
+            return 128 << 20
+        return 0
+
+    def shards_cache_disk_size(self) -> int:
+        """
+        Max bytes of shards kept on local disk. The directory is shared by
+        the processes of one installation, so it's enabled on-prem by
+        default and disabled in lambdas
+        """
+        from_env = CAASEnv.SHARDS_CACHE_DISK_MB.get('')
+        if from_env.isdigit():
+            return int(from_env) << 20
+        if self.is_docker():
+            return 1024 << 20
+        return 0
+
+    def shards_cache_dir(self) -> str | None:
+        return CAASEnv.SHARDS_CACHE_DIR.get()
+
+    def metrics_customers_concurrency(self) -> int:
+        """
+        Lambdas:
+        - caas-metrics-updater
+        Number of customers which metrics are collected simultaneously
+        """
+        from_env = CAASEnv.METRICS_CUSTOMERS_CONCURRENCY.get('')
+        if from_env.isdigit() and int(from_env) > 0:
+            return int(from_env)
+        return int(CAASEnv.METRICS_CUSTOMERS_CONCURRENCY.default)
+
+    def metrics_tenants_concurrency(self) -> int:
+        """
+        Lambdas:
+        - caas-metrics-updater
+        Number of tenants which findings are fetched simultaneously within
+        one customer
+        """
+        from_env = CAASEnv.METRICS_TENANTS_CONCURRENCY.get('')
+        if from_env.isdigit() and int(from_env) > 0:
+            return int(from_env)
+        return int(CAASEnv.METRICS_TENANTS_CONCURRENCY.default)
+
+    def metrics_incremental(self) -> bool:
+        """
+        Lambdas:
+        - caas-metrics-updater
+        Whether tenant aggregates are updated from checkpoints with results
+        of new jobs instead of being rebuilt from the latest state each time
+        """
+        return CAASEnv.METRICS_INCREMENTAL.get().lower() in ENV_TRUE
+
+    def snapshots_incremental(self) -> bool:
+        """
+        Lambdas:
+        - caas-metrics-updater
+        Whether findings snapshots copy only shards that changed since the
+        previous snapshot and reference the rest in a manifest
+        """
+        return CAASEnv.SNAPSHOTS_INCREMENTAL.get().lower() in ENV_TRUE
+
+    def snapshots_copy_concurrency(self) -> int:
+        """
+        Lambdas:
+        - caas-metrics-updater
+        Number of objects that are copied to a new snapshot at once
+        """
+        from_env = CAASEnv.SNAPSHOTS_COPY_CONCURRENCY.get('')
+        if from_env.isdigit() and int(from_env) > 0:
+            return int(from_env)
+        return int(CAASEnv.SNAPSHOTS_COPY_CONCURRENCY.default)
+
+    def dojo_import_tests(self) -> int:
+        """
+        Lambdas:
+        - caas-api-handler
+        - caas-executor
+        Number of tests a Defect Dojo report is split into. Resources are
+        spread between tests evenly, so the number bounds the size of
+        one import. A resource always goes to the same test. Must not be
+        changed often because findings move between tests then
+        """
+        from_env = CAASEnv.DOJO_IMPORT_TESTS.get('')
+        if from_env.isdigit() and int(from_env) > 0:
+            return int(from_env)
+        return int(CAASEnv.DOJO_IMPORT_TESTS.default)
+
+    def dojo_import_concurrency(self) -> int:
+        """
+        Lambdas:
+        - caas-api-handler
+        - caas-executor
+        Number of tests that are imported to Defect Dojo at once
+        """
+        from_env = CAASEnv.DOJO_IMPORT_CONCURRENCY.get('')
+        if from_env.isdigit() and int(from_env) > 0:
+            return int(from_env)
+        return int(CAASEnv.DOJO_IMPORT_CONCURRENCY.default)
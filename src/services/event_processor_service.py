@@ -1,8 +1,9 @@
 import json
-from abc import ABC
-from functools import cached_property
+from abc import ABC, abstractmethod
 from typing import Optional, Dict, Iterator, List, Generator, Tuple, Set, \
-    Iterable
+    Iterable, Hashable
+
+from cachetools import TTLCache
 
 from helpers import deep_get, deep_set
 from helpers.constants import AWS_VENDOR, MAESTRO_VENDOR, AZURE_CLOUD_ATTR, \
@@ -55,27 +56,159 @@ CloudTenantRegionRulesMap = Dict[str, Dict[str, Dict[str, Set[str]]]]
 DEV = '323549576358'
 
 
+class SeenRecords:
+    """
+    Digests of already emitted records within a sliding time window. Both
+    the window and the number of digests are bounded, the oldest digests
+    are dropped first. Time is the timestamp of events being processed,
+    so it must be moved forward by the caller
+    """
+    __slots__ = ('_cache', 'now')
+
+    def __init__(self, window: float, maxsize: int):
+        self.now = 0.
+        self._cache = TTLCache(
+            maxsize=maxsize, ttl=window, timer=lambda: self.now
+        )
+
+    def __contains__(self, digest: Hashable) -> bool:
+        return digest in self._cache
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def add(self, digest: Hashable):
+        self._cache[digest] = None
+
+
+EMPTY_RULES = frozenset()
+
+
+class EventRulesIndex:
+    """
+    Event-to-rules mappings from settings compiled into flat dicts, so
+    that rules of an event are resolved by one lookup:
+    - CloudTrail: (eventSource, eventName) -> rules
+    - EventBridge: source -> rules
+    - Maestro: (cloud, subGroup, eventAction) -> rules
+    """
+    __slots__ = ('cloudtrail', 'cloudtrail_names', 'ct_sources',
+                 'ct_event_names', 'eventbridge', 'maestro')
+
+    def __init__(self, aws_events: dict | None = None,
+                 eb_mapping: dict | None = None,
+                 azure_events: dict | None = None,
+                 maestro_azure: dict | None = None,
+                 google_events: dict | None = None,
+                 maestro_google: dict | None = None):
+        aws_events = aws_events or {}
+        self.cloudtrail: Dict[Tuple[str, str], frozenset] = {}
+        # mappings without sources: eventName -> rules
+        self.cloudtrail_names: Dict[str, frozenset] = {}
+        for source, names in aws_events.items():
+            if not isinstance(names, dict):
+                self.cloudtrail_names[source] = frozenset(names or ())
+                continue
+            for name, rules in names.items():
+                self.cloudtrail[(source, name)] = frozenset(rules or ())
+        self.ct_sources = frozenset(aws_events)
+        self.ct_event_names = frozenset(
+            name for names in aws_events.values() for name in names
+        )
+        self.eventbridge = {
+            source: frozenset(rules or ())
+            for source, rules in (eb_mapping or {}).items()
+        }
+        self.maestro: Dict[Tuple[str, str, str], frozenset] = {}
+        for cloud, maestro_map, events in (
+                (AZURE_CLOUD_ATTR, maestro_azure, azure_events or {}),
+                (GOOGLE_CLOUD_ATTR, maestro_google, google_events or {})):
+            for sub_group, actions in (maestro_map or {}).items():
+                for action, native in actions.items():
+                    rules = set()
+                    for e_source, e_name in native:
+                        rules.update(events.get(e_source, {}).get(e_name, []))
+                    self.maestro[(cloud, sub_group, action)] = frozenset(
+                        rules
+                    )
+
+    def cloudtrail_rules(self, source: str, name: str) -> frozenset:
+        return (self.cloudtrail.get((source, name))
+                or self.cloudtrail_names.get(name, EMPTY_RULES))
+
+    def eventbridge_rules(self, source: str) -> frozenset:
+        return self.eventbridge.get(source, EMPTY_RULES)
+
+    def maestro_rules(self, cloud: str, sub_group: str, action: str
+                      ) -> frozenset:
+        return self.maestro.get((cloud, sub_group, action), EMPTY_RULES)
+
+
 class EventProcessorService:
+    # settings the rules index is compiled from, in order of its arguments
+    index_settings = (
+        S3SettingKey.AWS_EVENTS,
+        S3SettingKey.EVENT_BRIDGE_EVENT_SOURCE_TO_RULES_MAPPING,
+        S3SettingKey.AZURE_EVENTS,
+        S3SettingKey.MAESTRO_SUBGROUP_ACTION_TO_AZURE_EVENTS_MAPPING,
+        S3SettingKey.GOOGLE_EVENTS,
+        S3SettingKey.MAESTRO_SUBGROUP_ACTION_TO_GOOGLE_EVENTS_MAPPING,
+    )
+
     def __init__(self, s3_settings_service: S3SettingsService,
                  environment_service: EnvironmentService,
                  sts_client: StsClient):
-        self.s3_settings_service = s3_settings_service
+        self.s3_settings_service = S3SettingsServiceLocalWrapper(
+            s3_settings_service
+        )
         self.environment_service = environment_service
         self.sts_client = sts_client
-        self.mappings_collector = {}  # TODO: fix
         self.EVENT_TYPE_PROCESSOR_MAPPING = {
             AWS_VENDOR: EventBridgeEventProcessor,
             MAESTRO_VENDOR: MaestroEventProcessor
         }
 
+        # the service lives as long as the lambda container does, so does
+        # the index
+        self._settings: Dict[S3SettingKey, dict] = {}
+        self._etags: Dict[S3SettingKey, str] = {}
+        self._index: Optional[EventRulesIndex] = None
+
+    @property
+    def rules_index(self) -> EventRulesIndex:
+        """
+        Compiled index of event-to-rules mappings. Settings are checked by
+        their ETags each time and the index is recompiled only if some of
+        them have changed
+        """
+        changed = self._index is None
+        for key in self.index_settings:
+            res = self.s3_settings_service.get_if_changed(
+                key, self._etags.get(key)
+            )
+            if res is None:
+                changed |= self._settings.pop(key, None) is not None
+                self._etags.pop(key, None)
+                continue
+            data, etag = res
+            if data is None:
+                continue
+            self._settings[key], self._etags[key] = data, etag
+            changed = True
+        if changed:
+            _LOG.info('Compiling event-to-rules index')
+            self._index = EventRulesIndex(
+                *(self._settings.get(key) for key in self.index_settings)
+            )
+        return self._index
+
     def get_processor(self, vendor: str) -> 'BaseEventProcessor':
         # vendor already validated
         processor_type = self.EVENT_TYPE_PROCESSOR_MAPPING[vendor]
         processor = processor_type(
-            self.s3_settings_service,
             self.environment_service,
             self.sts_client,
-            self.mappings_collector
+            self.rules_index
         )
         return processor
 
@@ -85,32 +218,15 @@ class BaseEventProcessor(ABC):
     keep_where: Dict[Tuple[str, ...], Set] = {}
     params_to_keep: Tuple[Tuple[str, ...], ...] = ()
 
-    def __init__(self, s3_settings_service: S3SettingsService,
-                 environment_service: EnvironmentService,
+    def __init__(self, environment_service: EnvironmentService,
                  sts_client: StsClient,
-                 mappings_collector: dict):
-        self.s3_settings_service = S3SettingsServiceLocalWrapper(
-            s3_settings_service)
+                 rules_index: EventRulesIndex):
         self.environment_service = environment_service
         self.sts_client = sts_client
-        self.mappings_collector = mappings_collector
+        self.rules_index = rules_index
 
         self._events: List[Dict] = []
 
-    @property
-    def ct_mapping(self) -> dict:
-        return self.mappings_collector.aws_events
-
-    @cached_property
-    def eb_mapping(self) -> dict:
-        """
-        This mapping exists but it is not used
-        :return:
-        """
-        return self.s3_settings_service.get(
-            S3SettingKey.EVENT_BRIDGE_EVENT_SOURCE_TO_RULES_MAPPING
-        )
-
     def clear(self):
         self._events = []
 
@@ -170,20 +286,47 @@ class BaseEventProcessor(ABC):
         return hash(json.dumps(dct, sort_keys=True))
 
     @classmethod
-    def without_duplicates(cls, it: Iterable[Dict]) -> Generator[
-        Dict, None, int]:
-        emitted = set()
+    def fingerprint(cls, record: dict) -> Hashable:
+        """
+        Digest of values by params_to_keep. Records are sieved by them, so
+        the other values do not matter. Falls back to the digest of the
+        whole record if there are no such params or values are not hashable
+        """
+        if not cls.params_to_keep:
+            return cls.digest(record)
+        try:
+            return hash(tuple(
+                deep_get(record, path) or None for path in cls.params_to_keep
+            ))
+        except TypeError:
+            return cls.digest(record)
+
+    @classmethod
+    def without_duplicates(cls, it: Iterable[Dict],
+                           emitted: Optional[Set | SeenRecords] = None
+                           ) -> Generator[Dict, None, int]:
+        """
+        :param it:
+        :param emitted: digests of already emitted records. Can be given
+        to skip duplicates across multiple calls
+        """
+        if emitted is None:
+            emitted = set()
         for i in it:
-            d = cls.digest(i)
+            d = cls.fingerprint(i)
             if d in emitted:
                 continue
             emitted.add(d)
             yield i
         return len(emitted)
 
-    def prepared_events(self) -> Generator[dict, None, int]:
+    def prepared_events(self, it: Optional[Iterable[Dict]] = None
+                        ) -> Generator[dict, None, int]:
+        """
+        :param it: records to prepare. Events of the processor by default
+        """
         n = 0
-        for record in self.i_events:
+        for record in (self.i_events if it is None else it):
             if self.skip_record(record, self.skip_where) or \
                     not self.keep_record(record, self.keep_where):
                 _LOG.warning(f'Filtering out the record: {record}')
@@ -192,6 +335,13 @@ class BaseEventProcessor(ABC):
             n += 1
         return n
 
+    @abstractmethod
+    def update_rules_map(self, ref: dict, it: Iterable[Dict]) -> dict:
+        """
+        Puts rules of the given prepared records to the vendor specific
+        map. The map can be built up by multiple calls
+        """
+
 
 class CloudTrail:
     """
@@ -199,14 +349,14 @@ class CloudTrail:
     """
 
     @staticmethod
-    def get_rules(record: dict, mapping: dict) -> set:
+    def get_rules(record: dict, index: EventRulesIndex) -> frozenset:
         source, name = (
             record.get(CT_EVENT_SOURCE), record.get(CT_EVENT_NAME)
         )
-        rules = mapping.get(source, {}).get(name, []) or mapping.get(name, [])
+        rules = index.cloudtrail_rules(source, name)
         if not rules:
             _LOG.warning(f'No rules found within CloudTrail {source}:{name}')
-        return set(rules)
+        return rules
 
     @staticmethod
     def get_region(record: dict) -> Optional[str]:
@@ -266,26 +416,6 @@ class MaestroEventProcessor(BaseEventProcessor):
         (MA_TENANT_NAME,)
     )
 
-    @property
-    def azure_mapping(self) -> dict:
-        return self.mappings_collector.azure_events
-
-    @property
-    def maestro_azure_mapping(self) -> dict:
-        return self.s3_settings_service.get(
-            S3SettingKey.MAESTRO_SUBGROUP_ACTION_TO_AZURE_EVENTS_MAPPING
-        )
-
-    @property
-    def google_mapping(self) -> dict:
-        return self.mappings_collector.google_events
-
-    @property
-    def maestro_google_mapping(self) -> dict:
-        return self.s3_settings_service.get(
-            S3SettingKey.MAESTRO_SUBGROUP_ACTION_TO_GOOGLE_EVENTS_MAPPING
-        )
-
     def cloud_tenant_region_rules(
             self, it: Iterable[Dict]
     ) -> Generator[Tuple[str, str, str, Set[str]], None, None]:
@@ -312,50 +442,26 @@ class MaestroEventProcessor(BaseEventProcessor):
             rules = self.get_rules(event, cloud.upper())
             yield cloud.upper(), tenant, region, rules
 
-    def cloud_tenant_region_rules_map(self, it: Iterable[Dict]
-                                      ) -> CloudTenantRegionRulesMap:
-        ref = {}
+    def cloud_tenant_region_rules_map(
+            self, it: Iterable[Dict],
+            ref: Optional[CloudTenantRegionRulesMap] = None
+    ) -> CloudTenantRegionRulesMap:
+        if ref is None:
+            ref = {}
         for cloud, tenant, region, rules in self.cloud_tenant_region_rules(it):
             ref.setdefault(cloud, {}).setdefault(tenant, {}).setdefault(region,
                                                                         set()).update(
                 rules)
         return ref
 
-    def get_rules(self, event: dict, cloud: str) -> Set[str]:
-        cloud_method = {
-            AZURE_CLOUD_ATTR: self.get_rules_azure,
-            GOOGLE_CLOUD_ATTR: self.get_rules_google
-        }
-        _get_rules = cloud_method.get(cloud) or (lambda e: set())
-        return _get_rules(event)
-
-    def get_rules_azure(self, event: dict) -> Set[str]:
-        """
-        Expected that event's cloud is AZURE. That means that AZURE's
-        mappings will be used to retrieve rules
-        """
-        _maestro_map = self.maestro_azure_mapping
-        _azure_map = self.azure_mapping
-        sub_group = event.get(MA_SUB_GROUP)
-        action = event.get(MA_EVENT_ACTION)
-        azure_events: List[List[str]] = _maestro_map.get(
-            sub_group, {}).get(action, [])
-        rules = set()
-        for e_source, e_name in azure_events:
-            rules.update(_azure_map.get(e_source, {}).get(e_name, []))
-        return rules
+    def update_rules_map(self, ref: CloudTenantRegionRulesMap,
+                         it: Iterable[Dict]) -> CloudTenantRegionRulesMap:
+        return self.cloud_tenant_region_rules_map(it, ref)
 
-    def get_rules_google(self, event: dict) -> Set[str]:
-        _maestro_map = self.maestro_google_mapping
-        _google_map = self.google_mapping
-        sub_group = event.get(MA_SUB_GROUP)
-        action = event.get(MA_EVENT_ACTION)
-        google_events: List[List[str]] = _maestro_map.get(
-            sub_group, {}).get(action, [])
-        rules = set()
-        for e_source, e_name in google_events:
-            rules.update(_google_map.get(e_source, {}).get(e_name, []))
-        return rules
+    def get_rules(self, event: dict, cloud: str) -> frozenset:
+        return self.rules_index.maestro_rules(
+            cloud, event.get(MA_SUB_GROUP), event.get(MA_EVENT_ACTION)
+        )
 
 
 class EventBridgeEventProcessor(BaseEventProcessor):
@@ -370,25 +476,21 @@ class EventBridgeEventProcessor(BaseEventProcessor):
         (EB_DETAIL, CT_REGION)
     )
 
-    def __init__(self, s3_settings_service: S3SettingsService,
-                 environment_service: EnvironmentService,
+    def __init__(self, environment_service: EnvironmentService,
                  sts_client: StsClient,
-                 mappings_collector: dict):
+                 rules_index: EventRulesIndex):
         super().__init__(
-            s3_settings_service,
             environment_service,
             sts_client,
-            mappings_collector
+            rules_index
         )
         # self.keep_where = {
         #     (EB_EVENT_SOURCE, ): set(self.eb_mapping.keys())
         # }
         self.keep_where = {
             (EB_DETAIL_TYPE,): {EB_CLOUDTRAIL_API_CALL_DETAIL_TYPE},
-            (EB_DETAIL, CT_EVENT_SOURCE): set(self.ct_mapping.keys()),
-            (EB_DETAIL, CT_EVENT_NAME): {
-                name for values in self.ct_mapping.values() for name in values
-            }
+            (EB_DETAIL, CT_EVENT_SOURCE): rules_index.ct_sources,
+            (EB_DETAIL, CT_EVENT_NAME): rules_index.ct_event_names
         }
         account_id = self.sts_client.get_account_id()
         if account_id != DEV:
@@ -397,9 +499,11 @@ class EventBridgeEventProcessor(BaseEventProcessor):
                 (EB_DETAIL, CT_USER_IDENTITY, CT_ACCOUNT_ID): {account_id, }
             }
 
-    def account_region_rule_map(self,
-                                it: Iterable[Dict]) -> AccountRegionRuleMap:
-        ref = {}
+    def account_region_rule_map(self, it: Iterable[Dict],
+                                ref: Optional[AccountRegionRuleMap] = None
+                                ) -> AccountRegionRuleMap:
+        if ref is None:
+            ref = {}
         for event in it:
             account_id = self.get_account_id(record=event)
             region = self.get_region(record=event)
@@ -410,6 +514,10 @@ class EventBridgeEventProcessor(BaseEventProcessor):
             _account_scope.setdefault(region, set()).update(rules)
         return ref
 
+    def update_rules_map(self, ref: AccountRegionRuleMap,
+                         it: Iterable[Dict]) -> AccountRegionRuleMap:
+        return self.account_region_rule_map(it, ref)
+
     @staticmethod
     def get_region(record: dict) -> Optional[str]:
         if CloudTrail.is_cloudtrail_api_call(record):
@@ -422,7 +530,7 @@ class EventBridgeEventProcessor(BaseEventProcessor):
             return CloudTrail.get_account_id(record.get(EB_DETAIL) or {})
         return record.get(EB_ACCOUNT_ID)
 
-    def get_rules(self, record: dict) -> set:
+    def get_rules(self, record: dict) -> frozenset:
         """
         Here we should consider EventBridge event with detail-type:
         "AWS API Call via CloudTrail". Such an event contains CloudTrail's
@@ -431,8 +539,7 @@ class EventBridgeEventProcessor(BaseEventProcessor):
         """
         if CloudTrail.is_cloudtrail_api_call(record):
             return CloudTrail.get_rules(record.get(EB_DETAIL) or {},
-                                        self.ct_mapping)
+                                        self.rules_index)
         # TODO EB source to list of rules is a temp solution I was able to
         #  make, but it would be better to use EB detail-type here
-        source = record.get(EB_EVENT_SOURCE)
-        return set(self.eb_mapping.get(source) or [])
+        return self.rules_index.eventbridge_rules(record.get(EB_EVENT_SOURCE))
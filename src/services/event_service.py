@@ -1,6 +1,10 @@
+import heapq
 import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
-from typing import Optional, Iterable
+from queue import Full, Queue
+from typing import Optional, Iterable, Iterator, Generator
 
 from helpers.log_helper import get_logger
 from helpers.time_helper import utc_datetime
@@ -10,6 +14,68 @@ from services.environment_service import EnvironmentService
 _LOG = get_logger(__name__)
 
 
+class PartitionsReader(Iterable[Event]):
+    """
+    Reads events of all the partitions concurrently and yields them ordered
+    by timestamp. Each partition is read by its own thread which stays
+    ahead of the consumer by at most `buffer_size` events. So pages of all
+    partitions are requested in parallel but memory is bounded. One thread
+    per partition is required: the merge needs the head of each one
+    """
+    _done = object()
+    __slots__ = ('_iters', '_buffer_size')
+
+    def __init__(self, iters: list[Iterable[Event]], buffer_size: int = 100):
+        self._iters = iters
+        self._buffer_size = max(buffer_size, 1)
+
+    @staticmethod
+    def _put(queue: Queue, item, stop: threading.Event) -> bool:
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _produce(self, it: Iterable[Event], queue: Queue,
+                 stop: threading.Event):
+        try:
+            for event in it:
+                if not self._put(queue, event, stop):
+                    return
+        except Exception as e:
+            self._put(queue, e, stop)
+        self._put(queue, self._done, stop)
+
+    def _consume(self, queue: Queue) -> Generator[Event, None, None]:
+        while True:
+            item = queue.get()
+            if item is self._done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def __iter__(self) -> Iterator[Event]:
+        if len(self._iters) <= 1:
+            yield from heapq.merge(*self._iters, key=lambda e: e.timestamp)
+            return
+        stop = threading.Event()
+        queues = [Queue(self._buffer_size) for _ in self._iters]
+        with ThreadPoolExecutor(len(self._iters)) as ex:
+            for it, queue in zip(self._iters, queues):
+                ex.submit(self._produce, it, queue, stop)
+            try:
+                yield from heapq.merge(
+                    *map(self._consume, queues),
+                    key=lambda e: e.timestamp
+                )
+            finally:
+                stop.set()
+
+
 class EventService:
     def __init__(self, environment_service: EnvironmentService):
         self._environment_service = environment_service
@@ -54,6 +120,23 @@ class EventService:
             page_size=page_size
         )
 
+    def get_all_events(self, since: Optional[float] = None,
+                       till: Optional[float] = None) -> Iterator[Event]:
+        """
+        Events of all the partitions ordered by timestamp.
+        since < Iterator[Event] <= till
+        :param since:
+        :param till:
+        :return:
+        """
+        env = self._environment_service
+        n = env.number_of_partitions_for_events()
+        _LOG.debug(f'Querying {n} partitions since: {since}, till: {till}')
+        return iter(PartitionsReader(
+            iters=[self.get_events(p, since, till) for p in range(n)],
+            buffer_size=env.event_assembler_pull_item_limit()
+        ))
+
     @classmethod
     def save(cls, event: Event):
         event.save()
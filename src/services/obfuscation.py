@@ -1,49 +1,96 @@
-import uuid
-from typing import TYPE_CHECKING
+import hashlib
+import secrets
+from typing import TYPE_CHECKING, Any
 
-from helpers import iter_values, flip_dict
+from helpers import iter_values
 
 if TYPE_CHECKING:
     from services.sharding import ShardsCollection
 
 
-def obfuscate_finding(finding: dict, dictionary_out: dict,
-                      dictionary: dict | None = None) -> dict:
+class Obfuscator:
     """
-    Changes the given finding in-place. Does not change dictionary but
-    writes into dictionary_out. Returns the same object that was given in
-    `finding` param
+    Derives aliases of values using keyed deterministic hash. The same value
+    always gets the same alias within one obfuscator (and within any
+    obfuscator with the same key) so nothing has to be shared to keep
+    aliases consistent. The dictionary contains only values that were
+    actually obfuscated: {"alias": "real value"}
+    """
+    __slots__ = '_key', '_aliases'
+
+    def __init__(self, key: bytes | None = None):
+        """
+        :param key: up to 64 bytes. Random key is generated by default so
+        that aliases are different for each obfuscator
+        """
+        self._key = key or secrets.token_bytes(32)
+        # real value -> alias. Keeps one alias object for repeated values.
+        # Values other than strings are keyed with their type because
+        # True == 1 and hash(True) == hash(1)
+        self._aliases = {}
+
+    @property
+    def dictionary(self) -> dict:
+        return {
+            alias: real if isinstance(real, str) else real[1]
+            for real, alias in self._aliases.items()
+        }
+
+    def _hash(self, value: Any) -> str:
+        h = hashlib.blake2b(
+            f'{type(value).__name__}:{value}'.encode(
+                'utf-8', 'surrogatepass'
+            ),
+            digest_size=16,
+            key=self._key
+        ).hexdigest()
+        return f'{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}'
+
+    def alias(self, value: Any) -> str:
+        """
+        Alias looks like uuid. Type is hashed as well, so 1 and '1' get
+        different aliases
+        :param value: str, int, bool or None
+        :return:
+        """
+        real = value if type(value) is str else (type(value), value)
+        alias = self._aliases.get(real)
+        if alias is None:
+            alias = self._aliases[real] = self._hash(value)
+        return alias
+
+
+def obfuscate_finding(finding: dict, obfuscator: Obfuscator) -> dict:
+    """
+    Changes the given finding in-place. Aliases of its values are written
+    to the obfuscator's dictionary. Returns the same object that was given
+    in `finding` param
     :param finding:
-    :param dictionary:
-    :param dictionary_out:
+    :param obfuscator:
     :return:
     """
-    dictionary = dictionary or {}
     gen = iter_values(finding)
+    alias = obfuscator.alias
     try:
         real = next(gen)
-        gen_id = uuid.uuid4
         while True:
-            alias = dictionary_out.setdefault(
-                real, dictionary.get(real) or str(gen_id())
-            )
-            real = gen.send(alias)
+            real = gen.send(alias(real))
     except StopIteration:
         pass
     return finding
 
 
 def obfuscate_collection(collection: 'ShardsCollection',
-                         dictionary_out: dict):
+                         obfuscator: Obfuscator):
     """
     Changes everything in place
     :param collection:
-    :param dictionary_out:
+    :param obfuscator:
     :return:
     """
     for part in collection.iter_parts():
         for res in part.resources:
-            obfuscate_finding(res, dictionary_out)
+            obfuscate_finding(res, obfuscator)
 
 
 def get_obfuscation_dictionary(collection: 'ShardsCollection') -> dict:
@@ -51,9 +98,8 @@ def get_obfuscation_dictionary(collection: 'ShardsCollection') -> dict:
     Basically the same as obfuscate_collection but does some additional
     boilerplate. I just cannot make up the right name for this function
     :param collection: changed in place
-    :return:
+    :return: {"alias": "real value"}
     """
-    dictionary = {}
-    obfuscate_collection(collection, dictionary)
-    flip_dict(dictionary)
-    return dictionary
+    obfuscator = Obfuscator()
+    obfuscate_collection(collection, obfuscator)
+    return obfuscator.dictionary
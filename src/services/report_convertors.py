@@ -1,10 +1,11 @@
 import csv
 import io
+import zlib
 from abc import ABC, abstractmethod
 from base64 import b64encode
 from datetime import datetime, timezone
 from functools import partial
-from typing import TYPE_CHECKING, Literal, TypedDict
+from typing import TYPE_CHECKING, Callable, Generator, Literal, TypedDict
 
 import msgspec
 from typing_extensions import NotRequired
@@ -36,10 +37,76 @@ class ShardCollectionDojoConvertor(ShardCollectionConvertor):
     """
     Subclass only for defect dojo convertors
     """
+    # encoded report is _prefix + b','.join(items) + _suffix
+    _prefix = b'['
+    _suffix = b']'
 
     @abstractmethod
     def convert(self, collection: 'ShardsCollection') -> dict | list: ...
 
+    @abstractmethod
+    def iter_items(
+        self,
+        collection: 'ShardsCollection',
+        resources: Callable[[str, dict], bool] | None = None,
+    ) -> Generator[dict, None, None]:
+        """
+        Yields report items one by one
+        :param collection:
+        :param resources: if given, only resources for which it returns
+        True are converted. Accepts policy name and resource
+        :return:
+        """
+
+    @staticmethod
+    def _select(
+        policy: str,
+        resources: list[dict],
+        predicate: Callable[[str, dict], bool] | None,
+    ) -> list[dict]:
+        if predicate is None:
+            return resources
+        return [res for res in resources if predicate(policy, res)]
+
+    @staticmethod
+    def test_index(policy: str, resource: dict, tests: int) -> int:
+        """
+        Stable across processes, unlike hash(). Resources are told apart
+        by their report fields only, so that a resource keeps its test
+        when its other attributes change
+        """
+        key = resource.get('arn') or resource.get('id')
+        if key is None:
+            key = f"{resource.get('namespace')}/{resource.get('name')}"
+        return zlib.crc32(f'{policy}:{key}'.encode()) % tests
+
+    def split(
+        self, collection: 'ShardsCollection', tests: int
+    ) -> Generator[bytes, None, None]:
+        """
+        Yields exactly the given number of encoded reports. Resources of
+        a policy are spread between reports by their ids, so each report
+        holds about 1/tests of the findings even if one policy prevails.
+        A resource always goes to the same report, so each of them can be
+        reimported to its own test without closing findings that just
+        moved to another one. Reports are built lazily one by one, empty
+        reports are yielded as well so that reimport closes the findings
+        that are resolved
+        :param collection:
+        :param tests: number of reports
+        :return:
+        """
+        encoder = msgspec.json.Encoder()
+        for i in range(tests):
+            items = self.iter_items(
+                collection,
+                lambda policy, res, i=i: self.test_index(
+                    policy, res, tests
+                ) == i
+            )
+            yield (self._prefix + b','.join(map(encoder.encode, items)) +
+                   self._suffix)
+
     @classmethod
     def from_scan_type(
         cls, scan_type: str, metadata: Metadata, **kwargs
@@ -86,6 +153,9 @@ class Findings(TypedDict):
 
 
 class ShardsCollectionGenericDojoConvertor(ShardCollectionDojoConvertor):
+    _prefix = b'{"findings":['
+    _suffix = b']}'
+
     def __init__(
         self,
         metadata: Metadata,
@@ -200,11 +270,21 @@ class ShardsCollectionGenericDojoConvertor(ShardCollectionDojoConvertor):
         return b64encode(buffer.getvalue().encode()).decode()
 
     def convert(self, collection: 'ShardsCollection') -> Findings:
-        findings = []
+        return {'findings': list(self.iter_items(collection))}
+
+    def iter_items(
+        self,
+        collection: 'ShardsCollection',
+        resources: Callable[[str, dict], bool] | None = None,
+    ) -> Generator[Finding, None, None]:
+        """
+        Attachments are built only when the finding is requested
+        """
         meta = collection.meta
 
         for part in collection.iter_parts():
-            if not part.resources:
+            selected = self._select(part.policy, part.resources, resources)
+            if not selected:
                 continue
             pm = meta.get(part.policy) or {}  # part meta
             p = part.policy
@@ -224,7 +304,7 @@ class ShardsCollectionGenericDojoConvertor(ShardCollectionDojoConvertor):
                         'files': [
                             {
                                 'title': f'{p}.xlsx',
-                                'data': self._make_xlsx_file(part.resources),
+                                'data': self._make_xlsx_file(selected),
                             }
                         ],
                     }
@@ -234,7 +314,7 @@ class ShardsCollectionGenericDojoConvertor(ShardCollectionDojoConvertor):
                         'files': [
                             {
                                 'title': f'{p}.json',
-                                'data': self._make_json_file(part.resources),
+                                'data': self._make_json_file(selected),
                             }
                         ],
                     }
@@ -244,31 +324,28 @@ class ShardsCollectionGenericDojoConvertor(ShardCollectionDojoConvertor):
                         'files': [
                             {
                                 'title': f'{p}.csv',
-                                'data': self._make_csv_file(part.resources),
+                                'data': self._make_csv_file(selected),
                             }
                         ],
                     }
                 case _:  # None or some unexpected
-                    table = self._make_table(part.resources)
+                    table = self._make_table(selected)
                     extra = {'description': f'{pm2.article}\n{table}'}
 
-            findings.append(
-                {
-                    'title': pm['description'] if 'description' in pm else p,
-                    'date': datetime.fromtimestamp(
-                        part.timestamp, tz=timezone.utc
-                    ).isoformat(),
-                    'severity': pm2.severity.value,
-                    'mitigation': pm2.remediation,
-                    'impact': pm2.impact,
-                    'references': self._make_references(pm2.standard),
-                    'tags': tags,
-                    'vuln_id_from_tool': p,
-                    'service': pm2.service,
-                    **extra,
-                }
-            )
-        return {'findings': findings}
+            yield {
+                'title': pm['description'] if 'description' in pm else p,
+                'date': datetime.fromtimestamp(
+                    part.timestamp, tz=timezone.utc
+                ).isoformat(),
+                'severity': pm2.severity.value,
+                'mitigation': pm2.remediation,
+                'impact': pm2.impact,
+                'references': self._make_references(pm2.standard),
+                'tags': tags,
+                'vuln_id_from_tool': p,
+                'service': pm2.service,
+                **extra,
+            }
 
 
 class ShardsCollectionCloudCustodianDojoConvertor(
@@ -323,11 +400,18 @@ class ShardsCollectionCloudCustodianDojoConvertor(
         )
 
     def convert(self, collection: 'ShardsCollection') -> list[Model]:
-        result = []
+        return list(self.iter_items(collection))
+
+    def iter_items(
+        self,
+        collection: 'ShardsCollection',
+        resources: Callable[[str, dict], bool] | None = None,
+    ) -> Generator[Model, None, None]:
         meta = collection.meta
 
         for part in collection.iter_parts():
-            if not part.resources:
+            selected = self._select(part.policy, part.resources, resources)
+            if not selected:
                 continue
             rule = part.policy
             pm = self.meta.rule(
@@ -347,14 +431,13 @@ class ShardsCollectionCloudCustodianDojoConvertor(
                 'tags': [part.location],
             }
             if self._rpf:
-                for res in part.resources:
-                    result.append(
-                        {**base, 'resources': filter_dict(res, REPORT_FIELDS)}
-                    )
+                for res in selected:
+                    yield {
+                        **base, 'resources': filter_dict(res, REPORT_FIELDS)
+                    }
             else:
-                base['resources'] = self._prepare_resources(part.resources)
-                result.append(base)
-        return result
+                base['resources'] = self._prepare_resources(selected)
+                yield base
 
 
 class ShardsCollectionDigestConvertor(ShardCollectionConvertor):
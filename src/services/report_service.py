@@ -1,16 +1,20 @@
+import operator
 import statistics
 from datetime import datetime
 from itertools import chain
-from typing import TypedDict, Generator, BinaryIO, cast
+from typing import TypedDict, Generator, BinaryIO, Iterable, cast
 
 import msgspec
 from modular_sdk.models.tenant import Tenant
 
+from helpers import urljoin
 from helpers.constants import Cloud, ReportFormat, PolicyErrorType
 from helpers.log_helper import get_logger
+from helpers.time_helper import utc_datetime
 from models.batch_results import BatchResults
 from models.job import Job
 from services.ambiguous_job_service import AmbiguousJob
+from services.cache import S3ObjectsCache
 from services.clients.s3 import S3Client, Json
 from services.environment_service import EnvironmentService
 from services.platform_service import Platform
@@ -56,6 +60,53 @@ class AverageStatisticsItem(TypedDict, total=False):
     average_resources_failed: int
 
 
+class StatisticsColumns(msgspec.Struct, kw_only=True):
+    """
+    Statistics items of many jobs kept column by column. One such object is
+    kept per tenant per month, so statistics of all the tenant's jobs can be
+    read at once instead of one file per job
+    """
+    job_id: list[str] = msgspec.field(default_factory=list)
+    policy: list[str] = msgspec.field(default_factory=list)
+    region: list[str] = msgspec.field(default_factory=list)
+    start: list[float] = msgspec.field(default_factory=list)
+    end: list[float] = msgspec.field(default_factory=list)
+    scanned: list[int | None] = msgspec.field(default_factory=list)
+    failed: list[int | None] = msgspec.field(default_factory=list)
+    error_type: list[str | None] = msgspec.field(default_factory=list)
+    api_calls: list[dict | None] = msgspec.field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.job_id)
+
+    def append(self, job_id: str, items: Iterable[StatisticsItem]) -> None:
+        for item in items:
+            self.job_id.append(job_id)
+            self.policy.append(item['policy'])
+            self.region.append(item['region'])
+            self.start.append(item['start_time'])
+            self.end.append(item['end_time'])
+            self.scanned.append(item.get('scanned_resources'))
+            self.failed.append(item.get('failed_resources'))
+            self.error_type.append(item.get('error_type'))
+            self.api_calls.append(item.get('api_calls'))
+
+    def extend(self, other: 'StatisticsColumns', rows: Iterable[int]
+               ) -> None:
+        """
+        Copies the given rows of another object to this one
+        """
+        for field in self.__struct_fields__:
+            column, source = getattr(self, field), getattr(other, field)
+            column.extend(source[i] for i in rows)
+
+    def rows_by_job(self) -> dict[str, list[int]]:
+        res = {}
+        for i, job_id in enumerate(self.job_id):
+            res.setdefault(job_id, []).append(i)
+        return res
+
+
 class ReportResponse:
     __slots__ = ('entity', 'content', 'fmt', 'dictionary_url')
 
@@ -92,27 +143,38 @@ class ReportResponse:
 
 
 class ReportService:
+    _columns_encoder = msgspec.json.Encoder()
+    _columns_decoder = msgspec.json.Decoder(type=StatisticsColumns)
+
     def __init__(self, s3_client: S3Client,
-                 environment_service: EnvironmentService):
+                 environment_service: EnvironmentService,
+                 shards_cache: S3ObjectsCache | None = None):
         self.s3_client = s3_client
         self.environment_service = environment_service
+        self.shards_cache = shards_cache
+
+    def _shards_io(self, key: str) -> ShardsS3IO:
+        return ShardsCollectionFactory.s3_io(
+            bucket=self.environment_service.default_reports_bucket_name(),
+            key=key,
+            client=self.s3_client,
+            concurrency=self.environment_service.shards_io_concurrency(),
+            indexed=self.environment_service.shards_indexed(),
+            cache=self.shards_cache
+        )
 
     def job_collection(self, tenant: Tenant, job: Job) -> ShardsCollection:
         collection = ShardsCollectionFactory.from_tenant(tenant)
-        collection.io = ShardsS3IO(
-            bucket=self.environment_service.default_reports_bucket_name(),
-            key=TenantReportsBucketKeysBuilder(tenant).job_result(job),
-            client=self.s3_client
+        collection.io = self._shards_io(
+            TenantReportsBucketKeysBuilder(tenant).job_result(job)
         )
         return collection
 
     def ed_job_collection(self, tenant: Tenant, br: BatchResults
                           ) -> ShardsCollection:
         collection = ShardsCollectionFactory.from_tenant(tenant)
-        collection.io = ShardsS3IO(
-            bucket=self.environment_service.default_reports_bucket_name(),
-            key=TenantReportsBucketKeysBuilder(tenant).ed_job_result(br),
-            client=self.s3_client
+        collection.io = self._shards_io(
+            TenantReportsBucketKeysBuilder(tenant).ed_job_result(br)
         )
         return collection
 
@@ -125,40 +187,63 @@ class ReportService:
     def ed_job_difference_collection(self, tenant: Tenant, br: BatchResults
                                      ) -> ShardsCollection:
         collection = ShardsCollectionFactory.from_tenant(tenant)
-        collection.io = ShardsS3IO(
-            bucket=self.environment_service.default_reports_bucket_name(),
-            key=TenantReportsBucketKeysBuilder(tenant).ed_job_difference(br),
-            client=self.s3_client
+        collection.io = self._shards_io(
+            TenantReportsBucketKeysBuilder(tenant).ed_job_difference(br)
         )
         return collection
 
     def tenant_latest_collection(self, tenant: Tenant) -> ShardsCollection:
         collection = ShardsCollectionFactory.from_tenant(tenant)
-        collection.io = ShardsS3IO(
-            bucket=self.environment_service.default_reports_bucket_name(),
-            key=TenantReportsBucketKeysBuilder(tenant).latest_key(),
-            client=self.s3_client
+        collection.io = self._shards_io(
+            TenantReportsBucketKeysBuilder(tenant).latest_key()
         )
         return collection
 
     def platform_latest_collection(self, platform: Platform
                                    ) -> ShardsCollection:
         collection = ShardsCollectionFactory.from_cloud(Cloud.KUBERNETES)
-        collection.io = ShardsS3IO(
-            bucket=self.environment_service.default_reports_bucket_name(),
-            key=PlatformReportsBucketKeysBuilder(platform).latest_key(),
-            client=self.s3_client
+        collection.io = self._shards_io(
+            PlatformReportsBucketKeysBuilder(platform).latest_key()
         )
         return collection
 
     def platform_job_collection(self, platform: Platform, job: Job
                                 ) -> ShardsCollection:
         collection = ShardsCollectionFactory.from_cloud(Cloud.KUBERNETES)
-        collection.io = ShardsS3IO(
+        collection.io = self._shards_io(
+            PlatformReportsBucketKeysBuilder(platform).job_result(job)
+        )
+        return collection
+
+    def snapshot_manifest(self, key: str) -> dict[str, str] | None:
+        """
+        Incremental snapshots have a manifest that maps names of its
+        objects to keys where they are actually stored. Snapshots that are
+        full copies do not have it
+        :param key: snapshot folder
+        :return: names mapped to keys
+        """
+        data = self.s3_client.gz_get_json(
             bucket=self.environment_service.default_reports_bucket_name(),
-            key=PlatformReportsBucketKeysBuilder(platform).job_result(job),
-            client=self.s3_client
+            key=urljoin(key, ReportsBucketKeysBuilder.manifest)
         )
+        if not data:
+            return
+        return {
+            name: item['key']
+            for name, item in data.get('objects', {}).items()
+        }
+
+    def tenant_collection(self, tenant: Tenant, key: str
+                          ) -> ShardsCollection:
+        """
+        Collection of the tenant by its key, e.g. latest or some snapshot
+        """
+        collection = ShardsCollectionFactory.from_tenant(tenant)
+        collection.io = self._shards_io(key)
+        builder = TenantReportsBucketKeysBuilder(tenant)
+        if key.startswith(builder.snapshots_folder()):
+            collection.io.manifest = self.snapshot_manifest(key)
         return collection
 
     def tenant_snapshot_collection(self, tenant: Tenant,
@@ -166,13 +251,7 @@ class ReportService:
         key = TenantReportsBucketKeysBuilder(tenant).nearest_snapshot_key(date)
         if not key:
             return
-        collection = ShardsCollectionFactory.from_tenant(tenant)
-        collection.io = ShardsS3IO(
-            bucket=self.environment_service.default_reports_bucket_name(),
-            key=key,
-            client=self.s3_client
-        )
-        return collection
+        return self.tenant_collection(tenant, key)
 
     def platform_snapshot_collection(self, platform: Platform, date: datetime
                                      ) -> ShardsCollection | None:
@@ -182,11 +261,8 @@ class ReportService:
         if not key:
             return
         collection = ShardsCollectionFactory.from_cloud(Cloud.KUBERNETES)
-        collection.io = ShardsS3IO(
-            bucket=self.environment_service.default_reports_bucket_name(),
-            key=key,
-            client=self.s3_client
-        )
+        collection.io = self._shards_io(key)
+        collection.io.manifest = self.snapshot_manifest(key)
         return collection
 
     def fetch_meta(self, tp: Tenant | Platform) -> dict:
@@ -208,6 +284,120 @@ class ReportService:
             return []
         return data
 
+    def tenant_job_statistics(self, customer: str, tenant: str,
+                              date: datetime) -> StatisticsColumns:
+        """
+        Returns statistics of tenant's jobs submitted within the month of
+        the given date
+        """
+        buf = self.s3_client.gz_get_object(
+            bucket=self.environment_service.get_statistics_bucket_name(),
+            key=StatisticsBucketKeysBuilder.tenant_job_statistics(
+                customer, tenant, date
+            )
+        )
+        if not buf:
+            return StatisticsColumns()
+        try:
+            return self._columns_decoder.decode(buf.getvalue())
+        except msgspec.ValidationError:
+            _LOG.warning(f'Invalid statistics columns of {tenant}')
+            return StatisticsColumns()
+
+    def put_tenant_job_statistics(self, customer: str, tenant: str,
+                                  date: datetime,
+                                  columns: StatisticsColumns) -> None:
+        self.s3_client.gz_put_object(
+            bucket=self.environment_service.get_statistics_bucket_name(),
+            key=StatisticsBucketKeysBuilder.tenant_job_statistics(
+                customer, tenant, date
+            ),
+            body=self._columns_encoder.encode(columns),
+            content_type='application/json'
+        )
+
+    def jobs_statistics(self, jobs: Iterable[Job | BatchResults | AmbiguousJob],
+                        compact: bool = False) -> StatisticsColumns:
+        """
+        Collects statistics of the given jobs reading one file per tenant
+        per month. Statistics of jobs that are not in those files
+        are read from the jobs' own files. Rows keep the order of jobs.
+        Executors write only their own per-job files, so columns files are
+        never changed concurrently by jobs
+        :param jobs:
+        :param compact: adds the statistics of missing jobs to the columns
+        files and writes each changed file once. Must be used by only one
+        writer at a time (metrics updater)
+        """
+        jobs = [j if isinstance(j, AmbiguousJob) else AmbiguousJob(j)
+                for j in jobs]
+        months = {}  # (customer, tenant, month) -> (columns, rows by job)
+        changed = {}  # (customer, tenant, month) -> date
+        res = StatisticsColumns()
+        for job in jobs:
+            date = utc_datetime(job.submitted_at)
+            key = (job.customer_name, job.tenant_name, date.strftime('%Y-%m'))
+            if key not in months:
+                columns = self.tenant_job_statistics(
+                    job.customer_name, job.tenant_name, date
+                )
+                months[key] = (columns, columns.rows_by_job())
+            columns, rows = months[key]
+            if job.id in rows:
+                res.extend(columns, rows[job.id])
+                continue
+            _LOG.debug(f'Job {job.id} is not in statistics columns')
+            items = self.job_statistics(job)
+            res.append(job.id, items)
+            if compact and items:
+                size = len(columns)
+                columns.append(job.id, items)
+                rows[job.id] = list(range(size, len(columns)))
+                changed[key] = date
+        for (customer, tenant, _), date in changed.items():
+            _LOG.info(f'Compacting statistics columns of {tenant}')
+            columns, _ = months[(customer, tenant, date.strftime('%Y-%m'))]
+            self.put_tenant_job_statistics(customer, tenant, date, columns)
+        return res
+
+    @staticmethod
+    def average_statistics_columns(columns: StatisticsColumns
+                                   ) -> Generator[dict, None, None]:
+        """
+        Produces the same as average_statistics but works column by column
+        """
+        groups = {}  # (policy, region) to rows
+        for i, key in enumerate(zip(columns.policy, columns.region)):
+            groups.setdefault(key, []).append(i)
+        executions = list(map(operator.sub, columns.end, columns.start))
+        scanned_column, failed_column = columns.scanned, columns.failed
+        error_column, api_column = columns.error_type, columns.api_calls
+        for key, rows in groups.items():
+            total_api_calls = {}
+            for i in rows:
+                for k, v in (api_column[i] or {}).items():
+                    total_api_calls[k] = total_api_calls.get(k, 0) + v
+            ex = [executions[i] for i in rows]
+            scanned = [v for i in rows if (v := scanned_column[i])] or [0]
+            failed = [v for i in rows if (v := failed_column[i])] or [0]
+            failed_invocations = sum(1 for i in rows if error_column[i])
+            yield {
+                'policy': key[0],
+                'region': key[1],
+                'invocations': len(rows),
+                'succeeded_invocations': len(rows) - failed_invocations,
+                'failed_invocations': failed_invocations,
+                'total_api_calls': total_api_calls,
+                'min_exec': min(ex),
+                'max_exec': max(ex),
+                'total_exec': sum(ex),
+                'average_exec': statistics.mean(ex),
+                'resources_failed': sum(failed),
+                'resources_scanned': sum(scanned),
+                'average_resources_scanned': statistics.mean(scanned),
+                'average_resources_failed': statistics.mean(failed),
+            }
+
     @staticmethod
     def average_statistics(*iterables: list[StatisticsItem]
                            ) -> Generator[dict, None, None]:
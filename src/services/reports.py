@@ -1,13 +1,17 @@
 import bisect
-from datetime import datetime
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from functools import cached_property, cmp_to_key
-from itertools import chain
 from typing import Generator, Iterable, Iterator, TypedDict, cast
 
+import msgspec
 from modular_sdk.models.customer import Customer
 from modular_sdk.models.tenant import Tenant
 
-from helpers import deep_get, filter_dict, hashable, iter_key_values
+from helpers import deep_get, filter_dict, fingerprint, iter_key_values
 from helpers.constants import (
     COMPOUND_KEYS_SEPARATOR,
     GLOBAL_REGION,
@@ -24,14 +28,22 @@ from helpers.reports import (
 )
 from helpers.time_helper import utc_datetime, utc_iso
 from models.metrics import ReportMetrics
-from services.ambiguous_job_service import AmbiguousJob
+from services.ambiguous_job_service import AmbiguousJob, AmbiguousJobService
 from services.base_data_service import BaseDataService
 from services.clients.s3 import S3Client, S3Url
 from services.environment_service import EnvironmentService
 from services.metadata import Metadata
 from services.report_service import ReportService
-from services.reports_bucket import ReportMetricsBucketKeysBuilder
-from services.sharding import ShardsCollection
+from services.reports_bucket import (
+    ReportMetricsBucketKeysBuilder,
+    TenantReportsBucketKeysBuilder,
+)
+from services.sharding import (
+    BaseShardPart,
+    ShardsCollection,
+    SingleShardDistributor,
+    fix_s3_regions,
+)
 
 _LOG = get_logger(__name__)
 
@@ -138,6 +150,7 @@ class JobMetricsDataSource:
 
 class ShardsCollectionDataSource:
     ResourcesGenerator = Generator[tuple[str, str, dict, float], None, None]
+    FingerprintedGenerator = Generator[tuple[str, str, int, dict], None, None]
 
     class PrettifiedFinding(TypedDict):
         policy: str
@@ -153,10 +166,13 @@ class ShardsCollectionDataSource:
         self._col = collection
         self._meta = metadata
 
-        self.__resources = None
+        self._fields = {}  # rule -> report fields
+        self.__aggregates = None
 
-    def iter_resources(self):
-        for part in self._col.iter_parts():
+    def iter_resources(self, parts: Iterable[BaseShardPart] | None = None):
+        if parts is None:
+            parts = self._col.iter_parts()
+        for part in parts:
             for res in part.resources:
                 yield part.policy, part.location, res, part.timestamp
 
@@ -202,12 +218,12 @@ class ShardsCollectionDataSource:
         emitted = {}
         for rule, region, dto, ts in it:
             _emitted = emitted.setdefault((rule, region), set())
-            _hashable = hashable(dto)
-            if _hashable in _emitted:
+            _fp = fingerprint(dto)
+            if _fp in _emitted:
                 _LOG.debug(f'Duplicate found for {rule}:{region}')
                 continue
             yield rule, region, dto, ts
-            _emitted.add(_hashable)
+            _emitted.add(_fp)
 
     def _custom_modify(self, it: ResourcesGenerator) -> ResourcesGenerator:
         """
@@ -244,7 +260,11 @@ class ShardsCollectionDataSource:
             yield rule, region, dto, ts
 
     def _report_fields(self, rule: str) -> set[str]:
-        return set(self._meta.rule(rule).report_fields) | REPORT_FIELDS
+        fields = self._fields.get(rule)
+        if fields is None:
+            fields = set(self._meta.rule(rule).report_fields) | REPORT_FIELDS
+            self._fields[rule] = fields
+        return fields
 
     def _keep_report_fields(
         self, it: ResourcesGenerator
@@ -268,8 +288,9 @@ class ShardsCollectionDataSource:
         deduplicated: bool = True,
         active_regions: tuple[str, ...] = (),
         resource_types: tuple[str, ...] = (),
+        parts: Iterable[BaseShardPart] | None = None,
     ) -> ResourcesGenerator:
-        it = self.iter_resources()
+        it = self.iter_resources(parts)
         it = self._custom_modify(it)
 
         if only_report_fields:
@@ -285,36 +306,105 @@ class ShardsCollectionDataSource:
             )
         return it
 
-    @property
-    def _resources(self) -> dict[str, dict[str, set]]:
+    class _Aggregates:
         """
-        Caching for private usage
+        Everything tenant-level reports need. Collected within one pass
+        over the collection
         """
-        if self.__resources is not None:
-            return self.__resources
-        # TODO: test how bad-performant is that..
-        it = self.create_resources_generator()
-        mapping = {}
+
+        __slots__ = (
+            'resources',
+            'unique',
+            'region_severity',
+            'resource_types',
+        )
+
+        def __init__(self):
+            # rule -> region -> fingerprint -> resource
+            self.resources: dict[str, dict[str, dict[int, dict]]] = {}
+            self.unique: set[int] = set()
+            # region -> severity -> fingerprints
+            self.region_severity: dict[str, dict[str, set[int]]] = {}
+            self.resource_types: dict[str, int] = {}
+
+    def _service(self, rule: str) -> str:
+        return self._meta.rule(rule).service or service_from_resource_type(
+            self._col.meta[rule]['resource']
+        )
+
+    def iter_fingerprinted(self) -> FingerprintedGenerator:
+        """
+        Yields resources with only report fields and their fingerprints.
+        Not deduplicated
+        """
+        it = self.create_resources_generator(deduplicated=False)
         for rule, region, dto, _ in it:
-            mapping.setdefault(rule, {}).setdefault(region, set()).add(
-                hashable(dto)
+            yield rule, region, fingerprint(dto), dto
+
+    def checkpoint_parts(self) -> Generator['CheckpointPart', None, None]:
+        """
+        Yields collection parts prepared for metrics one by one keeping
+        their policies and locations
+        """
+        for part in self._col.iter_parts():
+            it = self.create_resources_generator(
+                deduplicated=False, parts=(part,)
+            )
+            yield CheckpointPart(
+                policy=part.policy,
+                location=part.location,
+                timestamp=part.timestamp,
+                resources=[
+                    (region, fingerprint(dto), dto)
+                    for _, region, dto, _ in it
+                ],
+            )
+
+    @property
+    def _aggregates(self) -> _Aggregates:
+        """
+        Walks resources once and computes all the aggregates. Resources are
+        kept by their fingerprints so that unique counts work on integers.
+        Deduplication within rule and region happens here by the same
+        fingerprints
+        """
+        if self.__aggregates is not None:
+            return self.__aggregates
+        agg = self._Aggregates()
+        rules = {}  # rule -> (its resources, severity, service)
+        for rule, region, fp, dto in self.iter_fingerprinted():
+            info = rules.get(rule)
+            if info is None:
+                info = rules[rule] = (
+                    agg.resources.setdefault(rule, {}),
+                    self._meta.rule(rule).severity,
+                    self._service(rule),
+                )
+            by_region, severity, service = info
+            res = by_region.setdefault(region, {})
+            if fp in res:
+                continue
+            res[fp] = dto
+            agg.unique.add(fp)
+            agg.region_severity.setdefault(region, {}).setdefault(
+                severity, set()
+            ).add(fp)
+            agg.resource_types[service] = (
+                agg.resource_types.get(service, 0) + 1
             )
-        self.__resources = mapping
-        return mapping
+        self.__aggregates = agg
+        return agg
+
+    @property
+    def _resources(self) -> dict[str, dict[str, dict[int, dict]]]:
+        return self._aggregates.resources
 
     def clear(self):
-        self.__resources = None
+        self.__aggregates = None
 
-    @cached_property
+    @property
     def n_unique(self) -> int:
-        return len(
-            set(
-                chain.from_iterable(
-                    chain.from_iterable(d.values())
-                    for d in self._resources.values()
-                )
-            )
-        )
+        return len(self._aggregates.unique)
 
     def region_severities(
         self, unique: bool = True
@@ -341,14 +431,13 @@ class ShardsCollectionDataSource:
         number of unique resources and sum of resources by severities
         can clash
         """
-        region_severity = {}
-        for rule in self._resources:
-            severity = self._meta.rule(rule).severity
-            for region, res in self._resources[rule].items():
-                region_severity.setdefault(region, {}).setdefault(
-                    severity, set()
-                ).update(res)
+        region_severity = self._aggregates.region_severity
         if unique:
+            # keep_highest changes sets in place
+            region_severity = {
+                region: {sev: set(fps) for sev, fps in data.items()}
+                for region, data in region_severity.items()
+            }
             for region, data in region_severity.items():
                 keep_highest(
                     *[
@@ -381,14 +470,11 @@ class ShardsCollectionDataSource:
             rm = meta.get(rule, {})
             item = {
                 'policy': rule,
-                'resource_type': self._meta.rule(rule).service
-                or service_from_resource_type(
-                    self._col.meta[rule]['resource']
-                ),
+                'resource_type': self._service(rule),
                 'description': rm.get('description') or '',
                 'severity': self._meta.rule(rule).severity.value,
                 'resources': {
-                    region: list(res)
+                    region: list(res.values())
                     for region, res in self._resources[rule].items()
                 },
             }
@@ -396,15 +482,7 @@ class ShardsCollectionDataSource:
         return result
 
     def resource_types(self) -> dict[str, int]:
-        result = {}
-        for rule in self._resources:
-            rt = self._meta.rule(rule).service or service_from_resource_type(
-                self._col.meta[rule]['resource']
-            )
-            result.setdefault(rt, 0)
-            for res in self._resources[rule].values():
-                result[rt] += len(res)
-        return result
+        return dict(self._aggregates.resource_types)
 
     def finops(self) -> dict[str, list[dict]]:
         """
@@ -423,15 +501,12 @@ class ShardsCollectionDataSource:
             res.setdefault(ss, []).append(
                 {
                     'rule': self._col.meta[rule].get('description', rule),
-                    'service': rule_meta.service
-                    or service_from_resource_type(
-                        self._col.meta[rule]['resource']
-                    ),
+                    'service': self._service(rule),
                     'category': finops_category,
                     'severity': rule_meta.severity.value,
                     'resource_type': self._col.meta[rule]['resource'],
                     'resources': {
-                        region: list(res)
+                        region: list(res.values())
                         for region, res in self._resources[rule].items()
                     },
                 }
@@ -439,59 +514,435 @@ class ShardsCollectionDataSource:
         return res
 
 
+class CheckpointPart(msgspec.Struct, frozen=True):
+    """
+    Resources of one shard part prepared for metrics. Each resource is kept
+    with its final region and fingerprint
+    """
+    policy: str = msgspec.field(name='p')
+    location: str = msgspec.field(name='l')
+    timestamp: float = msgspec.field(name='t')
+    resources: list[tuple[str, int, dict]] = msgspec.field(
+        default_factory=list, name='r'
+    )
+
+
+class TenantMetricsCheckpoint(msgspec.Struct, kw_only=True):
+    """
+    Tenant resources prepared for metrics as of "until" timestamp. Parts are
+    kept by their policy and location, so parts of jobs finished later
+    replace them the same way they replace parts of the latest state.
+    Parts are stored in a separate file per location, listed in
+    "locations". Checkpoints written before that keep parts inline
+    """
+    version: str
+    until: float
+    built_at: float
+    meta: dict = msgspec.field(default_factory=dict)
+    parts: list[CheckpointPart] = msgspec.field(default_factory=list)
+    locations: list[str] = msgspec.field(default_factory=list)
+
+    def update(self, parts: Iterable[CheckpointPart], meta: dict
+               ) -> set[str]:
+        """
+        Puts the given parts. The one with higher timestamp is kept.
+        Returns locations of parts that have been replaced or added
+        """
+        index = {(p.policy, p.location): p for p in self.parts}
+        changed = set()
+        for part in parts:
+            key = (part.policy, part.location)
+            existing = index.get(key)
+            if existing and existing.timestamp > part.timestamp:
+                continue
+            index[key] = part
+            changed.add(part.location)
+        self.parts = list(index.values())
+        for rule, data in meta.items():
+            self.meta.setdefault(rule, {}).update(data)
+        return changed
+
+
+class CheckpointDataSource(ShardsCollectionDataSource):
+    """
+    Computes tenant aggregates from a checkpoint. Resources there are
+    already prepared, so they are not processed again
+    """
+
+    def __init__(
+        self, checkpoint: TenantMetricsCheckpoint, metadata: Metadata
+    ):
+        collection = ShardsCollection(SingleShardDistributor())
+        collection.meta = checkpoint.meta
+        super().__init__(collection, metadata)
+        self._checkpoint = checkpoint
+
+    def iter_fingerprinted(
+        self,
+    ) -> ShardsCollectionDataSource.FingerprintedGenerator:
+        for part in self._checkpoint.parts:
+            for region, fp, dto in part.resources:
+                yield part.policy, region, fp, dto
+
+
 class ShardsCollectionProvider:
     """
-    Caches collections for tenant and date
+    Caches collections for tenant and date. Can be used from multiple threads.
+    In case checkpoints service is given, data sources for the latest date
+    are built from tenant checkpoints instead of the latest collections
     """
 
-    __slots__ = '_rs', '_threshold', '_cache'
+    __slots__ = (
+        '_rs',
+        '_threshold',
+        '_metadata',
+        '_checkpoints',
+        '_version',
+        '_cache',
+        '_sources',
+        '_nearest',
+        '_lock',
+    )
 
     def __init__(
-        self, report_service: ReportService, threshold_seconds: int = 86400
+        self,
+        report_service: ReportService,
+        threshold_seconds: int = 86400,
+        metadata: Metadata | None = None,
+        checkpoints: 'MetricsCheckpointService | None' = None,
     ):
         self._rs = report_service
         # TODO: adjust the threshold and sync with shards snapshots
         self._threshold = threshold_seconds
+        self._metadata = metadata or Metadata.empty()
+        self._checkpoints = checkpoints
+        self._version = None
+        if checkpoints:
+            self._version = checkpoints.version(self._metadata)
         self._cache = {}
+        self._sources = {}
+        self._nearest = {}  # (tenant, date) -> snapshot key
+        self._lock = threading.Lock()
 
     def clear(self):
-        self._cache.clear()
+        with self._lock:
+            self._cache.clear()
+            self._sources.clear()
+            self._nearest.clear()
 
     def _is_latest(self, date: datetime) -> bool:
         now = utc_datetime()
         assert now >= date, 'Cannot possibly request future data'
         return (now - date).seconds <= self._threshold
 
+    def _key(self, tenant: Tenant, date: datetime
+             ) -> tuple[str, str | None]:
+        """
+        Dates are normalized to the keys of collections that are actually
+        read, so different dates that resolve to the same snapshot share
+        the cached collection. None means that there is no snapshot
+        """
+        builder = TenantReportsBucketKeysBuilder(tenant)
+        if self._is_latest(date):
+            return tenant.name, builder.latest_key()
+        with self._lock:
+            if (tenant.name, date) in self._nearest:
+                return tenant.name, self._nearest[(tenant.name, date)]
+        key = builder.nearest_snapshot_key(date)
+        with self._lock:
+            self._nearest[(tenant.name, date)] = key
+        return tenant.name, key
+
     def get_for_tenant(
         self, tenant: Tenant, date: datetime
     ) -> ShardsCollection | None:
         """
         Returns already fetched collection
         """
-        is_latest = self._is_latest(date)
-        if is_latest:
-            key = (tenant.name, None)
-        else:
-            key = (tenant.name, date)
+        key = self._key(tenant, date)
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+        if key[1] is None:
+            return
 
-        if key in self._cache:
-            return self._cache[key]
+        col = self._rs.tenant_collection(tenant, key[1])
+        col.fetch_all()
+        col.fetch_meta()
+        with self._lock:
+            return self._cache.setdefault(key, col)
 
-        if is_latest:
-            col = self._rs.tenant_latest_collection(tenant)
+    def get_source_for_tenant(
+        self, tenant: Tenant, date: datetime
+    ) -> ShardsCollectionDataSource | None:
+        """
+        Returns data source for the tenant's findings. It's cached, so
+        all the reports for the tenant reuse its aggregates
+        """
+        key = self._key(tenant, date)
+        with self._lock:
+            if key in self._sources:
+                return self._sources[key]
+
+        if self._checkpoints and self._is_latest(date):
+            source = self._checkpoints.get_source(
+                tenant, self._metadata, self._version
+            )
         else:
-            # TODO: cache for actual nearest key instead of given date in case
-            #  we can have slightly different incoming "date". If the parameter
-            #  most likely to be the same, we better keep it as is.
-            col = self._rs.tenant_snapshot_collection(tenant, date)
+            col = self.get_for_tenant(tenant, date)
+            if col is None:
+                return
+            source = ShardsCollectionDataSource(col, self._metadata)
+        with self._lock:
+            return self._sources.setdefault(key, source)
+
+    def prefetch(self, tenants: Iterable[Tenant], date: datetime,
+                 concurrency: int = 1) -> None:
+        """
+        Fetches findings of the given tenants beforehand using a pool of
+        threads. Failure of one tenant does not affect others: it's logged
+        and None is cached for the tenant, so that it's not fetched again
+        :param tenants:
+        :param date:
+        :param concurrency: max number of tenants fetched at once
+        """
+        tenants = {t.name: t for t in tenants}
+        keys = {name: self._key(t, date) for name, t in tenants.items()}
+        with self._lock:
+            tenants = {
+                name: t for name, t in tenants.items()
+                if keys[name] not in self._sources
+            }
+        if not tenants:
+            return
+
+        def fetch(tenant: Tenant):
+            try:
+                self.get_source_for_tenant(tenant, date)
+            except Exception:
+                _LOG.exception(f'Cannot fetch findings for {tenant.name}')
+                key = self._key(tenant, date)
+                with self._lock:
+                    self._cache.setdefault(key, None)
+                    self._sources[key] = None
+
+        _LOG.info(f'Prefetching collections for {len(tenants)} tenant(s)')
+        with ThreadPoolExecutor(max(concurrency, 1)) as ex:
+            for _ in ex.map(fetch, tenants.values()):
+                pass
+
+
+class MetricsCheckpointService:
+    """
+    Keeps tenant metrics checkpoints next to report metrics. A checkpoint is
+    updated with results of jobs finished after it instead of processing
+    the whole latest state again. It's rebuilt from the latest state in
+    case it's missing, metadata has changed or it's just old enough
+    """
+
+    __slots__ = ('_s3', '_env', '_rs', '_ajs')
+
+    format_version = '1'
+    rebuild_after = 7 * 86400
+    # jobs are queried by submitted_at, but applied by stopped_at
+    job_lookback = 86400
+    # re-applying a job is harmless, so some overlap saves from missing
+    # jobs which stopped_at was set slightly before they were saved
+    overlap = 300
 
-        if col is None:
+    _encoder = msgspec.json.Encoder()
+    _decoder = msgspec.json.Decoder(type=TenantMetricsCheckpoint)
+    _parts_decoder = msgspec.json.Decoder(type=list[CheckpointPart])
+
+    def __init__(
+        self,
+        s3_client: S3Client,
+        environment_service: EnvironmentService,
+        report_service: ReportService,
+        ambiguous_job_service: AmbiguousJobService,
+    ):
+        self._s3 = s3_client
+        self._env = environment_service
+        self._rs = report_service
+        self._ajs = ambiguous_job_service
+
+    def version(self, metadata: Metadata) -> str:
+        """
+        Checkpoint keeps only report fields of resources, so it must be
+        rebuilt once metadata changes
+        """
+        digest = hashlib.blake2b(
+            msgspec.msgpack.encode(metadata), digest_size=8
+        ).hexdigest()
+        return f'{self.format_version}:{digest}'
+
+    def get(self, tenant: Tenant) -> TenantMetricsCheckpoint | None:
+        """
+        Reads the checkpoint with parts of all its locations
+        """
+        bucket = self._env.default_reports_bucket_name()
+        buf = self._s3.gz_get_object(
+            bucket=bucket,
+            key=ReportMetricsBucketKeysBuilder.checkpoint_key(
+                tenant.customer_name, tenant.name
+            ),
+        )
+        if not buf:
             return
+        try:
+            checkpoint = self._decoder.decode(buf.getvalue())
+            for location in checkpoint.locations:
+                buf = self._s3.gz_get_object(
+                    bucket=bucket,
+                    key=ReportMetricsBucketKeysBuilder.checkpoint_parts_key(
+                        tenant.customer_name, tenant.name, location
+                    ),
+                )
+                if not buf:
+                    _LOG.warning(f'Metrics checkpoint of {tenant.name} '
+                                 f'misses parts of {location}')
+                    return
+                checkpoint.parts.extend(
+                    self._parts_decoder.decode(buf.getvalue())
+                )
+        except msgspec.ValidationError:
+            _LOG.warning(f'Invalid metrics checkpoint of {tenant.name}')
+            return
+        return checkpoint
 
+    def save(self, tenant: Tenant, checkpoint: TenantMetricsCheckpoint,
+             locations: Iterable[str] | None = None):
+        """
+        Writes parts of the given locations and the checkpoint itself
+        without parts. So, only changed locations are uploaded after jobs
+        are applied
+        :param tenant:
+        :param checkpoint:
+        :param locations: all by default
+        """
+        bucket = self._env.default_reports_bucket_name()
+        by_location = {}
+        for part in checkpoint.parts:
+            by_location.setdefault(part.location, []).append(part)
+        if locations is None:
+            locations = by_location.keys()
+        else:  # checkpoints with inline parts have no files yet
+            locations = set(locations).union(
+                by_location.keys() - set(checkpoint.locations)
+            )
+        for location in locations:
+            self._s3.gz_put_object(
+                bucket=bucket,
+                key=ReportMetricsBucketKeysBuilder.checkpoint_parts_key(
+                    tenant.customer_name, tenant.name, location
+                ),
+                body=self._encoder.encode(by_location.get(location, [])),
+                content_type='application/json',
+            )
+        self._s3.gz_put_object(
+            bucket=bucket,
+            key=ReportMetricsBucketKeysBuilder.checkpoint_key(
+                tenant.customer_name, tenant.name
+            ),
+            body=self._encoder.encode(msgspec.structs.replace(
+                checkpoint, parts=[], locations=sorted(by_location)
+            )),
+            content_type='application/json',
+        )
+        checkpoint.locations = sorted(by_location)
+
+    @staticmethod
+    def checkpoint_parts(
+        col: ShardsCollection, metadata: Metadata
+    ) -> Generator[CheckpointPart, None, None]:
+        """
+        Fixes regions of s3 parts the same way the executor does it for
+        the latest state, so that checkpoint updated with jobs is the same
+        as the one built from the latest state
+        """
+        fix_s3_regions(col)
+        return ShardsCollectionDataSource(col, metadata).checkpoint_parts()
+
+    def build(
+        self, tenant: Tenant, metadata: Metadata, version: str
+    ) -> TenantMetricsCheckpoint:
+        """
+        Builds a checkpoint from the tenant's latest state
+        """
+        _LOG.info(f'Building metrics checkpoint for {tenant.name}')
+        until = time.time()
+        col = self._rs.tenant_latest_collection(tenant)
         col.fetch_all()
         col.fetch_meta()
-        self._cache[key] = col
-        return col
+        return TenantMetricsCheckpoint(
+            version=version,
+            until=until,
+            built_at=until,
+            meta=col.meta,
+            parts=list(self.checkpoint_parts(col, metadata)),
+        )
+
+    def apply_jobs(
+        self,
+        tenant: Tenant,
+        metadata: Metadata,
+        checkpoint: TenantMetricsCheckpoint,
+    ) -> set[str] | None:
+        """
+        Updates the checkpoint with results of jobs finished after it.
+        Returns locations of changed parts or None if no jobs were applied
+        """
+        now = time.time()
+        since = checkpoint.until - self.overlap
+        jobs = self._ajs.to_ambiguous(
+            self._ajs.get_by_tenant_name(
+                tenant_name=tenant.name,
+                status=JobState.SUCCEEDED,
+                start=datetime.fromtimestamp(
+                    since - self.job_lookback, tz=timezone.utc
+                ),
+                ascending=True,
+            )
+        )
+        changed = None
+        for job in jobs:  # ascending, so newer parts win ties
+            if not job.stopped_at:
+                continue
+            if utc_datetime(job.stopped_at).timestamp() < since:
+                continue
+            _LOG.debug(f'Applying job {job.id} to metrics checkpoint')
+            col = self._rs.ambiguous_job_collection(tenant, job)
+            col.fetch_all()
+            col.fetch_meta()
+            locations = checkpoint.update(
+                self.checkpoint_parts(col, metadata), col.meta
+            )
+            changed = locations if changed is None else changed | locations
+        if changed is not None:
+            checkpoint.until = now
+        return changed
+
+    def get_source(
+        self, tenant: Tenant, metadata: Metadata, version: str | None = None
+    ) -> CheckpointDataSource:
+        """
+        Returns data source built from the tenant's checkpoint that is
+        brought up to date
+        """
+        version = version or self.version(metadata)
+        checkpoint = self.get(tenant)
+        if (
+            checkpoint is None
+            or checkpoint.version != version
+            or time.time() - checkpoint.built_at > self.rebuild_after
+        ):
+            checkpoint = self.build(tenant, metadata, version)
+            self.save(tenant, checkpoint)
+            return CheckpointDataSource(checkpoint, metadata)
+        changed = self.apply_jobs(tenant, metadata, checkpoint)
+        if changed is not None:
+            self.save(tenant, checkpoint, changed)
+        return CheckpointDataSource(checkpoint, metadata)
 
 
 class ReportMetricsService(BaseDataService[ReportMetrics]):
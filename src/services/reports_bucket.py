@@ -45,6 +45,7 @@ class ReportsBucketKeysBuilder(ABC):
     ed = 'event-driven/'
     result = 'result/'
     difference = 'difference/'
+    manifest = 'manifest.json'  # of incremental snapshots, written with .gz
 
     @staticmethod
     def urljoin(*args) -> str:
@@ -302,6 +303,8 @@ class StatisticsBucketKeysBuilder:
     _tenant_statistics = 'tenant-statistics/'
     _rules = 'rules/'
     _diagnostic = 'diagnostic/'
+    _tenants = 'tenants/'
+    _columns_file = 'statistics-columns.json'
 
     @classmethod
     def job_statistics(cls, job: Job | BatchResults) -> str:
@@ -311,6 +314,24 @@ class StatisticsBucketKeysBuilder:
             )
         return urljoin(cls._statistics, cls._ed, job.id, cls._statistics_file)
 
+    @classmethod
+    def tenant_job_statistics(cls, customer: str, tenant: str,
+                              date: datetime) -> str:
+        """
+        Statistics of all tenant's jobs submitted within the month of the
+        given date
+        """
+        return urljoin(
+            cls._statistics,
+            cls._tenants,
+            customer,
+            tenant,
+            date.strftime(
+                ReportsBucketKeysBuilder.date_delimiter.join(('%Y', '%m'))
+            ),
+            cls._columns_file,
+        )
+
     @classmethod
     def report_statistics(cls, now: datetime, customer: str) -> str:
         return urljoin(
@@ -370,6 +391,9 @@ class ReportMetricsBucketKeysBuilder:
     date_delimiter = '-'
     prefix = 'metrics/'
     data = 'data.json.gz'
+    checkpoints = 'checkpoints/'
+    checkpoint = 'checkpoint.json'
+    parts = 'parts'
 
     @staticmethod
     def datetime(end: datetime) -> str:
@@ -404,6 +428,26 @@ class ReportMetricsBucketKeysBuilder:
             cls.data,
         )
 
+    @classmethod
+    def checkpoint_key(cls, customer: str, tenant: str) -> str:
+        """
+        Checkpoint of tenant aggregates. Written with .gz extension
+        """
+        return urljoin(
+            cls.prefix, customer, cls.checkpoints, tenant, cls.checkpoint
+        )
+
+    @classmethod
+    def checkpoint_parts_key(cls, customer: str, tenant: str,
+                             location: str) -> str:
+        """
+        Checkpoint parts of one location. Written with .gz extension
+        """
+        return urljoin(
+            cls.prefix, customer, cls.checkpoints, tenant, cls.parts,
+            f'{location}.json'
+        )
+
 
 class ReportMetaBucketsKeys:
     __slots__ = ()
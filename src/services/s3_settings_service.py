@@ -1,3 +1,4 @@
+import gzip
 import importlib
 import json
 from pathlib import PurePosixPath
@@ -40,6 +41,30 @@ class S3SettingsService:
             key=self.key_from_name(key)
         )
 
+    def get_if_changed(self, key: S3SettingKey | str,
+                       etag: str | None = None,
+                       bucket_name: str = None
+                       ) -> tuple[dict | None, str] | None:
+        """
+        Downloads the setting only if its ETag differs from the given one
+        :return: (data, ETag). Data is None if the setting has not changed.
+        None if the setting does not exist
+        """
+        if isinstance(key, S3SettingKey):
+            key = key.value
+        res = self._s3.get_object_if_none_match(
+            bucket=bucket_name or self.bucket_name,
+            key=self.key_from_name(key),
+            etag=etag
+        )
+        if res is None:
+            return
+        body, etag = res
+        if body is None:
+            return None, etag
+        with gzip.GzipFile(fileobj=body, mode='rb') as gz:
+            return json.load(gz), etag
+
     def set(self, key: S3SettingKey | str, data: dict,
             bucket_name: str = None):
         if isinstance(key, S3SettingKey):
@@ -134,3 +159,16 @@ class S3SettingsServiceLocalWrapper:
         if imported:
             return imported
         return self._s3_setting_service.get(key)
+
+    def get_if_changed(self, key: S3SettingKey, etag: str | None = None
+                       ) -> tuple[dict | None, str] | None:
+        """
+        Settings from lambda's code never change, so they have a constant
+        ETag
+        """
+        imported = self._import(key.value)
+        if imported:
+            if etag == self.data_attr:
+                return None, etag
+            return imported, self.data_attr
+        return self._s3_setting_service.get_if_changed(key, etag)
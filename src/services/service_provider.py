@@ -41,7 +41,8 @@ if TYPE_CHECKING:
     from services.rbac_service import RoleService, PolicyService
     from services.clients.step_function import ScriptClient, StepFunctionClient
     from services.chronicle_service import ChronicleInstanceService
-    from services.reports import ReportMetricsService
+    from services.reports import MetricsCheckpointService, ReportMetricsService
+    from services.cache import S3ObjectsCache
     from services.metadata import MetadataProvider
 
 
@@ -62,6 +63,20 @@ class ServiceProvider(metaclass=SingletonMeta):
             return S3Client.factory().build_minio()
         return S3Client.factory().build_s3(env.aws_region())
 
+    @cached_property
+    def shards_cache(self) -> 'S3ObjectsCache | None':
+        from services.cache import S3ObjectsCache
+        env = self.environment_service
+        memory = env.shards_cache_memory_size()
+        disk = env.shards_cache_disk_size()
+        if not memory and not disk:
+            return
+        return S3ObjectsCache(
+            memory_size=memory,
+            disk_size=disk,
+            directory=env.shards_cache_dir()
+        )
+
     @cached_property
     def ssm(self) -> 'CachedSSMClient':
         from services.clients.ssm import VaultSSMClient, SSMClient, CachedSSMClient
@@ -266,6 +281,7 @@ class ServiceProvider(metaclass=SingletonMeta):
         return ReportService(
             s3_client=self.s3,
             environment_service=self.environment_service,
+            shards_cache=self.shards_cache,
         )
 
     @cached_property
@@ -337,6 +353,16 @@ class ServiceProvider(metaclass=SingletonMeta):
             environment_service=self.environment_service
         )
 
+    @cached_property
+    def metrics_checkpoint_service(self) -> 'MetricsCheckpointService':
+        from services.reports import MetricsCheckpointService
+        return MetricsCheckpointService(
+            s3_client=self.s3,
+            environment_service=self.environment_service,
+            report_service=self.report_service,
+            ambiguous_job_service=self.ambiguous_job_service
+        )
+
     @cached_property
     def metadata_provider(self) -> 'MetadataProvider':
         from services.metadata import MetadataProvider
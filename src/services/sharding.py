@@ -1,28 +1,42 @@
+import gzip
 import io
+import os
+import shutil
 import tempfile
+import threading
 import time
+import zlib
 from abc import ABC, abstractmethod
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import chain
 from pathlib import PurePosixPath
 from typing import (
     BinaryIO,
+    Callable,
+    ClassVar,
     Generator,
     Iterable,
     Iterator,
     TYPE_CHECKING,
     TypedDict,
-    cast,
 )
 
 import msgspec
+from botocore.exceptions import ClientError
 
-from helpers import hashable
+from helpers import fingerprint
 from helpers.constants import Cloud, GLOBAL_REGION
+from helpers.log_helper import get_logger
 from services.clients.s3 import S3Client
 
 if TYPE_CHECKING:
     from modular_sdk.models.tenant import Tenant
 
+    from services.cache import S3ObjectsCache
+
+_LOG = get_logger(__name__)
+
 # do not change the order, just append new regions. This collection is only
 # for shards distributor
 AWS_REGIONS = (
@@ -42,6 +56,21 @@ class ShardPartDict(TypedDict):
     l: str  # region
     r: list[dict]  # resources
     t: float  # timestamp
+    h: list[int]  # resources digests, can be empty
+
+
+class ShardsLayout(TypedDict):
+    distributor: str
+    shards: int
+
+
+class StoredShardsLayout(ShardsLayout):
+    """
+    Kept in layout.json next to meta.json. Collections without it are
+    considered to be written with the default layout of their cloud
+    """
+    offset: int  # number of the file of the first shard
+    sizes: list[int]  # number of resources in each shard
 
 
 class BaseShardPart:
@@ -58,6 +87,7 @@ class BaseShardPart:
     location: str
     resources: list[dict]
     timestamp: float
+    digests: list[int]
 
     def drop(self): ...
 
@@ -69,15 +99,172 @@ class BaseShardPart:
             'p': self.policy,
             'l': self.location,
             'r': self.resources,
-            't': self.timestamp
+            't': self.timestamp,
+            'h': self.digests
         }
 
+    def encode(self, encoder: msgspec.json.Encoder) -> bytes:
+        """
+        Returns json representation of this part
+        """
+        return encoder.encode(self.serialize())
+
+    def resource_digests(self) -> list[int]:
+        """
+        Digests of resources in the same order as resources. Parts that
+        were written before digests were introduced do not have them, so
+        they are calculated here. The same happens if resources were
+        changed after digests had been calculated
+        """
+        if len(self.digests) == len(self.resources):
+            return self.digests
+        return [fingerprint(res) for res in self.resources]
+
+    def iter_with_digests(self) -> Iterator[tuple[dict, int]]:
+        resources = self.resources
+        digests = self.digests
+        if len(digests) != len(resources):
+            digests = map(fingerprint, resources)
+        return zip(resources, digests)
+
+    def resources_number(self) -> int:
+        return len(self.resources)
+
 
 class ShardPart(msgspec.Struct, BaseShardPart, frozen=True):
     policy: str = msgspec.field(name='p')
     location: str = msgspec.field(name='l', default=GLOBAL_REGION)
     timestamp: float = msgspec.field(default_factory=time.time, name='t')
     resources: list[dict] = msgspec.field(default_factory=list, name='r')
+    digests: list[int] = msgspec.field(default_factory=list, name='h')
+
+    def encode(self, encoder: msgspec.json.Encoder) -> bytes:
+        return encoder.encode(self)
+
+    @classmethod
+    def with_digests(cls, policy: str, location: str,
+                     resources: list[dict], **kwargs) -> 'ShardPart':
+        """
+        Builds a part calculating digests of the given resources. Digests
+        are persisted together with the part, so dedup and diff can
+        compare integers instead of whole resources
+        """
+        return cls(
+            policy=policy,
+            location=location,
+            resources=resources,
+            digests=[fingerprint(res) for res in resources],
+            **kwargs
+        )
+
+
+class _PartDigests(msgspec.Struct):
+    """
+    Decodes only digests from encoded part
+    """
+    digests: list[int] = msgspec.field(default_factory=list, name='h')
+
+
+class ShardPartsSpill:
+    """
+    Append-only temporary file with encoded shard parts. A collection that
+    has a spill keeps only parts' attributes in memory and decodes resources
+    when they are requested. So, memory is bounded by the largest part
+    instead of the whole collection. Reads are positional and can be done
+    from multiple threads
+    """
+    __slots__ = ('_file', '_size', '_lock', '_encoder', '_decoder',
+                 '_digests_decoder')
+
+    def __init__(self, directory: str | None = None):
+        self._file = tempfile.TemporaryFile(dir=directory)
+        self._size = 0
+        self._lock = threading.Lock()
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder(type=ShardPart)
+        self._digests_decoder = msgspec.json.Decoder(type=_PartDigests)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def put(self, part: BaseShardPart) -> 'SpilledShardPart':
+        data = part.encode(self._encoder)
+        with self._lock:
+            offset = self._size
+            os.pwrite(self._file.fileno(), data, offset)
+            self._size += len(data)
+        return SpilledShardPart(
+            spill=self,
+            offset=offset,
+            length=len(data),
+            policy=part.policy,
+            location=part.location,
+            timestamp=part.timestamp,
+            number=part.resources_number()
+        )
+
+    def read_raw(self, offset: int, length: int) -> bytes:
+        return os.pread(self._file.fileno(), length, offset)
+
+    def read(self, offset: int, length: int) -> ShardPart:
+        return self._decoder.decode(self.read_raw(offset, length))
+
+    def read_digests(self, offset: int, length: int) -> list[int]:
+        return self._digests_decoder.decode(
+            self.read_raw(offset, length)
+        ).digests
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class SpilledShardPart(BaseShardPart):
+    """
+    Shard part which resources live in a spill file. They are decoded
+    each time they are accessed and are not kept, so better access them
+    once
+    """
+    __slots__ = ('policy', 'location', 'timestamp', '_spill', '_offset',
+                 '_length', '_number')
+
+    def __init__(self, spill: ShardPartsSpill, offset: int, length: int,
+                 policy: str, location: str, timestamp: float,
+                 number: int = 0):
+        self._spill = spill
+        self._offset = offset
+        self._length = length
+        self._number = number
+        self.policy = policy
+        self.location = location
+        self.timestamp = timestamp
+
+    @property
+    def resources(self) -> list[dict]:
+        return self._spill.read(self._offset, self._length).resources
+
+    @property
+    def digests(self) -> list[int]:
+        return self._spill.read_digests(self._offset, self._length)
+
+    def load(self) -> ShardPart:
+        return self._spill.read(self._offset, self._length)
+
+    def resource_digests(self) -> list[int]:
+        # resources are not decoded if digests exist
+        if len(self.digests) == self._number:
+            return self.digests
+        return self.load().resource_digests()
+
+    def iter_with_digests(self) -> Iterator[tuple[dict, int]]:
+        return self.load().iter_with_digests()
+
+    def resources_number(self) -> int:
+        return self._number
+
+    def encode(self, encoder: msgspec.json.Encoder) -> bytes:
+        # already encoded, resources are not decoded here
+        return self._spill.read_raw(self._offset, self._length)
 
 
 class Shard(Iterable[BaseShardPart]):
@@ -141,8 +328,18 @@ class ShardDataDistributor(ABC):
     Defines logic how we must distribute parts between shards. We always have
     N shards and some trait based on which we must assign a piece of data to
     a shard.
-    This class knows how and based on what attributes to distribute
+    This class knows how and based on what attributes to distribute.
+    Each implementation has a unique name that is kept in shards layout
+    and the names of attributes the distribution depends on
     """
+    name: ClassVar[str]
+    attributes: ClassVar[tuple[str, ...]] = ()
+    _registry: ClassVar[dict[str, type['ShardDataDistributor']]] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if 'name' in cls.__dict__:
+            ShardDataDistributor._registry[cls.name] = cls
 
     def __init__(self, n: int = 1):
         self._n = n
@@ -151,6 +348,16 @@ class ShardDataDistributor(ABC):
     def shards_number(self) -> int:
         return self._n
 
+    def layout(self) -> ShardsLayout:
+        return {'distributor': self.name, 'shards': self._n}
+
+    @classmethod
+    def from_layout(cls, layout: ShardsLayout) -> 'ShardDataDistributor':
+        klass = cls._registry.get(layout.get('distributor'))
+        if not klass:
+            raise ValueError(f'Unknown shards layout: {layout}')
+        return klass(int(layout.get('shards') or 1))
+
     @abstractmethod
     def distribute(self, **kwargs) -> int:
         """
@@ -179,6 +386,18 @@ class ShardDataDistributor(ABC):
         """
         return self.distribute(**self.key(part))
 
+    def indexes(self, **kwargs) -> Iterable[int]:
+        """
+        Returns shards that can contain data with the given attributes.
+        All the shards are returned if some attribute the distribution
+        depends on is not provided. Unknown attributes are ignored
+        :param kwargs:
+        :return:
+        """
+        if not all(a in kwargs for a in self.attributes):
+            return range(self._n)
+        return (self.distribute(**{a: kwargs[a] for a in self.attributes}),)
+
 
 class SingleShardDistributor(ShardDataDistributor):
     """
@@ -187,6 +406,7 @@ class SingleShardDistributor(ShardDataDistributor):
     probably won't be efficient to distribute those by regions, because we
     will spend more money on S3 requests than could save on traffic
     """
+    name = 'single'
 
     def key(self, part: BaseShardPart) -> dict:
         return {}
@@ -203,6 +423,8 @@ class AWSRegionDistributor(ShardDataDistributor):
     consistent must update it each time. So in order not to download the
     whole data from S3 each time - we can make this distribution.
     """
+    name = 'aws-region'
+    attributes = ('region',)
     regions = {r: i for i, r in enumerate([GLOBAL_REGION, *AWS_REGIONS])}
 
     def key(self, part: BaseShardPart) -> dict:
@@ -220,6 +442,42 @@ class AWSRegionDistributor(ShardDataDistributor):
         return index % self._n
 
 
+class LocationHashDistributor(ShardDataDistributor):
+    """
+    Distributes parts by a stable hash of their location. Is used for
+    large azure subscriptions which resources are resolved to their real
+    locations, so findings of one region still can be fetched separately
+    """
+    name = 'location-hash'
+    attributes = ('region',)
+
+    def key(self, part: BaseShardPart) -> dict:
+        return dict(region=part.location)
+
+    def distribute(self, region: str) -> int:
+        return zlib.crc32(region.encode()) % self._n
+
+
+class PolicyHashDistributor(ShardDataDistributor):
+    """
+    Distributes parts by a stable hash of their policy. Is used for large
+    tenants and platforms that are scanned as one location (gcp, k8s).
+    Policies are spread evenly and a job that has executed only some
+    policies touches only their shards
+    """
+    name = 'policy-hash'
+    attributes = ('policy',)
+
+    def key(self, part: BaseShardPart) -> dict:
+        return dict(policy=part.policy)
+
+    def distribute(self, policy: str) -> int:
+        return zlib.crc32(policy.encode()) % self._n
+
+
+PartCheck = Callable[[str, str], bool]
+
+
 class ShardsIO(ABC):
     """
     Defines an interface for shards writer
@@ -251,6 +509,37 @@ class ShardsIO(ABC):
         :return:
         """
 
+    def read_parts(self, n: int, check: PartCheck
+                   ) -> list[BaseShardPart] | None:
+        """
+        Reads only those parts of a specific shard that pass the check.
+        The whole shard is read by default
+        :param n:
+        :param check: accepts policy and location
+        :return:
+        """
+        parts = self.read_raw(n)
+        if parts is None:
+            return
+        return [p for p in parts if check(p.policy, p.location)]
+
+    def read_parts_many(self, numbers: Iterable[int], check: PartCheck
+                        ) -> Iterator[list[BaseShardPart]]:
+        it = (self.read_parts(n, check) for n in numbers)
+        return filter(lambda x: x is not None, it)
+
+    @abstractmethod
+    def delete(self, n: int):
+        """
+        Must remove one shard
+        :param n:
+        :return:
+        """
+
+    def delete_many(self, numbers: Iterable[int]):
+        for n in numbers:
+            self.delete(n)
+
     @abstractmethod
     def write_meta(self, meta: dict):
         ...
@@ -259,22 +548,35 @@ class ShardsIO(ABC):
     def read_meta(self) -> dict:
         ...
 
+    @abstractmethod
+    def write_layout(self, layout: StoredShardsLayout):
+        ...
+
+    @abstractmethod
+    def read_layout(self) -> StoredShardsLayout | None:
+        ...
+
 
 class ShardsS3IO(ShardsIO):
     """
     Writer V1
     """
-    __slots__ = '_bucket', '_root', '_client', '_encoder'
+    __slots__ = '_bucket', '_root', '_client', '_encoder', '_cache', \
+        '_manifest'
 
-    def __init__(self, bucket: str, key: str, client: S3Client):
+    def __init__(self, bucket: str, key: str, client: S3Client,
+                 cache: 'S3ObjectsCache | None' = None):
         """
         :param bucket:
         :param key: root folder where to put shards
+        :param cache: optional cache for whole shards that are read
         """
         self._bucket = bucket
         self._root = key
         self._client = client
         self._encoder = msgspec.json.Encoder()
+        self._cache = cache
+        self._manifest = None
 
     @property
     def key(self) -> str:
@@ -284,27 +586,101 @@ class ShardsS3IO(ShardsIO):
     def key(self, value: str):
         self._root = value
 
+    @property
+    def manifest(self) -> dict[str, str] | None:
+        return self._manifest
+
+    @manifest.setter
+    def manifest(self, value: dict[str, str] | None):
+        """
+        Names of objects (0.json.gz, meta.json.gz) mapped to the keys
+        they must be read from. Incremental snapshots reference unchanged
+        objects of previous snapshots instead of keeping their copies.
+        Used only for reading, writing always goes to the root
+        """
+        self._manifest = value
+
     def _key(self, n: int) -> str:
         return str((PurePosixPath(self._root) / str(n)).with_suffix('.json'))
 
-    def write(self, n: int, shard: Shard):
-        self._client.gz_put_object(
-            bucket=self._bucket,
-            key=self._key(n),
-            body=self._encoder.encode(tuple(shard)),
-            gz_buffer=tempfile.TemporaryFile()
+    def _gz_key(self, n: int) -> str:
+        return self._key(n) + '.gz'
+
+    def _resolve(self, name: str) -> str:
+        """
+        Returns a key to read an object with the given name from. Name and
+        the returned key are without .gz
+        """
+        if self._manifest and (key := self._manifest.get(name + '.gz')):
+            return key.removesuffix('.gz')
+        return str(PurePosixPath(self._root) / name)
+
+    def _read_key(self, n: int) -> str:
+        return self._resolve(f'{n}.json')
+
+    def _get_shard(self, n: int) -> BinaryIO | None:
+        """
+        Returns decompressed shard. Uses the cache if it's given
+        """
+        if self._cache is None:
+            return self._client.gz_get_object(
+                bucket=self._bucket,
+                key=self._read_key(n),
+                gz_buffer=tempfile.TemporaryFile(),
+                buffer=tempfile.TemporaryFile()
+            )
+        body = self._cache.get(
+            self._client, self._bucket, self._read_key(n) + '.gz'
         )
+        if body is None:
+            return
+        buf = tempfile.TemporaryFile()
+        with body, gzip.GzipFile(fileobj=body, mode='rb') as gz:
+            shutil.copyfileobj(gz, buf)
+        buf.seek(0)
+        return buf
+
+    @staticmethod
+    def shard_to_filelike(shard: Shard) -> BinaryIO:
+        """
+        Writes shard parts as json array part by part, so the whole shard is
+        never encoded in memory
+        """
+        encoder = msgspec.json.Encoder()
+        buf = tempfile.TemporaryFile()
+        buf.write(b'[')
+        first = True
+        for part in shard:
+            if not first:
+                buf.write(b',')
+            else:
+                first = False
+            buf.write(part.encode(encoder))
+        buf.write(b']')
+        buf.seek(0)
+        return buf
+
+    def write(self, n: int, shard: Shard):
+        with self.shard_to_filelike(shard) as body:
+            self._client.gz_put_object(
+                bucket=self._bucket,
+                key=self._key(n),
+                body=body,
+                gz_buffer=tempfile.TemporaryFile()
+            )
 
     def read_raw(self, n: int) -> list[BaseShardPart] | None:
-        obj = self._client.gz_get_object(
-            bucket=self._bucket,
-            key=self._key(n),
-            gz_buffer=tempfile.TemporaryFile(),
-        )
+        obj = self._get_shard(n)
         if not obj:
             return
-        return msgspec.json.decode(cast(io.BytesIO, obj).getvalue(),
-                                   type=list[ShardPart])
+        with obj:
+            return msgspec.json.decode(obj.read(), type=list[ShardPart])
+
+    def delete(self, n: int):
+        self._client.gz_delete_object(
+            bucket=self._bucket,
+            key=self._key(n)
+        )
 
     def write_meta(self, meta: dict):
         self._client.gz_put_json(
@@ -316,9 +692,22 @@ class ShardsS3IO(ShardsIO):
     def read_meta(self) -> dict:
         return self._client.gz_get_json(
             bucket=self._bucket,
-            key=str((PurePosixPath(self._root) / 'meta.json'))
+            key=self._resolve('meta.json')
         ) or {}
 
+    def write_layout(self, layout: StoredShardsLayout):
+        self._client.gz_put_json(
+            bucket=self._bucket,
+            key=str((PurePosixPath(self._root) / 'layout.json')),
+            obj=layout
+        )
+
+    def read_layout(self) -> StoredShardsLayout | None:
+        return self._client.gz_get_json(
+            bucket=self._bucket,
+            key=self._resolve('layout.json')
+        )
+
 
 class ShardsS3IOV2(ShardsS3IO):
     """
@@ -334,10 +723,272 @@ class ShardsS3IOV2(ShardsS3IO):
                 buf.write(b'\n')
             else:
                 first = False
-            buf.write(encoder.encode(part.serialize()))
+            buf.write(part.encode(encoder))
         buf.seek(0)
         return buf
 
+    def read_raw(self, n: int) -> list[BaseShardPart] | None:
+        obj = self._get_shard(n)
+        if not obj:
+            return
+        decoder = msgspec.json.Decoder(type=ShardPart)
+        with obj:
+            return [decoder.decode(line) for line in obj if line.strip()]
+
+
+class ShardsIOError(Exception):
+    """
+    Aggregates errors that occurred while reading or writing multiple
+    shards concurrently
+    """
+    def __init__(self, errors: dict[int, Exception]):
+        self.errors = errors
+        super().__init__(
+            f'Failed to process {len(errors)} shard(s): '
+            + ', '.join(f'{n}: {e!r}' for n, e in sorted(errors.items()))
+        )
+
+
+class ConcurrentShardsS3IO(ShardsS3IO):
+    """
+    Writer V1 that uploads and downloads multiple shards at once. The given
+    S3 client is shared between threads so its connections pool should be
+    at least of the same size as concurrency. All the shards are processed
+    even if some of them fail, the errors are raised together afterwards
+    """
+    __slots__ = ('_concurrency',)
+
+    def __init__(self, bucket: str, key: str, client: S3Client,
+                 concurrency: int = 8,
+                 cache: 'S3ObjectsCache | None' = None):
+        super().__init__(bucket, key, client, cache)
+        self._concurrency = max(concurrency, 1)
+
+    def write_many(self, pairs: Iterable[tuple[int, Shard]]):
+        pairs = list(pairs)
+        if len(pairs) <= 1 or self._concurrency == 1:
+            return super().write_many(pairs)
+        errors = {}
+        with ThreadPoolExecutor(min(self._concurrency, len(pairs))) as ex:
+            futures = {
+                ex.submit(self.write, n, shard): n for n, shard in pairs
+            }
+            for future in as_completed(futures):
+                if exc := future.exception():
+                    errors[futures[future]] = exc
+        if errors:
+            raise ShardsIOError(errors)
+
+    def read_raw_many(self, numbers: Iterable[int]
+                      ) -> Iterator[list[BaseShardPart]]:
+        numbers = list(numbers)
+        if len(numbers) <= 1 or self._concurrency == 1:
+            return super().read_raw_many(numbers)
+        return self._read_concurrently(self.read_raw, numbers)
+
+    def read_parts_many(self, numbers: Iterable[int], check: PartCheck
+                        ) -> Iterator[list[BaseShardPart]]:
+        numbers = list(numbers)
+        if len(numbers) <= 1 or self._concurrency == 1:
+            return super().read_parts_many(numbers, check)
+        return self._read_concurrently(
+            lambda n: self.read_parts(n, check), numbers
+        )
+
+    def _read_concurrently(self, read: Callable[[int], list | None],
+                           numbers: list[int]
+                           ) -> Generator[list[BaseShardPart], None, None]:
+        """
+        Yields shards in order they are downloaded
+        """
+        errors = {}
+        with ThreadPoolExecutor(min(self._concurrency, len(numbers))) as ex:
+            futures = {ex.submit(read, n): n for n in numbers}
+            for future in as_completed(futures):
+                if exc := future.exception():
+                    errors[futures[future]] = exc
+                    continue
+                if (parts := future.result()) is not None:
+                    yield parts
+        if errors:
+            raise ShardsIOError(errors)
+
+
+class ShardsS3IOV3(ConcurrentShardsS3IO):
+    """
+    Writer v3. Writes shard parts as json lines like v2 but each line is
+    compressed as a separate gzip member. The last member is an index of
+    the shard: json array of [policy, location, offset, length] where
+    offset and length point to the compressed member of a part. Position
+    of the index is kept in the object metadata. Concatenated gzip members
+    are a valid gzip file, so the shard still can be read entirely, but
+    readers that need only some parts download the index and those
+    parts using ranged requests.
+    Reads shards written by v1 and v2 as well. Writes v1 unless indexed is
+    set, because readers of previous versions cannot read v3
+    """
+    __slots__ = ('_indexed',)
+
+    index_meta = 'shard-index'
+    tail_size = 1 << 16  # the last bytes of a shard requested first
+    max_gap = 1 << 16  # parts closer than this are requested together
+
+    def __init__(self, bucket: str, key: str, client: S3Client,
+                 concurrency: int = 8,
+                 cache: 'S3ObjectsCache | None' = None,
+                 indexed: bool = True):
+        super().__init__(bucket, key, client, concurrency, cache)
+        self._indexed = indexed
+
+    @staticmethod
+    def build_shard(shard: Shard) -> tuple[BinaryIO, tuple[int, int]]:
+        """
+        Returns compressed shard and position of its index
+        """
+        encoder = msgspec.json.Encoder()
+        buf = tempfile.TemporaryFile()
+        index = []
+        for part in shard:
+            offset = buf.tell()
+            with gzip.GzipFile(fileobj=buf, mode='wb', mtime=0) as gz:
+                gz.write(part.encode(encoder))
+                gz.write(b'\n')
+            index.append([part.policy, part.location, offset,
+                          buf.tell() - offset])
+        offset = buf.tell()
+        buf.write(gzip.compress(encoder.encode(index) + b'\n', mtime=0))
+        position = (offset, buf.tell() - offset)
+        buf.seek(0)
+        return buf, position
+
+    def write(self, n: int, shard: Shard):
+        if not self._indexed:
+            return super().write(n, shard)
+        body, (offset, length) = self.build_shard(shard)
+        with body:
+            self._client.put_object(
+                bucket=self._bucket,
+                key=self._gz_key(n),
+                body=body,
+                metadata={self.index_meta: f'{offset}-{length}'}
+            )
+
+    @staticmethod
+    def decode_shard(stream: BinaryIO) -> list[ShardPart]:
+        """
+        Decodes decompressed shard of any version
+        """
+        first = stream.read(1)
+        stream.seek(0)
+        if first == b'[':  # v1
+            return msgspec.json.decode(stream.read(), type=list[ShardPart])
+        decoder = msgspec.json.Decoder(type=ShardPart)
+        # lines that are arrays are the index of v3
+        return [decoder.decode(line) for line in stream
+                if line.strip() and not line.startswith(b'[')]
+
+    def read_raw(self, n: int) -> list[BaseShardPart] | None:
+        obj = self._get_shard(n)
+        if not obj:
+            return
+        with obj:
+            return self.decode_shard(obj)
+
+    def _get_range(self, n: int, start: int, end: int, tail: bytes,
+                   tail_start: int, etag: str) -> bytes:
+        """
+        Returns bytes [start; end) reusing already downloaded tail. The
+        range is requested from the same version of the object the tail
+        was taken from
+        """
+        if start >= tail_start:
+            return tail[start - tail_start:end - tail_start]
+        res = self._client.get_object_range(
+            bucket=self._bucket,
+            key=self._read_key(n) + '.gz',
+            start=start,
+            end=end - 1,
+            etag=etag
+        )
+        if res is None:
+            raise FileNotFoundError(f'Shard {n} was removed while reading')
+        return res[0]
+
+    @classmethod
+    def _coalesce(cls, entries: list[tuple[str, str, int, int]]
+                  ) -> Generator[tuple[int, int, list], None, None]:
+        """
+        Groups index entries that are close to each other, so that they
+        can be downloaded by one request
+        """
+        group, start, end = [], 0, 0
+        for entry in sorted(entries, key=lambda e: e[2]):
+            if group and entry[2] - end > cls.max_gap:
+                yield start, end, group
+                group = []
+            if not group:
+                start = entry[2]
+            group.append(entry)
+            end = entry[2] + entry[3]
+        if group:
+            yield start, end, group
+
+    def read_parts(self, n: int, check: PartCheck
+                   ) -> list[BaseShardPart] | None:
+        """
+        In case the shard is overwritten while its parts are downloaded,
+        it's read entirely
+        """
+        try:
+            return self._read_parts(n, check)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('PreconditionFailed',
+                                                   '412'):
+                raise
+            _LOG.warning(f'Shard {n} has changed while reading, '
+                         f'reading it entirely')
+        parts = self.read_raw(n)
+        if parts is None:
+            return
+        return [p for p in parts if check(p.policy, p.location)]
+
+    def _read_parts(self, n: int, check: PartCheck
+                    ) -> list[BaseShardPart] | None:
+        res = self._client.get_object_range(
+            bucket=self._bucket,
+            key=self._read_key(n) + '.gz',
+            suffix=self.tail_size
+        )
+        if res is None:
+            return
+        tail, metadata, size, etag = res
+        tail_start = size - len(tail)
+        position = metadata.get(self.index_meta)
+        if not position:  # written by previous versions
+            if tail_start:
+                parts = self.read_raw(n) or []
+            else:
+                parts = self.decode_shard(io.BytesIO(gzip.decompress(tail)))
+            return [p for p in parts if check(p.policy, p.location)]
+
+        offset, length = map(int, position.split('-'))
+        index = msgspec.json.decode(
+            gzip.decompress(self._get_range(
+                n, offset, offset + length, tail, tail_start, etag
+            )),
+            type=list[tuple[str, str, int, int]]
+        )
+        decoder = msgspec.json.Decoder(type=ShardPart)
+        parts = []
+        wanted = [e for e in index if check(e[0], e[1])]
+        for start, end, group in self._coalesce(wanted):
+            chunk = self._get_range(n, start, end, tail, tail_start, etag)
+            for _, _, o, ln in group:
+                parts.append(decoder.decode(
+                    gzip.decompress(chunk[o - start:o - start + ln])
+                ))
+        return parts
+
 
 class ShardsIterator(Iterator[tuple[int, Shard]]):
     def __init__(self, shards: dict, n: int):
@@ -364,12 +1015,29 @@ class ShardsCollection(Iterable[tuple[int, Shard]]):
     """
     Light abstraction over shards, shards writer and distributor
     """
-    __slots__ = '_distributor', '_io', 'shards', 'meta'
+    __slots__ = ('_distributor', '_io', '_spill', '_stored_meta', '_fetched',
+                 '_stored_sizes', '_layout_read', '_offset', 'shards', 'meta')
 
     def __init__(self, distributor: ShardDataDistributor,
-                 io: ShardsIO | None = None):
+                 io: ShardsIO | None = None,
+                 spill: ShardPartsSpill | None = None):
+        """
+        :param distributor:
+        :param io:
+        :param spill: if given, parts resources are kept in this file
+        instead of memory
+        """
         self._distributor = distributor
         self._io = io
+        self._spill = spill
+
+        self._stored_meta: dict | None = None
+        self._fetched: set[int] = set()  # shards that are already fetched
+        self._stored_sizes: list[int] = []  # resources in stored shards
+        self._layout_read = False
+        # shard n is kept in file offset + n, so that files of different
+        # layouts do not overlap
+        self._offset = 0
 
         self.shards: defaultdict[int, Shard] = defaultdict(Shard)
         self.meta = {}
@@ -402,26 +1070,34 @@ class ShardsCollection(Iterable[tuple[int, Shard]]):
     def __sub__(self, other: 'ShardsCollection') -> 'ShardsCollection':
         """
         Returns a difference between two collections. Uses
-        SingleShardDistributor for the new collection
+        SingleShardDistributor for the new collection.
+        Parts of the other collection are indexed by (policy, location) once
+        and resources are compared by their digests
         """
+        index = {}
+        for part in other.iter_parts():
+            index.setdefault((part.policy, part.location), part)
+
         new = ShardsCollectionFactory.difference()
         for part in self.iter_parts():
-            other_part = None
-            for _, shard in other:
-                p = shard.get(part.policy, part.location)
-                if p:
-                    other_part = p
-                    break
+            other_part = index.get((part.policy, part.location))
             if not other_part:  # keeping the current one without changes
                 new.put_part(part)
-            else:
-                current_res = set(map(hashable, part.resources))
-                other_res = set(map(hashable, other_part.resources))
-                new.put_part(ShardPart(
-                    policy=part.policy,
-                    location=part.location,
-                    resources=list(current_res - other_res)
-                ))
+                continue
+            seen = set(other_part.resource_digests())
+            resources, digests = [], []
+            for res, fp in part.iter_with_digests():
+                if fp in seen:
+                    continue
+                seen.add(fp)
+                resources.append(res)
+                digests.append(fp)
+            new.put_part(ShardPart(
+                policy=part.policy,
+                location=part.location,
+                resources=resources,
+                digests=digests
+            ))
         return new
 
     @property
@@ -435,6 +1111,85 @@ class ShardsCollection(Iterable[tuple[int, Shard]]):
     @io.setter
     def io(self, value: ShardsIO):
         self._io = value
+        self._stored_meta = None
+        self._stored_sizes = []
+        self._layout_read = False
+        self._offset = 0
+        self._fetched.clear()
+
+    def _shard_sizes(self) -> list[int]:
+        """
+        Number of resources in each shard. Stored numbers are used for
+        shards that are not fetched
+        """
+        sizes = [0] * self._distributor.shards_number
+        for n, size in enumerate(self._stored_sizes):
+            if n not in self._fetched and n < len(sizes):
+                sizes[n] = size
+        for n, shard in self.shards.items():
+            sizes[n] += sum(part.resources_number() for part in shard)
+        return sizes
+
+    def resources_number(self) -> int:
+        """
+        Includes resources of stored shards that are not fetched yet if
+        their number is known from the stored layout
+        """
+        if self._io:
+            self._read_layout()
+        return sum(self._shard_sizes())
+
+    def relayout(self, distributor: ShardDataDistributor) -> None:
+        """
+        Changes the distributor redistributing parts that are currently
+        in memory. Does not touch the storage
+        """
+        if distributor.layout() == self._distributor.layout():
+            return
+        parts = list(self.iter_parts())
+        self._distributor = distributor
+        self.shards.clear()
+        self._fetched.clear()
+        self._stored_sizes = []
+        self.put_parts(parts)
+
+    def _read_layout(self) -> None:
+        """
+        Reads layout.json once and applies it to this collection before
+        any shard is fetched. Collections that were written before layouts
+        existed do not have it, the default layout is kept then
+        """
+        if self._layout_read:
+            return
+        layout = self._io.read_layout()
+        if layout:
+            self.relayout(ShardDataDistributor.from_layout(layout))
+            self._offset = int(layout.get('offset') or 0)
+            self._stored_sizes = layout.get('sizes') or []
+        self._layout_read = True
+
+    def _read_meta(self) -> dict:
+        if self._stored_meta is None:
+            self._stored_meta = self._io.read_meta()
+        return self._stored_meta
+
+    def reshard(self, distributor: ShardDataDistributor) -> None:
+        """
+        Changes the layout of stored shards. All the shards are fetched
+        using the current layout and redistributed. New shards are written
+        to files that follow the files of the current layout, so they do
+        not overlap. Files of the current layout are not removed because
+        jobs that have already read it can still write them and readers
+        without layouts support read them. The new layout takes effect
+        when layout.json is written by write_meta after write_all
+        """
+        self.fetch_all()
+        _LOG.info(f'Re-sharding collection: {self._distributor.layout()} -> '
+                  f'{distributor.layout()}')
+        offset = self._offset + self._distributor.shards_number
+        self.relayout(distributor)
+        self._offset = offset
+        self._fetched.update(range(distributor.shards_number))
 
     def put_part(self, part: BaseShardPart) -> None:
         """
@@ -442,6 +1197,8 @@ class ShardsCollection(Iterable[tuple[int, Shard]]):
         :param part:
         :return:
         """
+        if self._spill and not isinstance(part, SpilledShardPart):
+            part = self._spill.put(part)
         n = self._distributor.distribute_part(part)
         self.shards[n].put(part)
 
@@ -474,20 +1231,27 @@ class ShardsCollection(Iterable[tuple[int, Shard]]):
         Writes all the shards that are currently in memory
         :return:
         """
-        self._io.write_many(iter(self))
+        self._io.write_many(
+            (self._offset + n, shard) for n, shard in self
+        )
 
     def fetch_by_indexes(self, it: Iterable[int]):
         """
-        Fetches shards by specified indexes
+        Fetches shards by specified indexes. Indexes must be calculated
+        using the layout of stored shards, so it's resolved beforehand
         """
-        for parts in self._io.read_raw_many(set(it)):
+        self._read_layout()
+        it = set(it) - self._fetched
+        for parts in self._io.read_raw_many(self._offset + n for n in it):
             self.put_parts(parts)
+        self._fetched.update(it)
 
     def fetch_all(self):
         """
         Fetches all the shards
         :return:
         """
+        self._read_layout()
         it = range(self._distributor.shards_number)
         self.fetch_by_indexes(it)
 
@@ -498,13 +1262,50 @@ class ShardsCollection(Iterable[tuple[int, Shard]]):
         :param kwargs: depends on the self._distributor instance
         :return:
         """
-        n = self._distributor.distribute(**kwargs)
-        self.fetch_by_indexes([n])
+        self._read_layout()
+        self.fetch_by_indexes(self._distributor.indexes(**kwargs))
 
     def fetch_multiple(self, params: list[dict]):
-        it = [self._distributor.distribute(**kw) for kw in params]
+        self._read_layout()
+        it = chain.from_iterable(
+            self._distributor.indexes(**kw) for kw in params
+        )
         self.fetch_by_indexes(it)
 
+    def fetch_parts(self, policies: set[str] | None = None,
+                    locations: set[str] | None = None):
+        """
+        Fetches only parts of the given policies and locations. None means
+        any. Only shards that can contain such parts are read and the io
+        does not download other parts if it can
+        :param policies:
+        :param locations:
+        :return:
+        """
+        if policies is None and locations is None:
+            return self.fetch_all()
+        if any(s is not None and not s for s in (policies, locations)):
+            return  # nothing can match
+        self._read_layout()
+        indexes = set()
+        for policy in policies or (None,):
+            for location in locations or (None,):
+                kw = {}
+                if policy is not None:
+                    kw['policy'] = policy
+                if location is not None:
+                    kw['region'] = location
+                indexes.update(self._distributor.indexes(**kw))
+        indexes -= self._fetched
+
+        def check(p: str, l: str) -> bool:
+            return ((policies is None or p in policies) and
+                    (locations is None or l in locations))
+
+        indexes = (self._offset + n for n in indexes)
+        for parts in self._io.read_parts_many(indexes, check):
+            self.put_parts(parts)
+
     def fetch_modified(self):
         """
         Fetches only those shards that were modified locally
@@ -517,19 +1318,34 @@ class ShardsCollection(Iterable[tuple[int, Shard]]):
             self.meta.setdefault(rule, {}).update(data)
 
     def fetch_meta(self):
-        self.update_meta(self._io.read_meta())
+        self.update_meta(self._read_meta())
 
     def write_meta(self):
-        if self.meta:
-            self._io.write_meta(self.meta)
+        """
+        Writes rules meta and then the layout of shards with their sizes.
+        Must be called after write_all because the layout points readers
+        to the written shards
+        """
+        self._io.write_meta(self.meta)
+        self._io.write_layout({
+            **self._distributor.layout(),
+            'offset': self._offset,
+            'sizes': self._shard_sizes()
+        })
 
 
 class ShardsCollectionFactory:
     """
-    Builds distributors but without writers
+    Builds distributors but without writers. Writers can be built separately
     """
+    max_shards = 32
+
     @staticmethod
     def _cloud_distributor(cloud: Cloud) -> ShardDataDistributor:
+        """
+        Default layouts. Collections that do not have layout.json are
+        considered to be written with these ones, so do not change them
+        """
         match cloud:
             case Cloud.AWS:
                 return AWSRegionDistributor(2)
@@ -537,15 +1353,51 @@ class ShardsCollectionFactory:
                 return SingleShardDistributor()
 
     @staticmethod
-    def from_cloud(cloud: Cloud) -> ShardsCollection:
+    def scaled_distributor(cloud: Cloud, resources: int,
+                           per_shard: int) -> ShardDataDistributor:
+        """
+        Chooses a distributor with the number of shards enough to keep about
+        `per_shard` resources in each one. The number is a power of two so
+        that the layout does not change with each small difference in size.
+        Default layout is returned for small collections
+        :param cloud:
+        :param resources: number of resources in the collection
+        :param per_shard: zero disables scaling
+        :return:
+        """
+        default = ShardsCollectionFactory._cloud_distributor(cloud)
+        if per_shard <= 0:
+            return default
+        n, limit = 1, ShardsCollectionFactory.max_shards
+        while n < limit and n * per_shard < resources:
+            n *= 2
+        if n <= default.shards_number:
+            return default
+        match cloud:
+            case Cloud.AWS:
+                return AWSRegionDistributor(n)
+            case Cloud.AZURE:
+                return LocationHashDistributor(n)
+            case _:
+                return PolicyHashDistributor(n)
+
+    @staticmethod
+    def from_cloud(cloud: Cloud, spill: bool = False) -> ShardsCollection:
+        """
+        :param cloud:
+        :param spill: whether to keep parts resources in a temp file
+        instead of memory. Makes sense for large collections
+        """
         return ShardsCollection(
-            distributor=ShardsCollectionFactory._cloud_distributor(cloud)
+            distributor=ShardsCollectionFactory._cloud_distributor(cloud),
+            spill=ShardPartsSpill() if spill else None
         )
 
     @staticmethod
-    def from_tenant(tenant: 'Tenant') -> ShardsCollection:
+    def from_tenant(tenant: 'Tenant', spill: bool = False
+                    ) -> ShardsCollection:
         cloud = Cloud[tenant.cloud.upper()]
-        return ShardsCollectionFactory.from_cloud(cloud)
+        return ShardsCollectionFactory.from_cloud(cloud, spill)
 
     @staticmethod
     def difference() -> ShardsCollection:
@@ -555,3 +1407,57 @@ class ShardsCollectionFactory:
         there
         """
         return ShardsCollection(distributor=SingleShardDistributor())
+
+    @staticmethod
+    def s3_io(bucket: str, key: str, client: S3Client,
+              concurrency: int = 1, indexed: bool = False,
+              cache: 'S3ObjectsCache | None' = None) -> ShardsS3IO:
+        """
+        Returned io reads shards of all versions, so that indexed writing
+        can be enabled and disabled safely
+        :param bucket:
+        :param key:
+        :param client:
+        :param concurrency: how many shards can be uploaded or downloaded
+        at once
+        :param indexed: whether to write shards with index of parts (v3).
+        Readers of previous versions cannot read such shards, so it must
+        be enabled only when all of them are updated
+        :param cache: cache for shards that are read entirely
+        """
+        return ShardsS3IOV3(bucket, key, client, concurrency, cache, indexed)
+
+
+def fix_s3_regions(collection: ShardsCollection):
+    """
+    Self-healing s3 regions. They are kept as global. This patch rewrites each
+    global s3 part as multiple region-specific parts. The function should be
+    just removed in a couple of releases. Everything that is built from
+    job results (latest state, metrics checkpoints) must apply it the same
+    way to stay consistent
+    """
+    meta = collection.meta
+    for part in tuple(collection.iter_parts()):
+        if part.location != GLOBAL_REGION:
+            continue
+        resource = meta.get(part.policy, {}).get('resource')
+        if not resource or resource not in ('s3', 'aws.s3'):
+            continue
+        # s3 with global
+        collection.drop_part(part.policy, part.location)
+        _region_buckets = {}
+        for res, digest in part.iter_with_digests():
+            # empty location constraint means us-east-1
+            r = (res.get('Location', {}).get('LocationConstraint')
+                 or 'us-east-1')
+            _buckets, _digests = _region_buckets.setdefault(r, ([], []))
+            _buckets.append(res)
+            _digests.append(digest)
+        for r, (buckets, digests) in _region_buckets.items():
+            collection.put_part(ShardPart(
+                policy=part.policy,
+                location=r,
+                timestamp=part.timestamp,
+                resources=buckets,
+                digests=digests
+            ))
@@ -4,12 +4,14 @@ https://cloud.google.com/chronicle/docs/reference/udm-field-list
 These models contain only fields that we needed
 """
 import enum
+from abc import abstractmethod
 from datetime import datetime, timezone
+from typing import Generator
 
 import msgspec
 from modular_sdk.models.tenant import Tenant
 
-from helpers import filter_dict, hashable
+from helpers import hashable
 from helpers.constants import REPORT_FIELDS, CAASEnv, Severity
 from helpers.mappings.udm_resource_type import (
     UDMResourceType,
@@ -358,17 +360,44 @@ class UDMVulnerabilityBuilder:
         return item
 
 
-class ShardCollectionUDMEntitiesConvertor(ShardCollectionConvertor):
+class _MergedResource:
     """
-    Converts a collection to a list of UDM Entities where each entity
-    represents one resource with inner list of all its violations
+    Only what is needed to build UDM items from all the findings of one
+    resource. Full resource dicts are not kept
     """
+    __slots__ = ('policies', 'timestamp', 'id', 'name', 'date', 'tags')
+
+    def __init__(self, res: dict, timestamp: float):
+        self.policies: set[str] = set()
+        self.timestamp = timestamp
+        self.id = res.get('arn') or res.get('id') or res.get('name')
+        self.name = res.get('name') or res.get('id') or res.get('arn')
+        self.date = None
+        self.tags = None
+
+    def update(self, policy: str, res: dict, timestamp: float):
+        self.policies.add(policy)
+        self.timestamp = max(self.timestamp, timestamp)
+        # the latest values win like if the dicts were merged
+        if 'date' in res:
+            self.date = res['date']
+        if 'Tags' in res:
+            self.tags = res['Tags']
+
+
+class ShardCollectionUDMConvertor(ShardCollectionConvertor):
+    """
+    Base for convertors that produce one UDM item per unique resource.
+    Items are yielded already encoded
+    """
+    _fields = tuple(sorted(REPORT_FIELDS))
 
     def __init__(self, metadata: Metadata, tenant: Tenant,
                  rule_set: str | None = None, **kwargs):
         super().__init__(metadata)
         self._tenant = tenant
         self._rule_set = rule_set
+        self._encoder = msgspec.json.Encoder()
 
     @staticmethod
     def _parse_date(date: str | float) -> datetime | None:
@@ -380,189 +409,167 @@ class ShardCollectionUDMEntitiesConvertor(ShardCollectionConvertor):
         except Exception:
             return
 
-    def convert(self, collection: 'ShardsCollection') -> list[dict]:
+    @classmethod
+    def _fingerprint(cls, res: dict) -> tuple:
         """
-        :param collection:
-        :return:
+        Identity of a resource. Only its report fields are used
         """
+        key = tuple(res.get(f) for f in cls._fields)
+        try:
+            hash(key)
+        except TypeError:
+            key = hashable(key)
+        return key
+
+    def _merged(self, collection: 'ShardsCollection'
+                ) -> dict[tuple, _MergedResource]:
         meta = collection.meta
         datas = {}
-        policies_results = {}
         for part in collection.iter_parts():
+            rt = meta.get(part.policy, {}).get('resource')
             for res in part.resources:
-                unique = hashable((
-                    filter_dict(res, REPORT_FIELDS),
-                    part.location,
-                    meta.get(part.policy, {}).get('resource')
-                ))
-                inner = datas.setdefault(unique, [set(), res, part.timestamp])
-                inner[0].add(part.policy)
-                inner[1].update(res)
-                inner[2] = max(inner[2], part.timestamp)
-
-                if part.policy not in policies_results:
-                    policies_results[part.policy] = UDMSecurityResultBuilder(
-                        policy=part.policy,
-                        description=meta.get(part.policy, {}).get('description'),
-                        metadata=self.meta.rule(part.policy),
-                        rule_set=self._rule_set
-                    ).build()
-        entities = []
-        for unique, inner in datas.items():
-            policies, full_res, ts = inner
-            res, region, rt = unique
-
-            resource_id = res.get('arn') or res.get('id') or res.get('name')
-            resource_name = res.get('name') or res.get('id') or res.get('arn')
-            resource_type = from_cc_resource_type(rt)
-            if resource_type is UDMResourceType.UNSPECIFIED:  # todo currently api does not accept this one(
-                resource_type = UDMResourceType.CLOUD_PROJECT
-
-            entity = UDMEntity(
-                metadata=UDMEntityMetadata(
-                    entity_type=UDMEntityType.RESOURCE,
-                    collected_timestamp=datetime.fromtimestamp(ts, tz=timezone.utc),
-                    product_entity_id=resource_id,
-                    product_name=self._tenant.name,
-                    source_type=UDMSourceType.ENTITY_CONTEXT,
-                    vendor_name=self._tenant.customer_name
+                unique = (self._fingerprint(res), part.location, rt)
+                item = datas.get(unique)
+                if item is None:
+                    item = datas[unique] = _MergedResource(res, part.timestamp)
+                item.update(part.policy, res, part.timestamp)
+        return datas
+
+    def _resource(self, item: _MergedResource, rt: str) -> UDMResource:
+        resource_type = from_cc_resource_type(rt)
+        if resource_type is UDMResourceType.UNSPECIFIED:  # todo currently api does not accept this one(
+            resource_type = UDMResourceType.CLOUD_PROJECT
+        resource = UDMResource(
+            product_object_id=item.id,
+            name=item.name,
+            resource_subtype=rt,
+            resource_type=resource_type,
+            attribute=UDMAttribute(
+                cloud=UDMCloud(
+                    environment=UDMCloudEnvironment.from_local_cloud(self._tenant.cloud),
                 ),
-                entity=UDMNoun(
-                    security_result=[policies_results.get(p) for p in policies],
-                    location=UDMLocation(region),
-                    resource=UDMResource(
-                        product_object_id=resource_id,
-                        name=resource_name,
-                        resource_subtype=rt,
-                        resource_type=resource_type,
-                        attribute=UDMAttribute(
-                            cloud=UDMCloud(
-                                environment=UDMCloudEnvironment.from_local_cloud(self._tenant.cloud),
-                            ),
-                            labels=[]
-                        )
-                    )
-                )
+                labels=[]
             )
-            if service := self.meta.rule(next(iter(policies))).service:
-                entity.entity.application = service
-            if date := full_res.get('date'):
-                dt = self._parse_date(date)
-                if dt:
-                    entity.entity.resource.attribute.creation_time = dt
-            if tags := full_res.get('Tags'):
-                entity.entity.resource.attribute.labels.extend(
-                    UDMLabel(key=t['Key'], value=t['Value']) for t in tags
-                )
-            entities.append(msgspec.to_builtins(entity))
-        return entities
-
-
-# TODO these two convertors are kind of POC and can be improved or extended.
-#  I'm not sure about the right way to convert our findings to UDM
-
-
-class ShardCollectionUDMEventsConvertor(ShardCollectionConvertor):
-    """
-    Converts a collection to a list of UDM Events
-    """
+        )
+        if item.date and (dt := self._parse_date(item.date)):
+            resource.attribute.creation_time = dt
+        if item.tags:
+            resource.attribute.labels.extend(
+                UDMLabel(key=t['Key'], value=t['Value']) for t in item.tags
+            )
+        return resource
 
-    def __init__(self, metadata: Metadata, tenant: Tenant,
-                 rule_set: str | None = None, **kwargs):
-        super().__init__(metadata)
-        self._tenant = tenant
-        self._rule_set = rule_set
+    @abstractmethod
+    def _policy_result(self, policy: str, description: str | None):
+        """
+        Builds UDM representation of a violated policy
+        """
 
-    @staticmethod
-    def _parse_date(date: str | float) -> datetime | None:
-        try:
-            if isinstance(date, float):
-                return datetime.fromtimestamp(date, tz=timezone.utc)
-            else:  # str
-                return utc_datetime(date)
-        except Exception:
-            return
+    @abstractmethod
+    def _build(self, item: _MergedResource, region: str, rt: str,
+               results: dict) -> msgspec.Struct:
+        """
+        Builds UDM item for one resource
+        """
 
-    def convert(self, collection: 'ShardsCollection') -> list[dict]:
+    def convert(self, collection: 'ShardsCollection'
+                ) -> Generator[bytes, None, None]:
         """
+        Yields encoded items one by one, so they can be uploaded while
+        being converted
         :param collection:
         :return:
         """
         meta = collection.meta
-        datas = {}
-        policies_results = {}
-        for part in collection.iter_parts():
-            for res in part.resources:
-                unique = hashable((
-                    filter_dict(res, REPORT_FIELDS),
-                    part.location,
-                    meta.get(part.policy, {}).get('resource')
-                ))
-                inner = datas.setdefault(unique, [set(), res, part.timestamp])
-                inner[0].add(part.policy)
-                inner[1].update(res)
-                inner[2] = max(inner[2], part.timestamp)
-
-                if part.policy not in policies_results:
-                    policies_results[part.policy] = UDMVulnerabilityBuilder(
-                        policy=part.policy,
-                        description=meta.get(part.policy, {}).get('description'),
-                        metadata=self.meta.rule(part.policy),
-                    ).build()
-        events = []
-        for unique, inner in datas.items():
-            policies, full_res, ts = inner
-            res, region, rt = unique
-
-            resource_id = res.get('arn') or res.get('id') or res.get('name')
-            resource_name = res.get('name') or res.get('id') or res.get('arn')
-            resource_type = from_cc_resource_type(rt)
-            if resource_type is UDMResourceType.UNSPECIFIED:  # todo currently api does not accept this one(
-                resource_type = UDMResourceType.CLOUD_PROJECT
-
-            event = UDMEvent(
-                metadata=UDMEventMetadata(
-                    collected_timestamp=datetime.fromtimestamp(ts, tz=timezone.utc),
-                    description='Syndicate Rule Engine scanned target product',
-                    event_type=UDMEventType.SCAN_VULN_HOST,
-                    product_name=self._tenant.name,
-                    vendor_name=self._tenant.customer_name
-                ),
-                principal=UDMNoun(
-                    application='Syndicate Rule Engine',  # todo maybe add other data
-                    hostname=CAASEnv.API_GATEWAY_HOST.get('rule-engine'),  # todo maybe get from ec2 metadata
-                ),
-                target=UDMNoun(
-                    location=UDMLocation(region),
-                    resource=UDMResource(
-                        product_object_id=resource_id,
-                        name=resource_name,
-                        resource_subtype=rt,
-                        resource_type=resource_type,
-                        attribute=UDMAttribute(
-                            cloud=UDMCloud(
-                                environment=UDMCloudEnvironment.from_local_cloud(self._tenant.cloud),
-                            ),
-                            labels=[]
-                        )
+        datas = self._merged(collection)
+        results = {}
+        for (_, region, rt), item in datas.items():
+            for policy in item.policies:
+                if policy not in results:
+                    results[policy] = self._policy_result(
+                        policy, meta.get(policy, {}).get('description')
                     )
-                ),
-                extensions=UDMExtensions(
-                    vulns=UDMVulnerabilities(
-                        vulnerabilities=[policies_results.get(p) for p in policies]
-                    )
-                )
+            yield self._encoder.encode(self._build(item, region, rt, results))
+
+
+class ShardCollectionUDMEntitiesConvertor(ShardCollectionUDMConvertor):
+    """
+    Converts a collection to UDM Entities where each entity represents one
+    resource with inner list of all its violations
+    """
+
+    def _policy_result(self, policy: str, description: str | None
+                       ) -> UDMSecurityResult:
+        return UDMSecurityResultBuilder(
+            policy=policy,
+            description=description,
+            metadata=self.meta.rule(policy),
+            rule_set=self._rule_set
+        ).build()
+
+    def _build(self, item: _MergedResource, region: str, rt: str,
+               results: dict) -> UDMEntity:
+        entity = UDMEntity(
+            metadata=UDMEntityMetadata(
+                entity_type=UDMEntityType.RESOURCE,
+                collected_timestamp=datetime.fromtimestamp(item.timestamp, tz=timezone.utc),
+                product_entity_id=item.id,
+                product_name=self._tenant.name,
+                source_type=UDMSourceType.ENTITY_CONTEXT,
+                vendor_name=self._tenant.customer_name
+            ),
+            entity=UDMNoun(
+                security_result=[results[p] for p in item.policies],
+                location=UDMLocation(region),
+                resource=self._resource(item, rt)
             )
+        )
+        if service := self.meta.rule(next(iter(item.policies))).service:
+            entity.entity.application = service
+        return entity
+
 
-            if service := self.meta.rule(next(iter(policies))).service:
-                event.target.application = service
-            if date := full_res.get('date'):
-                dt = self._parse_date(date)
-                if dt:
-                    event.target.resource.attribute.creation_time = dt
-            if tags := full_res.get('Tags'):
-                event.target.resource.attribute.labels.extend(
-                    UDMLabel(key=t['Key'], value=t['Value']) for t in tags
+# TODO these two convertors are kind of POC and can be improved or extended.
+#  I'm not sure about the right way to convert our findings to UDM
+
+
+class ShardCollectionUDMEventsConvertor(ShardCollectionUDMConvertor):
+    """
+    Converts a collection to UDM Events
+    """
+
+    def _policy_result(self, policy: str, description: str | None
+                       ) -> UDMVulnerability:
+        return UDMVulnerabilityBuilder(
+            policy=policy,
+            description=description,
+            metadata=self.meta.rule(policy),
+        ).build()
+
+    def _build(self, item: _MergedResource, region: str, rt: str,
+               results: dict) -> UDMEvent:
+        event = UDMEvent(
+            metadata=UDMEventMetadata(
+                collected_timestamp=datetime.fromtimestamp(item.timestamp, tz=timezone.utc),
+                description='Syndicate Rule Engine scanned target product',
+                event_type=UDMEventType.SCAN_VULN_HOST,
+                product_name=self._tenant.name,
+                vendor_name=self._tenant.customer_name
+            ),
+            principal=UDMNoun(
+                application='Syndicate Rule Engine',  # todo maybe add other data
+                hostname=CAASEnv.API_GATEWAY_HOST.get('rule-engine'),  # todo maybe get from ec2 metadata
+            ),
+            target=UDMNoun(
+                location=UDMLocation(region),
+                resource=self._resource(item, rt)
+            ),
+            extensions=UDMExtensions(
+                vulns=UDMVulnerabilities(
+                    vulnerabilities=[results[p] for p in item.policies]
                 )
-            events.append(msgspec.to_builtins(event))
-        return events
+            )
+        )
+        if service := self.meta.rule(next(iter(item.policies))).service:
+            event.target.application = service
+        return event
@@ -35,6 +35,7 @@ put two arguments into add_cells() method.
 """
 
 import json
+from typing import Iterable
 
 from xlsxwriter.format import Format
 from xlsxwriter.worksheet import Worksheet
@@ -131,36 +132,55 @@ class XlsxRowsWriter:
     def _write_row(row: Row, wsh: Worksheet, pointer: Cell,
                    empty: set[int]):
         """
-
+        Cells are written strictly row by row so that the writer works in
+        constant_memory mode where a row cannot be changed after the next
+        one is started
         :param row:
         :param wsh:
         :param pointer:
         :param empty:
         :return:
         """
-        highest = len(max(skip_indexes(row, empty), key=len, default=()))
-
-        for i, col in enumerate(skip_indexes(row, empty)):
-            for j, cell in enumerate(col):
+        cols = tuple(skip_indexes(row, empty))
+        highest = len(max(cols, key=len, default=()))
+
+        for j in range(highest):
+            for i, col in enumerate(cols):
+                if j >= len(col):
+                    continue
+                cell = col[j]
                 if cell.ft:
                     wsh.write(pointer.row + j, pointer.col + i, cell.data,
                               cell.ft)
                 else:
                     wsh.write(pointer.row + j, pointer.col + i, cell.data)
-            if highest > 1 and highest > len(col) > 0:  # need merge
-                wsh.merge_range(
-                    pointer.row + j,
-                    pointer.col + i,
-                    pointer.row + j + highest - len(col),
-                    pointer.col + i,
-                    ''
-                )
+            # merges are rejected if they start above the current row
+            for i, col in enumerate(cols):
+                if len(col) == j + 1 and highest > len(col):  # need merge
+                    wsh.merge_range(
+                        pointer.row + j,
+                        pointer.col + i,
+                        pointer.row + highest - 1,
+                        pointer.col + i,
+                        ''
+                    )
         pointer.row += highest
 
-    def write(self, wsh: Worksheet, table: Table, start: Cell | None = None):
-        # todo allow to pass iterator of Rows of CellContent instead of table
+    def write_rows(self, wsh: Worksheet, rows: Iterable[Row],
+                   start: Cell | None = None, empty: set[int] | None = None):
+        """
+        Writes rows one by one without keeping them. Empty columns cannot
+        be detected here so they must be given if some should be skipped
+        :param wsh:
+        :param rows: can be a generator
+        :param start:
+        :param empty: indexes of columns to skip
+        """
         pointer = start or Cell()
-        rows = table.buffer
-        empty = self.empty_cols(rows)
+        empty = empty or set()
         for row in rows:
             self._write_row(row, wsh, pointer, empty)
+
+    def write(self, wsh: Worksheet, table: Table, start: Cell | None = None):
+        rows = table.buffer
+        self.write_rows(wsh, rows, start, self.empty_cols(rows))
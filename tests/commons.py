@@ -3,9 +3,11 @@ from datetime import datetime, timezone
 from pathlib import Path
 from urllib.parse import urlparse
 
+import msgspec
 from dateutil.parser import isoparse
 from webtest import TestApp, TestResponse
 from helpers import comparable
+from services.sharding import ShardPart, ShardsIO
 
 SOURCE = Path(__file__).parent.parent / 'src'
 
@@ -162,3 +164,40 @@ class SREClient:
         return getattr(self._app, f'{method}_json')(
             path, data, headers=headers, expect_errors=True
         )
+
+
+class InMemoryShardsIO(ShardsIO):
+    """
+    Keeps shards, meta and layout in memory. Remembers indexes of read
+    shards
+    """
+
+    def __init__(self):
+        self.shards = {}
+        self.meta = {}
+        self.layout = None
+        self.reads = []
+
+    def write(self, n, shard):
+        self.shards[n] = [p.serialize() for p in shard]
+
+    def read_raw(self, n):
+        self.reads.append(n)
+        if n not in self.shards:
+            return
+        return msgspec.convert(self.shards[n], list[ShardPart])
+
+    def delete(self, n):
+        self.shards.pop(n, None)
+
+    def write_meta(self, meta):
+        self.meta = meta
+
+    def read_meta(self):
+        return self.meta
+
+    def write_layout(self, layout):
+        self.layout = layout
+
+    def read_layout(self):
+        return self.layout
@@ -0,0 +1,84 @@
+import pytest
+
+from executor.services.policy_service import PoliciesLoadCache
+from helpers.constants import Cloud
+
+
+def test_policies_load_cache(tmp_path):
+    cache = PoliciesLoadCache(tmp_path)
+    policies = [
+        {'name': 'one', 'resource': 'aws.ec2'},
+        {'name': 'two', 'resource': 'aws.s3'},
+    ]
+    key = cache.build_key(policies, Cloud.AWS, '0.9.0')
+    assert cache.get(key) is None
+    cache.set(key, ['two'])
+    assert cache.get(key) == {'two'}
+
+    assert cache.build_key(policies, Cloud.AWS, '0.9.1') != key
+    assert cache.build_key(policies, Cloud.AZURE, '0.9.0') != key
+    assert cache.build_key(policies[:1], Cloud.AWS, '0.9.0') != key
+
+
+def test_policies_load_cache_broken_file(tmp_path):
+    cache = PoliciesLoadCache(tmp_path)
+    (tmp_path / 'key.json').write_bytes(b'{not json')
+    assert cache.get('key') is None
+
+
+@pytest.fixture
+def account_filters():
+    """
+    Registers test filters for aws.account and removes them afterwards
+    """
+    from c7n.filters import Filter
+    from c7n.resources.account import Account
+
+    class StatefulFilter(Filter):
+        """
+        Like guard-duty filter builds its attributes in validate()
+        """
+        schema = {'type': 'object'}
+
+        def validate(self):
+            self.prepared = True
+            return self
+
+    class BrokenFilter(Filter):
+        """
+        Fails validation not because of policy content
+        """
+        schema = {'type': 'object'}
+
+        def validate(self):
+            raise RuntimeError('no credentials')
+
+    Account.filter_registry.register('stateful-validate', StatefulFilter)
+    Account.filter_registry.register('broken-validate', BrokenFilter)
+    yield
+    Account.filter_registry.unregister('stateful-validate')
+    Account.filter_registry.unregister('broken-validate')
+
+
+def test_loader_validates_cached_policies(tmp_path, account_filters):
+    from run import PoliciesLoader
+
+    policies = [
+        {'name': 'stateful', 'resource': 'aws.account',
+         'filters': [{'type': 'stateful-validate'}]},
+        {'name': 'invalid', 'resource': 'aws.account',
+         'filters': [{'type': 'value', 'value': 'no key'}]},
+        {'name': 'broken', 'resource': 'aws.account',
+         'filters': [{'type': 'broken-validate'}]},
+    ]
+    cache = PoliciesLoadCache(tmp_path / 'cache')
+    loader = PoliciesLoader(Cloud.AWS, tmp_path, regions={'global'},
+                            load_cache=cache)
+    for _ in range(2):  # the second time from cache
+        items = loader.load_from_policies(policies)
+        assert [p.name for p in items] == ['stateful']
+        assert items[0].resource_manager.filters[0].prepared
+    files = list((tmp_path / 'cache').iterdir())
+    assert len(files) == 1
+    # unexpected errors can be transient, so they are not cached
+    assert cache.get(files[0].stem) == {'invalid'}
@@ -0,0 +1,92 @@
+import pytest
+
+from helpers.constants import Cloud
+
+
+@pytest.mark.parametrize('concurrency', [1, 4])
+def test_runner_lists_resources_once_per_type(tmp_path, monkeypatch,
+                                               concurrency):
+    from c7n.query import ResourceQuery
+
+    from run import PoliciesLoader, Runner
+
+    calls = []
+    original = ResourceQuery.filter
+
+    def filter_(self, resource_manager, **params):
+        calls.append(resource_manager.type)
+        return original(self, resource_manager, **params)
+
+    monkeypatch.setattr(ResourceQuery, 'filter', filter_)
+    policies = [
+        {'name': 'ec2-1', 'resource': 'aws.ec2'},
+        {'name': 'ebs-1', 'resource': 'aws.ebs'},
+        {'name': 'ec2-2', 'resource': 'aws.ec2'},
+        {'name': 'ebs-2', 'resource': 'aws.ebs'},
+        {'name': 'ec2-3', 'resource': 'aws.ec2'},
+    ]
+    loader = PoliciesLoader(Cloud.AWS, tmp_path, regions={'eu-west-1'},
+                            cache=str(tmp_path / 'cache.sqlite'))
+    runner = Runner.factory(Cloud.AWS, loader.load_from_policies(policies),
+                            concurrency=concurrency)
+    runner.start()
+    assert not runner.failed
+    assert sorted(calls) == ['ebs', 'ec2']
+
+
+def test_policies_logs_not_interleaved(tmp_path):
+    from run import PoliciesLoader, Runner
+
+    policies = [
+        {'name': f'ec2-{i}', 'resource': 'aws.ec2'} for i in range(2)
+    ] + [
+        {'name': f'ebs-{i}', 'resource': 'aws.ebs'} for i in range(2)
+    ]
+    loader = PoliciesLoader(Cloud.AWS, tmp_path, regions={'eu-west-1'},
+                            cache=str(tmp_path / 'cache.sqlite'))
+    runner = Runner.factory(Cloud.AWS, loader.load_from_policies(policies),
+                            concurrency=4)
+    runner.start()
+    assert not runner.failed
+    for policy in policies:
+        name = policy['name']
+        log = (tmp_path / 'eu-west-1' / name / 'custodian-run.log')
+        lines = log.read_text().splitlines()
+        assert lines
+        assert all(f'policy:{name} ' in line for line in lines
+                   if 'policy:' in line)
+
+
+def slow_process_job(filename, work_dir, cloud, region):
+    """
+    Global region reports in time, the rest hang
+    """
+    import time
+
+    if region != 'global':
+        time.sleep(30)
+    return {('global', 'iam-policy'): ('SKIPPED', None, [])}
+
+
+def test_scan_regions_timeout(tmp_path, monkeypatch):
+    import msgspec
+
+    import run
+    from helpers.constants import PolicyErrorType
+
+    filename = tmp_path / 'policies.json'
+    filename.write_bytes(msgspec.json.encode([
+        {'name': 'ec2-policy', 'resource': 'aws.ec2'},
+        {'name': 'iam-policy', 'resource': 'aws.iam-user'},
+    ]))
+    monkeypatch.setattr(run, 'process_job', slow_process_job)
+    monkeypatch.setattr(run, 'TIME_THRESHOLD', run.time.time())
+    monkeypatch.setattr(run, 'REGIONS_GRACE_PERIOD', 1)
+    monkeypatch.setenv('EXECUTOR_REGIONS_POOL_SIZE', '3')
+
+    failed = run.scan_regions(str(filename), tmp_path, Cloud.AWS,
+                              ['global', 'eu-west-1', 'eu-central-1'])
+    assert set(failed) == {('global', 'iam-policy'),
+                           ('eu-west-1', 'ec2-policy'),
+                           ('eu-central-1', 'ec2-policy')}
+    assert failed[('eu-west-1', 'ec2-policy')][0] == PolicyErrorType.SKIPPED
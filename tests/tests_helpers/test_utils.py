@@ -23,6 +23,7 @@ from helpers import (
     iter_values,
     flip_dict,
     Version,
+    fingerprint,
     comparable,
     iter_key_values,
 )
@@ -361,3 +362,13 @@ def test_version():
 
     ver = Version('1.2.3')
     assert Version(ver) is ver
+
+
+def test_fingerprint():
+    assert fingerprint({'a': 1, 'b': [1, 2]}) == \
+           fingerprint({'b': [1, 2], 'a': 1})
+    assert fingerprint({'a': [1, 2]}) != fingerprint({'a': [2, 1]})
+    # json types are kept, unlike hash(1) == hash(1.0) == hash(True)
+    assert fingerprint({'a': 1}) != fingerprint({'a': 1.0})
+    assert fingerprint({'a': 1}) != fingerprint({'a': True})
+    assert fingerprint({'a': 0}) != fingerprint({'a': None})
@@ -0,0 +1,62 @@
+import pytest
+from moto.backends import get_backend
+
+from services import SP
+from services.cache import S3ObjectsCache
+
+
+@pytest.fixture
+def bucket():
+    SP.s3.create_bucket('cache-bucket', 'eu-central-1')
+    yield 'cache-bucket'
+    get_backend('s3').reset()
+
+
+class TestS3ObjectsCache:
+    def test_get(self, bucket, tmp_path):
+        cache = S3ObjectsCache(1 << 20, 1 << 20, str(tmp_path))
+        assert cache.get(SP.s3, bucket, 'key') is None
+
+        SP.s3.put_object(bucket, 'key', b'one')
+        assert cache.get(SP.s3, bucket, 'key').read() == b'one'
+        assert cache.get(SP.s3, bucket, 'key').read() == b'one'
+
+        SP.s3.put_object(bucket, 'key', b'two')
+        assert cache.get(SP.s3, bucket, 'key').read() == b'two'
+
+        # another process with the same directory
+        other = S3ObjectsCache(0, 1 << 20, str(tmp_path))
+        assert other._from_disk(bucket, 'key')[1].read() == b'two'
+        assert other.get(SP.s3, bucket, 'key').read() == b'two'
+
+        SP.s3.delete_object(bucket, 'key')
+        assert cache.get(SP.s3, bucket, 'key') is None
+        assert other._from_disk(bucket, 'key') is None
+
+    def test_not_modified(self, bucket, tmp_path):
+        SP.s3.put_object(bucket, 'key', b'data')
+        cache = S3ObjectsCache(1 << 20)
+        assert cache.get(SP.s3, bucket, 'key').read() == b'data'
+        etag = cache._from_memory(bucket, 'key')[0]
+        assert SP.s3.get_object_if_none_match(bucket, 'key', etag) == (
+            None, etag
+        )
+
+    def test_large_body_not_in_memory(self, bucket, tmp_path):
+        SP.s3.put_object(bucket, 'key', b'x' * 100)
+        cache = S3ObjectsCache(10, 1 << 20, str(tmp_path))
+        body = cache.get(SP.s3, bucket, 'key')
+        assert body.read() == b'x' * 100
+        assert cache._from_memory(bucket, 'key') is None
+
+        # not modified, read from disk
+        assert cache.get(SP.s3, bucket, 'key').read() == b'x' * 100
+
+    def test_disk_eviction(self, bucket, tmp_path):
+        cache = S3ObjectsCache(0, 160, str(tmp_path))
+        for i in range(5):
+            SP.s3.put_object(bucket, f'key-{i}', b'x' * 40)
+            cache.get(SP.s3, bucket, f'key-{i}')
+        files = list((tmp_path / 'sre-s3-cache').iterdir())
+        assert len(files) == 2
+        assert cache._from_disk(bucket, 'key-4')[1].read() == b'x' * 40
@@ -0,0 +1,113 @@
+import pytest
+from moto.backends import get_backend
+
+from helpers.constants import CAASEnv, S3SettingKey
+from services import SP
+from services.event_processor_service import (
+    BaseEventProcessor,
+    EventBridgeEventProcessor,
+    EventProcessorService,
+    EventRulesIndex,
+    SeenRecords,
+)
+
+
+@pytest.fixture
+def rulesets_bucket():
+    SP.s3.create_bucket(CAASEnv.RULESETS_BUCKET_NAME.get(), 'eu-central-1')
+    yield
+    get_backend('s3').reset()
+
+
+def ct_event(name: str, account: str = '123', **kwargs) -> dict:
+    return {
+        'detail-type': 'AWS API Call via CloudTrail',
+        'detail': {
+            'eventName': name,
+            'eventSource': 'ec2.amazonaws.com',
+            'userIdentity': {'accountId': account},
+            'awsRegion': 'eu-west-1',
+            **kwargs,
+        },
+    }
+
+
+def test_fingerprint():
+    fp = EventBridgeEventProcessor.fingerprint
+    assert fp(ct_event('RunInstances')) == fp(
+        ct_event('RunInstances', eventTime='2024-11-16T12:44:54Z')
+    ), 'values that are not kept do not matter'
+    assert fp(ct_event('RunInstances')) != fp(ct_event('StopInstances'))
+    assert fp(ct_event('RunInstances')) != fp(ct_event('RunInstances', '1'))
+    assert BaseEventProcessor.fingerprint({1: 2, 3: 4}) == \
+        BaseEventProcessor.fingerprint({3: 4, 1: 2})
+
+
+def test_without_duplicates_window():
+    seen = SeenRecords(window=60, maxsize=100)
+    records = [ct_event('RunInstances'), ct_event('RunInstances')]
+    it = EventBridgeEventProcessor.without_duplicates(records, seen)
+    assert len(list(it)) == 1
+
+    seen.now = 30
+    it = EventBridgeEventProcessor.without_duplicates(records, seen)
+    assert len(list(it)) == 0, 'within the window'
+
+    seen.now = 61
+    it = EventBridgeEventProcessor.without_duplicates(records, seen)
+    assert len(list(it)) == 1, 'the window has passed'
+
+
+def test_seen_records_bounded():
+    seen = SeenRecords(window=60, maxsize=2)
+    for i in range(5):
+        seen.add(i)
+    assert len(seen) == 2
+    assert 4 in seen and 0 not in seen
+
+
+def test_rules_index():
+    index = EventRulesIndex(
+        aws_events={
+            'ec2.amazonaws.com': {'RunInstances': ['r1', 'r2']},
+            'StopInstances': ['r3'],
+        },
+        eb_mapping={'aws.ec2': ['r4']},
+        azure_events={'Microsoft.Compute': {'vm/write': ['r5']}},
+        maestro_azure={'INSTANCE': {'COMMAND': [
+            ['Microsoft.Compute', 'vm/write'], ['Microsoft.Compute', 'x']
+        ]}},
+    )
+    assert index.cloudtrail_rules('ec2.amazonaws.com', 'RunInstances') == \
+        {'r1', 'r2'}
+    assert index.cloudtrail_rules('ec2.amazonaws.com', 'StopInstances') == \
+        {'r3'}
+    assert not index.cloudtrail_rules('s3.amazonaws.com', 'RunInstances')
+    assert index.eventbridge_rules('aws.ec2') == {'r4'}
+    assert index.maestro_rules('AZURE', 'INSTANCE', 'COMMAND') == {'r5'}
+    assert not index.maestro_rules('GOOGLE', 'INSTANCE', 'COMMAND')
+
+
+def test_rules_index_invalidated_by_etag(rulesets_bucket):
+    service = EventProcessorService(
+        s3_settings_service=SP.s3_settings_service,
+        environment_service=SP.environment_service,
+        sts_client=SP.sts,
+    )
+    assert not service.rules_index.cloudtrail
+    SP.s3_settings_service.set(
+        S3SettingKey.AWS_EVENTS,
+        {'ec2.amazonaws.com': {'RunInstances': ['r1']}}
+    )
+    index = service.rules_index
+    assert index.cloudtrail_rules('ec2.amazonaws.com', 'RunInstances') == \
+        {'r1'}
+    assert service.rules_index is index, 'not changed, must be cached'
+
+    SP.s3_settings_service.set(
+        S3SettingKey.AWS_EVENTS,
+        {'ec2.amazonaws.com': {'RunInstances': ['r2']}}
+    )
+    assert service.rules_index.cloudtrail_rules(
+        'ec2.amazonaws.com', 'RunInstances'
+    ) == {'r2'}
@@ -0,0 +1,41 @@
+from types import SimpleNamespace
+
+import pytest
+
+from services.event_service import PartitionsReader
+
+
+def events(*timestamps: float) -> list[SimpleNamespace]:
+    return [SimpleNamespace(timestamp=t) for t in timestamps]
+
+
+def failing(*timestamps: float):
+    yield from events(*timestamps)
+    raise RuntimeError('query failed')
+
+
+class TestPartitionsReader:
+    def test_ordered(self):
+        reader = PartitionsReader([
+            events(1, 4, 7, 10),
+            events(),
+            events(2, 3, 8),
+            events(5, 6, 9, 11, 12),
+        ], buffer_size=1)
+        assert [e.timestamp for e in reader] == list(range(1, 13))
+
+    def test_single_partition(self):
+        reader = PartitionsReader([events(1, 2)])
+        assert [e.timestamp for e in reader] == [1, 2]
+
+    def test_error(self):
+        reader = PartitionsReader([events(1, 2, 3), failing(1.5)])
+        with pytest.raises(RuntimeError, match='query failed'):
+            list(reader)
+
+    def test_not_consumed(self):
+        it = iter(PartitionsReader(
+            [events(*range(100)), events(*range(100))], buffer_size=2
+        ))
+        assert next(it).timestamp == 0
+        it.close()  # producers must stop
@@ -0,0 +1,37 @@
+import copy
+
+from services.obfuscation import Obfuscator, obfuscate_finding
+
+
+def test_aliases_are_deterministic():
+    key = b'key'
+    one, two = Obfuscator(key), Obfuscator(key)
+    assert one.alias('value') == two.alias('value')
+    assert one.alias('value') != Obfuscator(b'other').alias('value')
+    assert len(one.alias('value')) == 36
+
+    assert len({one.alias(v) for v in ('1', 1, True, None, 'None')}) == 5
+
+
+def test_obfuscate_finding():
+    finding = {
+        'id': 'i-1',
+        'name': 'name',
+        'tags': [{'Key': 'name', 'Value': 'i-1'}],
+        'encrypted': True,
+        'size': 1,
+    }
+    real = copy.deepcopy(finding)
+    obfuscator = Obfuscator()
+    obfuscate_finding(finding, obfuscator)
+
+    assert finding['id'] == finding['tags'][0]['Value']
+    assert finding['name'] == finding['tags'][0]['Key']
+    dictionary = obfuscator.dictionary
+    assert dictionary == {
+        finding['id']: 'i-1',
+        finding['name']: 'name',
+        finding['encrypted']: True,
+        finding['size']: 1,
+    }
+    assert dictionary[finding['tags'][0]['Value']] == real['id']
@@ -0,0 +1,146 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import pytest
+from moto.backends import get_backend
+
+from helpers.constants import CAASEnv, PolicyErrorType
+from helpers.time_helper import utc_datetime
+from lambdas.custodian_metrics_updater.processors.findings_processor import (
+    FindingsUpdater,
+)
+from models.job import Job
+from services import SP
+from services.report_service import ReportService, StatisticsColumns
+from services.reports_bucket import (
+    StatisticsBucketKeysBuilder,
+    TenantReportsBucketKeysBuilder,
+)
+from services.sharding import ShardPart
+
+
+@pytest.fixture
+def statistics_bucket():
+    SP.s3.create_bucket(CAASEnv.STATISTICS_BUCKET_NAME.get(), 'eu-central-1')
+    yield
+    get_backend('s3').reset()
+
+
+@pytest.fixture
+def reports_bucket():
+    SP.s3.create_bucket(CAASEnv.REPORTS_BUCKET_NAME.get(), 'eu-central-1')
+    yield CAASEnv.REPORTS_BUCKET_NAME.get()
+    get_backend('s3').reset()
+
+
+def item(policy: str, region: str, start: float, end: float, **kwargs
+         ) -> dict:
+    return {
+        'policy': policy,
+        'region': region,
+        'start_time': start,
+        'end_time': end,
+        **kwargs,
+    }
+
+
+@pytest.fixture
+def job_items() -> list[list[dict]]:
+    return [
+        [
+            item('p1', 'eu-west-1', 1, 4, scanned_resources=10,
+                 failed_resources=2, api_calls={'ec2.Describe': 2}),
+            item('p2', 'eu-west-1', 1, 2, error_type=PolicyErrorType.ACCESS),
+        ],
+        [
+            item('p1', 'eu-west-1', 10, 12, scanned_resources=4,
+                 api_calls={'ec2.Describe': 1, 'ec2.List': 1}),
+            item('p1', 'global', 10, 11, scanned_resources=0),
+        ],
+    ]
+
+
+def test_average_statistics_columns(job_items):
+    columns = StatisticsColumns()
+    for i, items in enumerate(job_items):
+        columns.append(str(i), items)
+    assert len(columns) == 4
+    assert list(ReportService.average_statistics_columns(columns)) == list(
+        ReportService.average_statistics(*job_items)
+    )
+
+
+def test_jobs_statistics(statistics_bucket, job_items):
+    jobs = [
+        Job(id=str(i), tenant_name='tenant', customer_name='customer',
+            submitted_at='2024-11-16T12:44:54.000000Z')
+        for i in range(3)
+    ]
+    rs = SP.report_service
+    bucket = CAASEnv.STATISTICS_BUCKET_NAME.get()
+
+    def write(job, items):  # as executor does
+        SP.s3.gz_put_json(
+            bucket=bucket,
+            key=StatisticsBucketKeysBuilder.job_statistics(job),
+            obj=items
+        )
+
+    with ThreadPoolExecutor(2) as ex:  # two jobs finish at the same time
+        list(ex.map(write, jobs[:2], job_items))
+
+    columns = rs.jobs_statistics(jobs, compact=True)
+    assert columns.job_id == ['0', '0', '1', '1']
+    assert list(rs.average_statistics_columns(columns)) == list(
+        rs.average_statistics(*job_items)
+    )
+
+    compacted = rs.tenant_job_statistics(
+        'customer', 'tenant', utc_datetime(jobs[0].submitted_at)
+    )
+    assert compacted.job_id == ['0', '0', '1', '1']
+
+    SP.s3.gz_put_json(bucket, StatisticsBucketKeysBuilder.job_statistics(
+        jobs[0]), [])  # now read from columns only
+    assert rs.jobs_statistics(jobs).job_id == ['0', '0', '1', '1']
+
+
+def test_incremental_snapshots(reports_bucket, aws_tenant):
+    rs = SP.report_service
+    builder = TenantReportsBucketKeysBuilder(aws_tenant)
+    updater = FindingsUpdater.build()
+
+    latest = rs.tenant_latest_collection(aws_tenant)
+    latest.put_parts([
+        ShardPart('p1', 'eu-west-1', 1, [{'id': 1}]),
+        ShardPart('p2', 'global', 1, [{'id': 2}]),
+    ])
+    latest.meta = {'p1': {'resource': 'aws.ec2'}}
+    latest.write_all()
+    latest.write_meta()
+
+    first, second = utc_datetime() - timedelta(hours=5), utc_datetime()
+    updater.make_snapshot(reports_bucket, builder.latest_key(), first)
+
+    latest.put_part(ShardPart('p1', 'eu-west-1', 2, [{'id': 3}]))
+    latest.write_all()  # only the shard of eu-west-1 changes
+    updater.make_snapshot(reports_bucket, builder.latest_key(), second)
+
+    manifest = rs.snapshot_manifest(builder.snapshot_key(second))
+    first_key = builder.snapshot_key(first)
+    assert manifest['meta.json.gz'].startswith(first_key)
+    assert manifest['layout.json.gz'].startswith(first_key)
+    assert sum(key.startswith(first_key) for key in manifest.values()) == 3
+    assert len(list(SP.s3.list_objects(
+        reports_bucket, builder.snapshot_key(second)
+    ))) == 2, 'one changed shard and the manifest'
+
+    for date, resources in ((first, [1, 2]), (second, [2, 3])):
+        collection = rs.tenant_snapshot_collection(aws_tenant, date)
+        collection.fetch_all()
+        collection.fetch_meta()
+        assert collection.meta == {'p1': {'resource': 'aws.ec2'}}
+        assert sorted(
+            res['id'] for part in collection.iter_parts()
+            for res in part.resources
+        ) == resources
@@ -1,5 +1,8 @@
+import io
 from datetime import timedelta
 from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import MagicMock
 
 import msgspec
 import pytest
@@ -8,12 +11,26 @@ from helpers.time_helper import utc_datetime
 from models.job import Job
 from services.ambiguous_job_service import AmbiguousJob
 from services.reports import (
+    CheckpointDataSource,
+    CheckpointPart,
     JobMetricsDataSource,
+    MetricsCheckpointService,
     ShardsCollectionDataSource,
+    ShardsCollectionProvider,
+    TenantMetricsCheckpoint,
     add_diff,
 )
 from helpers.reports import adjust_resource_type
-from services.sharding import AWSRegionDistributor, ShardPart, ShardsCollection
+from services.reports_bucket import ReportMetricsBucketKeysBuilder
+from services.sharding import (
+    AWSRegionDistributor,
+    ShardPart,
+    ShardsCollection,
+    SingleShardDistributor,
+    fix_s3_regions,
+)
+
+from ..commons import InMemoryShardsIO
 
 
 @pytest.fixture
@@ -204,6 +221,227 @@ class TestShardsCollectionDataSource:
         }
 
 
+class TestTenantMetricsCheckpoint:
+    def test_source_same_as_collection(
+        self, aws_shards_collection, empty_metadata
+    ):
+        source = ShardsCollectionDataSource(
+            collection=aws_shards_collection,
+            metadata=empty_metadata
+        )
+        checkpoint = TenantMetricsCheckpoint(
+            version='1',
+            until=0,
+            built_at=0,
+            meta=aws_shards_collection.meta,
+            parts=list(source.checkpoint_parts()),
+        )
+        checkpoint = msgspec.json.decode(
+            msgspec.json.encode(checkpoint), type=TenantMetricsCheckpoint
+        )
+        from_checkpoint = CheckpointDataSource(checkpoint, empty_metadata)
+        assert from_checkpoint.n_unique == source.n_unique == 23
+        assert (
+            from_checkpoint.region_severities() == source.region_severities()
+        )
+        assert from_checkpoint.resource_types() == source.resource_types()
+        assert from_checkpoint.resources() == source.resources()
+        assert from_checkpoint.finops() == source.finops()
+
+    def test_update(self):
+        checkpoint = TenantMetricsCheckpoint(
+            version='1',
+            until=0,
+            built_at=0,
+            meta={'rule-1': {'resource': 'aws.s3'}},
+            parts=[
+                CheckpointPart(
+                    'rule-1', 'eu-west-1', 10, [('eu-west-1', 1, {})]
+                ),
+                CheckpointPart(
+                    'rule-1', 'eu-west-2', 10, [('eu-west-2', 2, {})]
+                ),
+            ],
+        )
+        changed = checkpoint.update(
+            [
+                CheckpointPart('rule-1', 'eu-west-1', 20, []),
+                CheckpointPart('rule-1', 'eu-west-2', 5, []),
+                CheckpointPart(
+                    'rule-2', 'eu-west-1', 20, [('eu-west-1', 3, {})]
+                ),
+            ],
+            {'rule-2': {'resource': 'aws.ec2'}},
+        )
+        assert changed == {'eu-west-1'}
+        parts = {(p.policy, p.location): p for p in checkpoint.parts}
+        assert len(parts) == 3
+        assert parts[('rule-1', 'eu-west-1')].resources == []
+        assert parts[('rule-1', 'eu-west-2')].timestamp == 10
+        assert set(checkpoint.meta) == {'rule-1', 'rule-2'}
+
+    def test_update_same_as_rebuild_after_region_fix(self, empty_metadata):
+        """
+        Latest state gets its s3 regions fixed by the executor, so
+        the checkpoint must be fixed the same way when jobs are applied
+        """
+        def bucket(name: str, region: str | None = None) -> dict:
+            return {'Name': name, 'Location': {'LocationConstraint': region}}
+
+        def collection(*parts: ShardPart) -> ShardsCollection:
+            col = ShardsCollection(AWSRegionDistributor(2))
+            col.put_parts(parts)
+            col.meta = {'s3-rule': {'resource': 'aws.s3'},
+                        'ec2-rule': {'resource': 'aws.ec2'}}
+            return col
+
+        def before() -> ShardsCollection:  # s3 is not fixed there yet
+            return collection(
+                ShardPart.with_digests(
+                    's3-rule', 'global',
+                    [bucket('a'), bucket('b', 'eu-west-1')], timestamp=10
+                ),
+                ShardPart.with_digests(
+                    'ec2-rule', 'eu-west-1', [{'InstanceId': 'i-1'}],
+                    timestamp=10
+                ),
+            )
+
+        def job() -> ShardsCollection:
+            return collection(ShardPart.with_digests(
+                's3-rule', 'global',
+                [bucket('b', 'eu-west-1'), bucket('c', 'eu-west-2')],
+                timestamp=20
+            ))
+
+        def checkpoint(col: ShardsCollection) -> TenantMetricsCheckpoint:
+            return TenantMetricsCheckpoint(
+                version='1', until=0, built_at=0, meta=col.meta,
+                parts=list(MetricsCheckpointService.checkpoint_parts(
+                    col, empty_metadata
+                ))
+            )
+
+        latest = before()  # as executor does
+        fix_s3_regions(latest)
+        latest.update(job())
+        fix_s3_regions(latest)
+        rebuilt = checkpoint(latest)
+
+        incremental = checkpoint(before())
+        col = job()
+        incremental.update(
+            MetricsCheckpointService.checkpoint_parts(col, empty_metadata),
+            col.meta
+        )
+
+        def index(ch: TenantMetricsCheckpoint) -> dict:
+            return {
+                (p.policy, p.location): sorted(fp for _, fp, _ in p.resources)
+                for p in ch.parts
+            }
+
+        assert index(incremental) == index(rebuilt)
+        assert ('s3-rule', 'global') not in index(rebuilt)
+        assert ('s3-rule', 'eu-west-2') in index(rebuilt)
+        one = CheckpointDataSource(rebuilt, empty_metadata)
+        other = CheckpointDataSource(incremental, empty_metadata)
+
+        def by_policy(items: list) -> list:
+            return sorted(items, key=lambda i: i['policy'])
+
+        assert by_policy(one.resources()) == by_policy(other.resources())
+        assert one.region_severities() == other.region_severities()
+
+
+class TestMetricsCheckpointService:
+    @staticmethod
+    def service() -> tuple[MetricsCheckpointService, dict]:
+        objects = {}
+
+        def put_object(bucket, key, body, **kwargs):
+            objects[key] = body
+
+        def get_object(bucket, key, **kwargs):
+            if key in objects:
+                return io.BytesIO(objects[key])
+
+        client = MagicMock()
+        client.gz_put_object.side_effect = put_object
+        client.gz_get_object.side_effect = get_object
+        service = MetricsCheckpointService(
+            client, MagicMock(), MagicMock(), MagicMock()
+        )
+        return service, objects
+
+    def test_save_changed_locations(self):
+        service, objects = self.service()
+        tenant = make_tenant('tenant')
+        checkpoint = TenantMetricsCheckpoint(
+            version='1',
+            until=0,
+            built_at=0,
+            meta={'rule-1': {'resource': 'aws.s3'}},
+            parts=[
+                CheckpointPart('rule-1', 'eu-west-1', 10, []),
+                CheckpointPart('rule-1', 'eu-west-2', 10, []),
+            ],
+        )
+        service.save(tenant, checkpoint)
+        assert len(objects) == 3
+
+        changed = checkpoint.update(
+            [CheckpointPart('rule-1', 'eu-west-1', 20, [])], {}
+        )
+        put = service._s3.gz_put_object
+        put.reset_mock()
+        service.save(tenant, checkpoint, changed)
+        assert sorted(c.kwargs['key'].rsplit('/', 1)[-1]
+                      for c in put.call_args_list) == [
+            'checkpoint.json', 'eu-west-1.json'
+        ], 'only the manifest and changed location'
+
+        loaded = service.get(tenant)
+        assert loaded.locations == ['eu-west-1', 'eu-west-2']
+        parts = {p.location: p.timestamp for p in loaded.parts}
+        assert parts == {'eu-west-1': 20, 'eu-west-2': 10}
+
+    def test_get_missing_parts(self):
+        service, objects = self.service()
+        tenant = make_tenant('tenant')
+        checkpoint = TenantMetricsCheckpoint(
+            version='1',
+            until=0,
+            built_at=0,
+            meta={},
+            parts=[CheckpointPart('rule-1', 'eu-west-1', 10, [])],
+        )
+        service.save(tenant, checkpoint)
+        objects.pop(next(k for k in objects if k.endswith('eu-west-1.json')))
+        assert service.get(tenant) is None, 'must be rebuilt'
+
+    def test_get_inline_parts(self):
+        service, objects = self.service()
+        tenant = make_tenant('tenant')
+        checkpoint = TenantMetricsCheckpoint(
+            version='1',
+            until=0,
+            built_at=0,
+            meta={},
+            parts=[CheckpointPart('rule-1', 'eu-west-1', 10, [])],
+        )
+        key = ReportMetricsBucketKeysBuilder.checkpoint_key(
+            tenant.customer_name, tenant.name
+        )
+        objects[key] = msgspec.json.encode(checkpoint)  # older format
+
+        loaded = service.get(tenant)
+        assert len(loaded.parts) == 1
+        service.save(tenant, loaded, set())
+        assert len(objects) == 2, 'inline parts must be moved to a file'
+        assert len(service.get(tenant).parts) == 1
+
+
 def test_add_diff():
     current = {
         'key': 'value',
@@ -244,3 +482,43 @@ def test_add_diff():
         },
     }
 
+
+def make_tenant(name: str) -> SimpleNamespace:
+    return SimpleNamespace(
+        name=name, customer_name='customer', cloud='AWS', project='123'
+    )
+
+
+class TestShardsCollectionProvider:
+    class ReportService:
+        def __init__(self):
+            self.calls = []
+
+        def tenant_collection(self, tenant, key):
+            self.calls.append(tenant.name)
+            if tenant.name == 'broken':
+                raise RuntimeError('cannot fetch')
+            return ShardsCollection(
+                SingleShardDistributor(), InMemoryShardsIO()
+            )
+
+    def test_prefetch(self):
+        rs = self.ReportService()
+        provider = ShardsCollectionProvider(rs)
+        tenants = [make_tenant(n) for n in ('t1', 'broken', 't2')]
+        now = utc_datetime()
+        provider.prefetch(tenants, now, concurrency=3)
+        assert sorted(rs.calls) == ['broken', 't1', 't2']
+
+        assert provider.get_for_tenant(tenants[0], now) is not None
+        assert provider.get_for_tenant(tenants[1], now) is None
+        provider.prefetch(tenants, now, concurrency=3)
+        assert len(rs.calls) == 3, 'everything must be cached'
+
+    def test_source_is_cached(self):
+        provider = ShardsCollectionProvider(self.ReportService())
+        tenant = make_tenant('t1')
+        now = utc_datetime()
+        source = provider.get_source_for_tenant(tenant, now)
+        assert isinstance(source, ShardsCollectionDataSource)
+        assert provider.get_source_for_tenant(tenant, now) is source
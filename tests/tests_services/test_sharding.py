@@ -1,13 +1,26 @@
+import gzip
 import io
 import operator
+import zlib
 from unittest.mock import create_autospec, MagicMock
 
+import msgspec
 import pytest
+from botocore.exceptions import ClientError
 
 from services.clients.s3 import S3Client
 from services.sharding import (SingleShardDistributor, ShardPart,
                                AWSRegionDistributor, Shard, ShardsIterator,
-                               ShardsS3IO, ShardsCollection)
+                               ShardsS3IO, ShardsS3IOV2, ShardsCollection,
+                               ShardPartsSpill, SpilledShardPart,
+                               ConcurrentShardsS3IO, ShardsIOError,
+                               ShardsCollectionFactory,
+                               ShardDataDistributor, LocationHashDistributor,
+                               PolicyHashDistributor, ShardsS3IOV3)
+from helpers import fingerprint
+from helpers.constants import Cloud
+
+from ..commons import InMemoryShardsIO
 
 
 @pytest.fixture
@@ -166,6 +179,23 @@ class TestShardsS3IO:
                                  timestamp=1711309249.0, resources=[])]
         client.gz_get_object.assert_called()
 
+    def test_shard_to_filelike(self, make_shard):
+        shard = make_shard()
+        with ShardsS3IO.shard_to_filelike(shard) as buf:
+            assert msgspec.json.decode(
+                buf.read(), type=list[ShardPart]
+            ) == list(shard)
+        with ShardsS3IO.shard_to_filelike(Shard()) as buf:
+            assert buf.read() == b'[]'
+
+    def test_read_raw_v2(self, make_shard):
+        shard = make_shard()
+        client = create_autospec(S3Client)
+        writer = ShardsS3IOV2(bucket='reports', key='one', client=client)
+        with writer.shard_to_filelike(shard) as buf:
+            client.gz_get_object.return_value = io.BytesIO(buf.read())
+        assert writer.read_raw(0) == list(shard)
+
     def test_read_meta(self):
         writer, client = self.create_writer()
         client.gz_get_json.return_value = {'policy': {'description': 'data'}}
@@ -176,6 +206,48 @@ class TestShardsS3IO:
         )
 
 
+class TestConcurrentShardsS3IO:
+    def test_read_raw_many(self):
+        client = create_autospec(S3Client)
+
+        def get_object(bucket, key, gz_buffer, buffer=None):
+            if key == 'one/3.json':
+                return
+            return io.BytesIO(msgspec.json.encode(
+                [ShardPart(policy=key, location='global', timestamp=1.0)]
+            ))
+
+        client.gz_get_object.side_effect = get_object
+        reader = ConcurrentShardsS3IO('reports', 'one', client, 3)
+        res = sorted(p.policy for parts in reader.read_raw_many(range(5))
+                     for p in parts)
+        assert res == ['one/0.json', 'one/1.json', 'one/2.json',
+                       'one/4.json']
+
+    def test_write_many_errors(self, make_shard):
+        client = create_autospec(S3Client)
+
+        def put_object(bucket, key, body, gz_buffer):
+            if key in ('one/1.json', 'one/3.json'):
+                raise ValueError(key)
+
+        client.gz_put_object.side_effect = put_object
+        writer = ConcurrentShardsS3IO('reports', 'one', client, 2)
+        with pytest.raises(ShardsIOError) as e:
+            writer.write_many((i, make_shard()) for i in range(5))
+        assert set(e.value.errors) == {1, 3}
+        assert client.gz_put_object.call_count == 5
+
+    def test_factory(self):
+        client = create_autospec(S3Client)
+        # reads all versions regardless of the version it writes
+        io_ = ShardsCollectionFactory.s3_io('reports', 'one', client)
+        assert type(io_) is ShardsS3IOV3
+        io_ = ShardsCollectionFactory.s3_io('reports', 'one', client, 4,
+                                            indexed=True)
+        assert type(io_) is ShardsS3IOV3
+
+
 class TestShardCollection:
     @staticmethod
     def create_collection() -> ShardsCollection:
@@ -257,3 +329,392 @@ class TestShardCollection:
         assert (len(p1.resources) == 2 and {'k2': 'v2'} in p1.resources
                 and {'k3': 'v3'} in p1.resources)
         assert p2.resources == [{'k3': 'v3'}]
+
+
+class TestShardPartsSpill:
+    def test_put_read(self, make_shard_part):
+        spill = ShardPartsSpill()
+        part1 = make_shard_part('global', 'policy1', [{'k1': 'v1'}])
+        part2 = make_shard_part('eu-west-1', 'policy2', [{'k2': 'v2'}] * 3)
+        s1, s2 = spill.put(part1), spill.put(part2)
+        assert isinstance(s1, SpilledShardPart)
+        assert (s1.policy, s1.location, s1.timestamp) == (
+            part1.policy, part1.location, part1.timestamp
+        )
+        assert s1.resources == [{'k1': 'v1'}]
+        assert s2.load() == part2
+        assert s2.serialize() == part2.serialize()
+        encoder = msgspec.json.Encoder()
+        assert s2.encode(encoder) == part2.encode(encoder)
+        spill.close()
+
+    def test_spilled_collection(self, make_shard_part):
+        spilled = ShardsCollection(AWSRegionDistributor(2),
+                                   spill=ShardPartsSpill())
+        plain = ShardsCollection(AWSRegionDistributor(2))
+        parts = (
+            make_shard_part('global', 'policy1', [{'k1': 'v1'}]),
+            make_shard_part('eu-central-1', 'policy1', [{'k2': 'v2'}]),
+            make_shard_part('eu-west-1', 'policy2', [{'k3': 'v3'}]),
+        )
+        spilled.put_parts(parts)
+        plain.put_parts(parts)
+        assert all(isinstance(p, SpilledShardPart)
+                   for p in spilled.iter_parts())
+        assert [p.serialize() for p in spilled.iter_parts()] == \
+               [p.serialize() for p in plain.iter_parts()]
+        for (_, s1), (_, s2) in zip(spilled, plain):
+            with ShardsS3IO.shard_to_filelike(s1) as b1, \
+                    ShardsS3IO.shard_to_filelike(s2) as b2:
+                assert b1.read() == b2.read()
+
+
+class TestShardsCollectionDifference:
+    @staticmethod
+    def make_collection(n_policies: int, n_resources: int, start: int
+                        ) -> ShardsCollection:
+        collection = ShardsCollection(AWSRegionDistributor(2))
+        for i in range(n_policies):
+            for region in ('global', 'eu-west-1', 'eu-central-1', 'us-east-1'):
+                collection.put_part(ShardPart(
+                    policy=f'policy-{i}',
+                    location=region,
+                    resources=[
+                        {'id': str(j), 'tags': [{'k': j}], 'meta': {'n': j}}
+                        for j in range(start, start + n_resources)
+                    ]
+                ))
+        return collection
+
+    def test_subtract_100k(self):
+        """
+        Synthetic benchmark-like case: 100k resources in each collection,
+        a half of them are new. Checks only correctness. Timing is
+        measured on the same data with
+        min(timeit.repeat(lambda: new - old, number=1, repeat=5)):
+        ~1.9s when parts are matched by a scan and resources are compared
+        via hashable(), ~0.29s with the index and fingerprints (CPython
+        3.11, one core)
+        """
+        old = self.make_collection(250, 100, 0)
+        new = self.make_collection(250, 100, 50)
+        new.put_part(ShardPart(policy='policy-new', location='eu-west-1',
+                               resources=[{'id': '1'}]))
+        diff = new - old
+        parts = {(p.policy, p.location): p for p in diff.iter_parts()}
+        assert len(parts) == 1001
+        assert sum(len(p.resources) for p in parts.values()) == 50001
+        part = parts[('policy-0', 'eu-west-1')]
+        assert [r['id'] for r in part.resources] == [
+            str(i) for i in range(100, 150)
+        ]
+        assert parts[('policy-new', 'eu-west-1')].resources == [{'id': '1'}]
+
+
+class TestShardPartDigests:
+    def test_with_digests(self):
+        resources = [{'id': '1', 'tags': [1, 2]}, {'tags': [1, 2], 'id': '1'},
+                     {'id': '2'}]
+        part = ShardPart.with_digests('policy', 'global', resources)
+        assert len(part.digests) == 3
+        assert part.digests[0] == part.digests[1] != part.digests[2]
+        assert part.resource_digests() == part.digests
+        assert list(part.iter_with_digests()) == list(zip(resources,
+                                                          part.digests))
+
+    def test_stale_digests(self):
+        """
+        Resources changed after digests had been calculated
+        """
+        part = ShardPart.with_digests('policy', 'global', [{'id': '1'}])
+        part.resources.append({'id': '2'})
+        expected = [fingerprint({'id': '1'}), fingerprint({'id': '2'})]
+        assert part.resource_digests() == expected
+        assert [d for _, d in part.iter_with_digests()] == expected
+
+    def test_old_format(self):
+        """
+        Parts written before digests existed do not have "h"
+        """
+        part = msgspec.json.decode(
+            b'{"p":"policy","l":"global","t":1711309249.0,"r":[{"id":"1"}]}',
+            type=ShardPart
+        )
+        assert part.digests == []
+        expected = ShardPart.with_digests('policy', 'global', [{'id': '1'}])
+        assert part.resource_digests() == expected.digests
+
+    def test_spilled_digests(self):
+        spill = ShardPartsSpill()
+        part = ShardPart.with_digests('policy', 'global', [{'id': '1'}])
+        spilled = spill.put(part)
+        assert spilled.digests == part.digests
+        assert spilled.resource_digests() == part.digests
+
+        old = spill.put(ShardPart('policy', 'global', resources=[{'id': '1'}]))
+        assert old.digests == []
+        assert old.resource_digests() == part.digests
+
+
+class TestShardsLayout:
+    @staticmethod
+    def parts(n: int) -> list[ShardPart]:
+        return [
+            ShardPart(policy=f'policy-{i}', location=f'region-{i % 3}',
+                      resources=[{'id': str(i)}])
+            for i in range(n)
+        ]
+
+    def test_from_layout(self):
+        for d in (SingleShardDistributor(), AWSRegionDistributor(4),
+                  LocationHashDistributor(8), PolicyHashDistributor(16)):
+            new = ShardDataDistributor.from_layout(d.layout())
+            assert type(new) is type(d)
+            assert new.shards_number == d.shards_number
+        with pytest.raises(ValueError):
+            ShardDataDistributor.from_layout({'distributor': 'x', 'shards': 1})
+
+    def test_scaled_distributor(self):
+        f = ShardsCollectionFactory.scaled_distributor
+        assert isinstance(f(Cloud.AZURE, 10, 100), SingleShardDistributor)
+        assert isinstance(f(Cloud.AZURE, 1000, 0), SingleShardDistributor)
+        d = f(Cloud.AZURE, 1000, 100)
+        assert isinstance(d, LocationHashDistributor)
+        assert d.shards_number == 16
+        d = f(Cloud.KUBERNETES, 10 ** 9, 100)
+        assert isinstance(d, PolicyHashDistributor)
+        assert d.shards_number == ShardsCollectionFactory.max_shards
+        assert f(Cloud.AWS, 150, 100).layout() == AWSRegionDistributor(2).layout()
+        assert f(Cloud.AWS, 350, 100).shards_number == 4
+
+    def test_old_layout(self):
+        """
+        Collection without layout is read with the default one
+        """
+        io_ = InMemoryShardsIO()
+        old = ShardsCollection(SingleShardDistributor(), io_)
+        old.put_parts(self.parts(10))
+        old.meta = {'policy-1': {'resource': 'aws.ec2'}}
+        old.write_all()
+        io_.meta = dict(old.meta)  # how it was written before
+
+        new = ShardsCollection(SingleShardDistributor(), io_)
+        new.fetch_all()
+        new.fetch_meta()
+        assert len(list(new.iter_parts())) == 10
+        assert new.meta == {'policy-1': {'resource': 'aws.ec2'}}
+
+    def test_layout_resolved_on_read(self):
+        io_ = InMemoryShardsIO()
+        col = ShardsCollection(PolicyHashDistributor(4), io_)
+        col.put_parts(self.parts(20))
+        col.meta = {'policy-1': {'resource': 'k8s.pod'}}
+        col.write_all()
+        col.write_meta()
+        assert io_.meta == {'policy-1': {'resource': 'k8s.pod'}}
+        assert io_.layout['distributor'] == 'policy-hash'
+        assert io_.layout['shards'] == 4
+        assert sum(io_.layout['sizes']) == 20
+
+        new = ShardsCollectionFactory.from_cloud(Cloud.KUBERNETES)
+        new.io = io_
+        new.fetch_all()
+        assert new.distributor.layout() == col.distributor.layout()
+        assert sorted(p.policy for p in new.iter_parts()) == sorted(
+            p.policy for p in col.iter_parts())
+        new.fetch_meta()
+        assert new.meta == {'policy-1': {'resource': 'k8s.pod'}}
+        # by region all shards are fetched, but only once
+        reads = len(io_.reads)
+        new.fetch(region='region-1')
+        assert len(io_.reads) == reads
+
+    def test_reshard(self):
+        io_ = InMemoryShardsIO()
+        col = ShardsCollection(PolicyHashDistributor(4), io_)
+        col.put_parts(self.parts(20))
+        col.write_all()
+        col.write_meta()
+
+        latest = ShardsCollectionFactory.from_cloud(Cloud.GOOGLE)
+        latest.io = io_
+        latest.reshard(PolicyHashDistributor(8))
+        latest.write_all()
+        latest.write_meta()
+        # old files are kept for jobs that still use the old layout
+        assert set(io_.shards) == set(range(12))
+        assert io_.layout['offset'] == 4
+
+        new = ShardsCollectionFactory.from_cloud(Cloud.GOOGLE)
+        new.io = io_
+        new.fetch_all()
+        assert new.distributor.shards_number == 8
+        assert len(list(new.iter_parts())) == 20
+
+        # a job that has read the old layout before does not break it
+        old = ShardsCollection(PolicyHashDistributor(4), io_)
+        old.put_parts(self.parts(20))
+        old.write_all()
+        new = ShardsCollectionFactory.from_cloud(Cloud.GOOGLE)
+        new.io = io_
+        new.fetch_all()
+        assert len(list(new.iter_parts())) == 20
+
+    def test_resources_number_from_meta(self):
+        io_ = InMemoryShardsIO()
+        col = ShardsCollection(PolicyHashDistributor(4), io_)
+        col.put_parts(self.parts(20))
+        col.write_all()
+        col.write_meta()
+
+        latest = ShardsCollectionFactory.from_cloud(Cloud.GOOGLE)
+        latest.io = io_
+        latest.fetch_meta()
+        assert latest.resources_number() == 20
+        assert not list(latest.iter_parts())  # nothing is fetched
+
+        latest.fetch_by_indexes([0, 1])
+        latest.put_part(ShardPart(policy='policy-x', location='region-1',
+                                  resources=[{'id': 'x'}]))
+        assert latest.resources_number() == 21
+
+
+class TestShardsS3IOV3:
+    @staticmethod
+    def create_client() -> tuple[MagicMock, dict, list]:
+        """
+        Client that keeps objects in memory
+        """
+        objects, ranges = {}, []
+        client = create_autospec(S3Client)
+
+        def put_object(bucket, key, body, metadata=None):
+            objects[key] = (body.read(), metadata or {})
+
+        def get_object_range(bucket, key, start=None, end=None, suffix=None,
+                             etag=None):
+            if key not in objects:
+                return
+            data, metadata = objects[key]
+            current = str(zlib.crc32(data))
+            if etag and etag != current:
+                raise ClientError(
+                    {'Error': {'Code': 'PreconditionFailed'}}, 'GetObject'
+                )
+            if suffix is not None:
+                start, end = max(len(data) - suffix, 0), len(data) - 1
+            ranges.append((start, end))
+            return data[start:end + 1], metadata, len(data), current
+
+        def gz_get_object(bucket, key, gz_buffer=None, buffer=None):
+            if key + '.gz' not in objects:
+                return
+            return io.BytesIO(gzip.decompress(objects[key + '.gz'][0]))
+
+        client.put_object.side_effect = put_object
+        client.get_object_range.side_effect = get_object_range
+        client.gz_get_object.side_effect = gz_get_object
+        client.gz_get_json.return_value = None  # no meta and layout
+        return client, objects, ranges
+
+    @pytest.fixture
+    def shard(self) -> Shard:
+        shard = Shard()
+        for i in range(50):
+            shard.put(ShardPart(
+                policy=f'policy-{i}', location=f'region-{i % 5}',
+                resources=[{'id': f'{i}-{j}', 'data': 'x' * j}
+                           for j in range(20)]
+            ))
+        return shard
+
+    def test_read_raw(self, shard):
+        client, objects, _ = self.create_client()
+        writer = ShardsS3IOV3('reports', 'one', client, 1)
+        writer.write(0, shard)
+        assert 'one/0.json.gz' in objects
+        assert writer.read_raw(0) == list(shard)
+        assert writer.read_raw(1) is None
+
+    def test_read_parts(self, shard):
+        class SmallTail(ShardsS3IOV3):
+            tail_size = 256
+            max_gap = 0
+
+        client, objects, ranges = self.create_client()
+        writer = SmallTail('reports', 'one', client, 1)
+        writer.write(0, shard)
+
+        parts = writer.read_parts(
+            0, lambda p, l: p in ('policy-1', 'policy-2', 'policy-40')
+        )
+        assert [p.policy for p in parts] == ['policy-1', 'policy-2',
+                                             'policy-40']
+        assert parts == [p for p in shard
+                         if p.policy in ('policy-1', 'policy-2', 'policy-40')]
+        # tail, index, two groups of parts
+        assert len(ranges) == 4
+        size = len(objects['one/0.json.gz'][0])
+        assert sum(e - s + 1 for s, e in ranges) < size / 2
+
+    def test_read_parts_overwritten(self, shard):
+        class SmallTail(ShardsS3IOV3):
+            tail_size = 256
+
+        client, objects, _ = self.create_client()
+        writer = SmallTail('reports', 'one', client, 1)
+        writer.write(0, shard)
+        read_range = client.get_object_range.side_effect
+
+        def overwrite(*args, **kwargs):
+            res = read_range(*args, **kwargs)
+            if 'suffix' in kwargs:  # after the tail is read
+                new = Shard()
+                new.put(ShardPart(policy='policy-1', location='region-1',
+                                  resources=[{'id': 'new'}]))
+                writer.write(0, new)
+            return res
+
+        client.get_object_range.side_effect = overwrite
+        parts = writer.read_parts(0, lambda p, l: p == 'policy-1')
+        assert [p.resources for p in parts] == [[{'id': 'new'}]]
+
+    def test_not_indexed_by_default(self, shard):
+        client, objects, _ = self.create_client()
+        writer = ShardsCollectionFactory.s3_io('reports', 'one', client)
+        writer.write(0, shard)
+        client.put_object.assert_not_called()
+        client.gz_put_object.assert_called_once()
+
+    def test_read_parts_small_shard(self, shard):
+        client, _, ranges = self.create_client()
+        writer = ShardsS3IOV3('reports', 'one', client, 1)
+        writer.write(0, shard)
+        parts = writer.read_parts(0, lambda p, l: l == 'region-1')
+        assert len(parts) == 10
+        assert len(ranges) == 1  # everything is within the tail
+
+    def test_read_parts_old_versions(self, make_shard):
+        shard = make_shard()
+        for old in (ShardsS3IO, ShardsS3IOV2):
+            client, objects, _ = self.create_client()
+            with old.shard_to_filelike(shard) as buf:
+                objects['one/0.json.gz'] = (gzip.compress(buf.read()), {})
+            reader = ShardsS3IOV3('reports', 'one', client, 1)
+            assert reader.read_raw(0) == list(shard)
+            assert reader.read_parts(0, lambda p, l: True) == list(shard)
+
+    def test_fetch_parts(self, shard):
+        client, _, _ = self.create_client()
+        col = ShardsCollection(PolicyHashDistributor(4))
+        col.io = ShardsS3IOV3('reports', 'one', client, 2)
+        col.put_parts(shard)
+        col.write_all()
+
+        new = ShardsCollection(PolicyHashDistributor(4))
+        new.io = ShardsS3IOV3('reports', 'one', client, 2)
+        new.fetch_parts(policies={'policy-1', 'policy-7'},
+                        locations={'region-1'})
+        assert [p.policy for p in new.iter_parts()] == ['policy-1']
+        new.fetch_parts(policies=set())
+        assert len(list(new.iter_parts())) == 1
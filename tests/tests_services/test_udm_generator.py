@@ -0,0 +1,62 @@
+from types import SimpleNamespace
+
+import msgspec
+
+from services.sharding import ShardPart, ShardsCollection, \
+    SingleShardDistributor
+from services.udm_generator import (
+    ShardCollectionUDMEntitiesConvertor,
+    ShardCollectionUDMEventsConvertor,
+)
+
+
+def make_collection() -> ShardsCollection:
+    col = ShardsCollection(SingleShardDistributor())
+    col.meta = {
+        'p1': {'resource': 'aws.s3', 'description': 'Bucket is public'},
+        'p2': {'resource': 'aws.s3', 'description': 'Bucket is unencrypted'},
+    }
+    col.put_parts([
+        ShardPart('p1', 'global', 1, [
+            {'name': 'one', 'arn': 'arn:one', 'date': '2024-01-01T00:00:00Z'},
+            {'name': 'two', 'arn': 'arn:two'},
+        ]),
+        ShardPart('p2', 'global', 2, [
+            {'name': 'one', 'arn': 'arn:one',
+             'Tags': [{'Key': 'k', 'Value': 'v'}]},
+        ]),
+    ])
+    return col
+
+
+TENANT = SimpleNamespace(name='tenant', customer_name='customer', cloud='AWS')
+
+
+def test_entities(empty_metadata):
+    convertor = ShardCollectionUDMEntitiesConvertor(empty_metadata, TENANT)
+    entities = {
+        e['metadata']['product_entity_id']: e
+        for e in map(msgspec.json.decode, convertor.convert(make_collection()))
+    }
+    assert set(entities) == {'arn:one', 'arn:two'}
+    one = entities['arn:one']
+    assert {r['rule_id'] for r in one['entity']['security_result']} == \
+        {'p1', 'p2'}
+    assert one['entity']['resource']['attribute']['labels'] == \
+        [{'key': 'k', 'value': 'v'}]
+    assert one['entity']['resource']['attribute']['creation_time'] == \
+        '2024-01-01T00:00:00Z'
+    assert one['metadata']['collected_timestamp'] == '1970-01-01T00:00:02Z'
+
+
+def test_events(empty_metadata):
+    convertor = ShardCollectionUDMEventsConvertor(empty_metadata, TENANT)
+    events = list(map(msgspec.json.decode,
+                      convertor.convert(make_collection())))
+    assert len(events) == 2
+    vulns = {
+        e['target']['resource']['name']:
+            e['extensions']['vulns']['vulnerabilities']
+        for e in events
+    }
+    assert len(vulns['one']) == 2 and len(vulns['two']) == 1
@@ -1,6 +1,8 @@
+import io
 from unittest.mock import create_autospec, call
 
 import pytest
+from xlsxwriter import Workbook
 from xlsxwriter.worksheet import Worksheet
 
 from services.xlsx_writer import CellContent, Table, XlsxRowsWriter, Cell
@@ -42,16 +44,16 @@ def test_write_table(table):
     wsh.write.assert_has_calls([
         call(1, 1, '0'),
         call(1, 2, '1'),
-        call(2, 2, '2'),
         call(1, 3, '3'),
+        call(2, 2, '2'),
         call(3, 1, '1'),
         call(3, 2, '2'),
-        call(4, 2, '3'),
         call(3, 3, '4'),
+        call(4, 2, '3'),
         call(5, 1, '2'),
         call(5, 2, '3'),
-        call(6, 2, '4'),
-        call(5, 3, '5')
+        call(5, 3, '5'),
+        call(6, 2, '4')
     ])
     wsh.merge_range.assert_has_calls([
         call(1, 1, 2, 1, ''),
@@ -61,3 +63,16 @@ def test_write_table(table):
         call(5, 1, 6, 1, ''),
         call(5, 3, 6, 3, '')
     ])
+
+
+def test_write_rows_constant_memory(table):
+    buffer = io.BytesIO()
+    with Workbook(buffer, {'constant_memory': True}) as wb:
+        wsh = wb.add_worksheet()
+        XlsxRowsWriter().write_rows(wsh, iter(table.buffer), empty={3})
+        assert wsh.merge == [
+            [0, 0, 1, 0], [0, 2, 1, 2],
+            [2, 0, 3, 0], [2, 2, 3, 2],
+            [4, 0, 5, 0], [4, 2, 5, 2],
+        ]
+        assert (wsh.dim_rowmax, wsh.dim_colmax) == (5, 2)
@@ -0,0 +1,72 @@
+import json
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from services.clients.chronicle import ChronicleV2Client
+
+
+class Session:
+    def __init__(self, statuses: list[int]):
+        self.statuses = statuses
+        self.payloads = []
+
+    def request(self, method, url, data, headers):
+        status = self.statuses.pop(0) if self.statuses else 200
+        if status == 200:
+            self.payloads.append(data)
+        return SimpleNamespace(status_code=status, ok=status == 200,
+                               headers={}, json=lambda: {})
+
+
+@pytest.fixture
+def client():
+    with patch.object(ChronicleV2Client, '_init_session'):
+        client = ChronicleV2Client('http://127.0.0.1', None, 'customer', 2)
+    with patch.object(ChronicleV2Client, '_payload_size_limit', 1000), \
+            patch.object(ChronicleV2Client, '_backoff', 0):
+        yield client
+
+
+def test_payloads_fit_limit(client):
+    entities = ({'id': i, 'data': 'x' * (i % 7) * 30} for i in range(100))
+    prefix = client._prefix('entities', customer_id='customer', log_type='t')
+    payloads = list(client._payloads(entities, prefix))
+    assert len(payloads) > 1
+    ids = []
+    for payload in payloads:
+        assert len(payload) <= 1000
+        data = json.loads(payload)
+        assert data['customer_id'] == 'customer'
+        assert data['log_type'] == 't'
+        ids.extend(e['id'] for e in data['entities'])
+    assert ids == list(range(100))
+
+
+def test_too_large_item_skipped(client):
+    prefix = client._prefix('events', customer_id='customer')
+    payloads = list(client._payloads([{'d': 'x' * 1000}, {'d': 1}], prefix))
+    assert [json.loads(p)['events'] for p in payloads] == [[{'d': 1}]]
+
+
+def test_upload_retries(client):
+    client._session = Session([429, 503])
+    events = ({'id': i, 'data': 'x' * 100} for i in range(30))
+    assert client.create_udm_events(events)
+    ids = sorted(
+        e['id'] for p in client._session.payloads
+        for e in json.loads(p)['events']
+    )
+    assert ids == list(range(30))
+
+    client._session = Session([400])
+    assert not client.create_udm_events([{'id': 1}])
+
+
+def test_upload_with_skipped_items_fails(client):
+    client._session = Session([])
+    assert not client.create_udm_events([{'d': 'x' * 1000}, {'id': 1}])
+    assert [json.loads(p)['events'] for p in client._session.payloads] == [
+        [{'id': 1}]
+    ]
@@ -0,0 +1,156 @@
+import json
+from base64 import b64decode
+import threading
+import time
+from datetime import datetime
+from http import HTTPStatus
+from pathlib import Path
+from types import SimpleNamespace
+
+import msgspec
+import pytest
+
+from services.clients.dojo_client import DojoV2Client
+from services.report_convertors import (
+    ShardsCollectionCloudCustodianDojoConvertor,
+    ShardsCollectionGenericDojoConvertor,
+)
+from services.sharding import AWSRegionDistributor, ShardPart, \
+    ShardsCollection
+
+
+class Session:
+    def __init__(self, failed: tuple[str, ...] = ()):
+        self.failed = failed
+        self.tests = {}
+        self.events = []
+        self._lock = threading.Lock()
+
+    def request(self, method, url, params, data, files, timeout):
+        title = data['test_title']
+        with self._lock:
+            self.events.append(('start', title))
+        time.sleep(0.01)
+        with self._lock:
+            self.tests[title] = json.loads(files['file'][1])
+            self.events.append(('end', title))
+        status = HTTPStatus.INTERNAL_SERVER_ERROR if title in self.failed \
+            else HTTPStatus.CREATED
+        return SimpleNamespace(status_code=status)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def collection(aws_shards_path: Path) -> ShardsCollection:
+    col = ShardsCollection(AWSRegionDistributor(2))
+    with open(aws_shards_path / 'meta.json', 'rb') as fp:
+        col.meta = msgspec.json.decode(fp.read())
+    with open(aws_shards_path / '0.json', 'rb') as fp:
+        col.put_parts(msgspec.json.decode(fp.read(), type=list[ShardPart]))
+    return col
+
+
+def test_split_is_stable(collection, empty_metadata):
+    convertor = ShardsCollectionGenericDojoConvertor(
+        empty_metadata, attachment='json'
+    )
+
+    def resources(finding: dict) -> list[dict]:
+        return json.loads(b64decode(finding['files'][0]['data']))
+
+    def index(findings: list[dict]) -> dict:
+        return {
+            (f['vuln_id_from_tool'], tuple(f['tags'])): sorted(
+                res['id'] for res in resources(f)
+            )
+            for f in findings
+        }
+
+    expected = convertor.convert(collection)['findings']
+    reports = list(convertor.split(collection, 4))
+    assert len(reports) == 4
+    assert sum(r != b'{"findings":[]}' for r in reports) > 1
+    merged = {}
+    for i, report in enumerate(reports):
+        items = json.loads(report)['findings']
+        for f in items:
+            assert all(
+                convertor.test_index(f['vuln_id_from_tool'], res, 4) == i
+                for res in resources(f)
+            )
+        for key, ids in index(items).items():
+            merged.setdefault(key, []).extend(ids)
+    assert {k: sorted(v) for k, v in merged.items()} == index(expected)
+
+    # a resource keeps its test when other findings are gone
+    part = next(p for p in collection.iter_parts() if p.resources)
+    res = part.resources[0]
+    i = convertor.test_index(part.policy, res, 4)
+    for p in collection.iter_parts():
+        if p is not part:
+            p.resources.clear()
+    part.resources[:] = [{**res, 'Description': 'changed'}]
+    reports = list(convertor.split(collection, 4))
+    assert len(reports) == 4
+    assert json.loads(reports[i])['findings']
+    for j, report in enumerate(reports):
+        if j != i:
+            assert report == b'{"findings":[]}'
+
+
+def test_split_one_policy(empty_metadata):
+    col = ShardsCollection(AWSRegionDistributor(2))
+    col.put_part(ShardPart(
+        policy='policy', location='eu-west-1',
+        resources=[{'id': f'i-{i}'} for i in range(100)]
+    ))
+    col.meta = {'policy': {'resource': 'aws.ec2'}}
+    convertor = ShardsCollectionCloudCustodianDojoConvertor(
+        empty_metadata, resource_per_finding=True
+    )
+    sizes = [len(json.loads(r)) for r in convertor.split(col, 4)]
+    assert sum(sizes) == 100
+    assert all(size < 50 for size in sizes), 'must be spread between tests'
+
+
+def test_split_empty_collection(empty_metadata):
+    convertor = ShardsCollectionGenericDojoConvertor(empty_metadata)
+    reports = list(convertor.split(
+        ShardsCollection(AWSRegionDistributor(2)), 2
+    ))
+    assert reports == [b'{"findings":[]}', b'{"findings":[]}']
+
+
+def test_import_scan_chunks():
+    client = DojoV2Client('http://127.0.0.1', 'key')
+    client._session = Session(failed=('Test (3)',))
+    chunks = (
+        msgspec.json.encode({'findings': [{'title': str(i)}]})
+        for i in range(5)
+    )
+    responses = client.import_scan_chunks(
+        scan_type='Generic Findings Import',
+        scan_date=datetime.now(),
+        product_type_name='Type',
+        product_name='Product',
+        engagement_name='Engagement',
+        test_title='Test',
+        chunks=chunks,
+        concurrency=2
+    )
+    assert [r.status_code for r in responses] == [
+        HTTPStatus.CREATED, HTTPStatus.CREATED,
+        HTTPStatus.INTERNAL_SERVER_ERROR, HTTPStatus.CREATED,
+        HTTPStatus.CREATED
+    ]
+    assert client._session.tests == {
+        'Test': {'findings': [{'title': '0'}]},
+        'Test (2)': {'findings': [{'title': '1'}]},
+        'Test (3)': {'findings': [{'title': '2'}]},
+        'Test (4)': {'findings': [{'title': '3'}]},
+        'Test (5)': {'findings': [{'title': '4'}]},
+    }
+    # the first one creates the context alone
+    assert client._session.events[:2] == [('start', 'Test'), ('end', 'Test')]